@@ -0,0 +1,717 @@
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+import itertools
+import threading
+import time
+
+from botocore.exceptions import ClientError
+import botocore.session
+from botocore import xform_name
+from botocore.validate import ParamValidator
+
+# Seconds each call takes, modelled on typical EC2 control-plane latency
+DEFAULT_LATENCY = {
+    'describe': 0.12,
+    'mutate': 0.25,
+    'run_instances': 1.2,
+    'create_fleet': 2.0,
+}
+
+# Zone letters the stand-in's region offers (us-east-1 has six, with no e in many accounts)
+ZONE_LETTERS = 'abcdf'
+
+# Seconds before a resource leaves its transitional state
+DEFAULT_DELAYS = {
+    'vpc': 1.0,
+    'nat_gateway': 90.0,
+    'instance': 25.0,
+    'instance_terminate': 40.0,
+    'instance_stop': 30.0,
+    # After running: until both status checks pass, and until a bake instance's script powers it off
+    'status_checks': 90.0,
+    'bake': 240.0,
+    'image': 300.0,
+    'nat_gateway_delete': 45.0,
+}
+
+# What cloud-init prints on the serial console once every boot script has run
+CONSOLE_OUTPUT = 'Cloud-init v. 23.4 finished at Thu, 01 Jan 2026 00:00:00 +0000. Up 42.00 seconds\n'
+
+
+class FakeEC2:
+    """Stateful in-process stand-in for the EC2 client used by the managers
+
+    Every call is validated against the real botocore model, then sleeps for
+    its configured latency (outside the lock, so concurrent calls overlap as
+    they would against AWS). Resources move from pending to available or
+    running after their configured delays. Call counts per operation and the
+    peak number of calls in flight are recorded for reporting. Only the
+    operations and filters this project uses are implemented; any other
+    filter fails the way EC2 rejects an unknown one.
+    """
+
+    def __init__(self, region: str = 'us-east-1', latency: Optional[Dict[str, float]] = None,
+                 delays: Optional[Dict[str, float]] = None, scale: float = 1.0,
+                 capacity: Optional[Dict[str, int]] = None):
+        self.region = region
+        # Instances left per 'zone' or 'zone:instance-type' (the more specific wins); unlisted is unlimited
+        self.capacity = dict(capacity or {})
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.delays = {**DEFAULT_DELAYS, **(delays or {})}
+        self.scale = scale
+        self.calls: Counter = Counter()
+        self.in_flight = 0
+        self.peak_concurrency = 0
+
+        self._model = botocore.session.get_session().get_service_model('ec2')
+        self._operations = {xform_name(name): name for name in self._model.operation_names}
+        self._validator = ParamValidator()
+        self._lock = threading.Lock()
+        # The operation each thread is in, for the errors _filter raises
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._store: Dict[str, Dict[str, Dict]] = {kind: {} for kind in (
+            'vpc', 'igw', 'rtb', 'subnet', 'eip', 'nat', 'sg', 'sgr', 'instance', 'lt', 'pg', 'image')}
+
+    def __getattr__(self, operation: str) -> Callable[..., Dict]:
+        handler = getattr(type(self), f'_{operation}', None)
+        if operation.startswith('_') or handler is None:
+            raise AttributeError(operation)
+
+        def call(**params) -> Dict:
+            self._validate(operation, params)
+            self._local.operation = self._operations[operation]
+            with self._lock:
+                self.calls[operation] += 1
+                self.in_flight += 1
+                self.peak_concurrency = max(self.peak_concurrency, self.in_flight)
+            try:
+                time.sleep(self._latency(operation) * self.scale)
+                with self._lock:
+                    self._advance()
+                    return handler(self, **params)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+        return call
+
+    def stats(self) -> Dict:
+        return {
+            'api_calls': dict(sorted(self.calls.items())),
+            'total_api_calls': sum(self.calls.values()),
+            'peak_concurrency': self.peak_concurrency,
+        }
+
+    def _validate(self, operation: str, params: Dict) -> None:
+        shape = self._model.operation_model(self._operations[operation]).input_shape
+        report = self._validator.validate(params, shape)
+        if report.has_errors():
+            raise ValueError(report.generate_report())
+
+    def _latency(self, operation: str) -> float:
+        if operation in self.latency:
+            return self.latency[operation]
+        return self.latency['describe' if operation.startswith('describe') else 'mutate']
+
+    def _id(self, prefix: str) -> str:
+        return f'{prefix}-{next(self._ids):017x}'
+
+    def _ready_at(self, kind: str) -> float:
+        return time.monotonic() + self.delays[kind] * self.scale
+
+    def _advance(self) -> None:
+        """Move resources whose transition delay has passed into their next state"""
+        now = time.monotonic()
+        for vpc in self._store['vpc'].values():
+            if vpc['State'] == 'pending' and now >= vpc['_ready']:
+                vpc['State'] = 'available'
+        for nat in self._store['nat'].values():
+            if nat['State'] in ('pending', 'deleting') and now >= nat['_ready']:
+                nat['State'] = 'available' if nat['State'] == 'pending' else 'deleted'
+                if nat['State'] == 'deleted':
+                    for address in nat['NatGatewayAddresses']:
+                        self._store['eip'][address['AllocationId']].pop('AssociationId', None)
+        for instance in self._store['instance'].values():
+            state = instance['State']['Name']
+            if state in ('pending', 'shutting-down', 'stopping') and now >= instance['_ready']:
+                instance['State'] = {'Name': {'pending': 'running', 'shutting-down': 'terminated',
+                                              'stopping': 'stopped'}[state]}
+                if state == 'pending':
+                    instance['_status_ok'] = instance['_ready'] + self.delays['status_checks'] * self.scale
+                    if instance.get('_powers_off'):
+                        instance['_ready'] = instance['_ready'] + self.delays['bake'] * self.scale
+            elif state == 'running' and instance.get('_powers_off') and now >= instance['_ready']:
+                # A bake script ends by powering off, and the instance's shutdown behaviour is stop
+                instance['State'] = {'Name': 'stopping'}
+                instance['_ready'] = now + self.delays['instance_stop'] * self.scale
+                instance['_powers_off'] = False
+        for image in self._store['image'].values():
+            if image['State'] == 'pending' and now >= image['_ready']:
+                image['State'] = 'available'
+
+    @staticmethod
+    def _error(code: str, operation: str, message: str = '') -> ClientError:
+        return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+    @staticmethod
+    def _tags(params: Dict, resource_type: str) -> List[Dict]:
+        return [tag for spec in params.get('TagSpecifications', []) if spec['ResourceType'] == resource_type
+                for tag in spec['Tags']]
+
+    @staticmethod
+    def _public(resource: Dict) -> Dict:
+        return {key: value for key, value in resource.items() if not key.startswith('_')}
+
+    def _get(self, kind: str, resource_id: str, code: str) -> Dict:
+        """A stored resource, or the error EC2 gives for an ID it does not know"""
+        if resource_id not in self._store[kind]:
+            raise self._error(code, self._local.operation, f"The ID '{resource_id}' does not exist")
+        return self._store[kind][resource_id]
+
+    def _filter(self, kind: str, filters: Optional[List[Dict]], getters: Dict[str, Callable],
+                resources: Optional[Iterable[Dict]] = None) -> List[Dict]:
+        """Stored resources of a kind (or the resources given) matching every filter"""
+        for f in filters or []:
+            if not (f['Name'].startswith('tag:') or f['Name'] == 'tag-key' or f['Name'] in getters):
+                raise self._error('InvalidParameterValue', self._local.operation,
+                                  f"The filter '{f['Name']}' is invalid")
+        matched = []
+        for resource in self._store[kind].values() if resources is None else resources:
+            for f in filters or []:
+                name = f['Name']
+                if name.startswith('tag:'):
+                    values = [t['Value'] for t in resource.get('Tags', []) if t['Key'] == name[4:]]
+                elif name == 'tag-key':
+                    values = [t['Key'] for t in resource.get('Tags', [])]
+                else:
+                    value = getters[name](resource)
+                    values = value if isinstance(value, list) else [value]
+                if not set(map(str, values)) & set(f['Values']):
+                    break
+            else:
+                matched.append(self._public(resource))
+        return matched
+
+    # VPC and networking
+
+    def _create_vpc(self, **params) -> Dict:
+        vpc = {'VpcId': self._id('vpc'), 'CidrBlock': params['CidrBlock'], 'State': 'pending',
+               'Tags': self._tags(params, 'vpc'), '_ready': self._ready_at('vpc')}
+        self._store['vpc'][vpc['VpcId']] = vpc
+        return {'Vpc': self._public(vpc)}
+
+    def _describe_availability_zones(self, **params) -> Dict:
+        zones = [
+            {'ZoneName': f'{self.region}{letter}', 'ZoneType': 'availability-zone', 'State': 'available',
+             'OptInStatus': 'opt-in-not-required'}
+            for letter in ZONE_LETTERS
+        ]
+        return {'AvailabilityZones': self._filter('zone', params.get('Filters'), {
+            'state': lambda z: z['State'],
+            'zone-name': lambda z: z['ZoneName'],
+            'zone-type': lambda z: z['ZoneType'],
+            'opt-in-status': lambda z: z['OptInStatus'],
+        }, zones)}
+
+    def _describe_vpcs(self, **params) -> Dict:
+        return {'Vpcs': self._filter('vpc', params.get('Filters'), {
+            'vpc-id': lambda v: v['VpcId'],
+            'state': lambda v: v['State'],
+        })}
+
+    def _delete_vpc(self, **params) -> Dict:
+        vpc_id = self._get('vpc', params['VpcId'], 'InvalidVpcID.NotFound')['VpcId']
+        in_use = [resource for kind in ('subnet', 'sg', 'rtb') for resource in self._store[kind].values()
+                  if resource['VpcId'] == vpc_id]
+        in_use += [igw for igw in self._store['igw'].values()
+                   if any(a['VpcId'] == vpc_id for a in igw['Attachments'])]
+        if in_use:
+            raise self._error('DependencyViolation', 'DeleteVpc',
+                              f"The vpc '{vpc_id}' has dependencies and cannot be deleted.")
+        del self._store['vpc'][vpc_id]
+        return {}
+
+    def _modify_vpc_attribute(self, **params) -> Dict:
+        return {}
+
+    def _create_internet_gateway(self, **params) -> Dict:
+        igw = {'InternetGatewayId': self._id('igw'), 'Attachments': [],
+               'Tags': self._tags(params, 'internet-gateway')}
+        self._store['igw'][igw['InternetGatewayId']] = igw
+        return {'InternetGateway': self._public(igw)}
+
+    def _attach_internet_gateway(self, **params) -> Dict:
+        igw = self._store['igw'][params['InternetGatewayId']]
+        igw['Attachments'] = [{'VpcId': params['VpcId'], 'State': 'available'}]
+        return {}
+
+    def _detach_internet_gateway(self, **params) -> Dict:
+        igw = self._get('igw', params['InternetGatewayId'], 'InvalidInternetGatewayID.NotFound')
+        if not any(a['VpcId'] == params['VpcId'] for a in igw['Attachments']):
+            raise self._error('Gateway.NotAttached', 'DetachInternetGateway',
+                              f"resource {igw['InternetGatewayId']} is not attached to network {params['VpcId']}")
+        igw['Attachments'] = []
+        return {}
+
+    def _delete_internet_gateway(self, **params) -> Dict:
+        igw = self._get('igw', params['InternetGatewayId'], 'InvalidInternetGatewayID.NotFound')
+        if igw['Attachments']:
+            raise self._error('DependencyViolation', 'DeleteInternetGateway',
+                              f"The internetGateway '{igw['InternetGatewayId']}' has dependencies")
+        del self._store['igw'][igw['InternetGatewayId']]
+        return {}
+
+    def _describe_internet_gateways(self, **params) -> Dict:
+        return {'InternetGateways': self._filter('igw', params.get('Filters'), {
+            'internet-gateway-id': lambda igw: igw['InternetGatewayId'],
+            'attachment.vpc-id': lambda igw: [a['VpcId'] for a in igw['Attachments']],
+        })}
+
+    def _create_route_table(self, **params) -> Dict:
+        route_table = {'RouteTableId': self._id('rtb'), 'VpcId': params['VpcId'], 'Routes': [],
+                       'Associations': [], 'Tags': self._tags(params, 'route-table')}
+        self._store['rtb'][route_table['RouteTableId']] = route_table
+        return {'RouteTable': self._public(route_table)}
+
+    def _create_route(self, **params) -> Dict:
+        route_table = self._store['rtb'][params['RouteTableId']]
+        if any(r['DestinationCidrBlock'] == params['DestinationCidrBlock'] for r in route_table['Routes']):
+            raise self._error('RouteAlreadyExists', 'CreateRoute')
+        nat_id = params.get('NatGatewayId')
+        if nat_id and self._store['nat'][nat_id]['State'] != 'available':
+            raise self._error('InvalidNatGatewayID.NotFound', 'CreateRoute', f'{nat_id} is not available')
+        route_table['Routes'].append({k: v for k, v in params.items() if k != 'RouteTableId'})
+        return {'Return': True}
+
+    def _replace_route(self, **params) -> Dict:
+        route_table = self._store['rtb'][params['RouteTableId']]
+        route_table['Routes'] = [r for r in route_table['Routes']
+                                 if r['DestinationCidrBlock'] != params['DestinationCidrBlock']]
+        route_table['Routes'].append({k: v for k, v in params.items() if k != 'RouteTableId'})
+        return {}
+
+    def _associate_route_table(self, **params) -> Dict:
+        association_id = self._id('rtbassoc')
+        self._store['rtb'][params['RouteTableId']]['Associations'].append(
+            {'RouteTableAssociationId': association_id, 'SubnetId': params['SubnetId'], 'Main': False})
+        return {'AssociationId': association_id}
+
+    def _disassociate_route_table(self, **params) -> Dict:
+        for route_table in self._store['rtb'].values():
+            associations = [a for a in route_table['Associations']
+                            if a['RouteTableAssociationId'] != params['AssociationId']]
+            if len(associations) < len(route_table['Associations']):
+                route_table['Associations'] = associations
+                return {}
+        raise self._error('InvalidAssociationID.NotFound', 'DisassociateRouteTable',
+                          f"The association ID '{params['AssociationId']}' does not exist")
+
+    def _delete_route_table(self, **params) -> Dict:
+        route_table = self._get('rtb', params['RouteTableId'], 'InvalidRouteTableID.NotFound')
+        if route_table['Associations']:
+            raise self._error('DependencyViolation', 'DeleteRouteTable',
+                              f"The routeTable '{route_table['RouteTableId']}' has dependencies and cannot be deleted.")
+        del self._store['rtb'][route_table['RouteTableId']]
+        return {}
+
+    def _describe_route_tables(self, **params) -> Dict:
+        return {'RouteTables': self._filter('rtb', params.get('Filters'), {
+            'vpc-id': lambda r: r['VpcId'],
+            'route-table-id': lambda r: r['RouteTableId'],
+            'association.subnet-id': lambda r: [a['SubnetId'] for a in r['Associations']],
+        })}
+
+    def _create_subnet(self, **params) -> Dict:
+        zone = params.get('AvailabilityZone')
+        if zone is not None and zone[len(self.region):] not in ZONE_LETTERS:
+            raise self._error('InvalidParameterValue', 'CreateSubnet',
+                              f"Value ({zone}) for parameter availabilityZone is invalid")
+        subnet = {'SubnetId': self._id('subnet'), 'VpcId': params['VpcId'], 'CidrBlock': params['CidrBlock'],
+                  'AvailabilityZone': params.get('AvailabilityZone'), 'State': 'available',
+                  'Tags': self._tags(params, 'subnet')}
+        self._store['subnet'][subnet['SubnetId']] = subnet
+        return {'Subnet': self._public(subnet)}
+
+    def _modify_subnet_attribute(self, **params) -> Dict:
+        return {}
+
+    def _describe_subnets(self, **params) -> Dict:
+        return {'Subnets': self._filter('subnet', params.get('Filters'), {
+            'vpc-id': lambda s: s['VpcId'],
+            'subnet-id': lambda s: s['SubnetId'],
+            'availability-zone': lambda s: s['AvailabilityZone'],
+        })}
+
+    def _delete_subnet(self, **params) -> Dict:
+        subnet_id = self._get('subnet', params['SubnetId'], 'InvalidSubnetID.NotFound')['SubnetId']
+        in_use = [i for i in self._store['instance'].values()
+                  if i['SubnetId'] == subnet_id and i['State']['Name'] != 'terminated']
+        in_use += [n for n in self._store['nat'].values() if n['SubnetId'] == subnet_id and n['State'] != 'deleted']
+        if in_use:
+            raise self._error('DependencyViolation', 'DeleteSubnet',
+                              f"The subnet '{subnet_id}' has dependencies and cannot be deleted.")
+        del self._store['subnet'][subnet_id]
+        for route_table in self._store['rtb'].values():
+            route_table['Associations'] = [a for a in route_table['Associations'] if a['SubnetId'] != subnet_id]
+        return {}
+
+    def _allocate_address(self, **params) -> Dict:
+        address = {'AllocationId': self._id('eipalloc'), 'PublicIp': '203.0.113.10', 'Domain': 'vpc',
+                   'Tags': self._tags(params, 'elastic-ip')}
+        self._store['eip'][address['AllocationId']] = address
+        return {'AllocationId': address['AllocationId'], 'PublicIp': address['PublicIp']}
+
+    def _describe_addresses(self, **params) -> Dict:
+        return {'Addresses': self._filter('eip', params.get('Filters'), {
+            'allocation-id': lambda a: a['AllocationId'],
+        })}
+
+    def _release_address(self, **params) -> Dict:
+        address = self._get('eip', params['AllocationId'], 'InvalidAllocationID.NotFound')
+        if 'AssociationId' in address:
+            raise self._error('InvalidIPAddress.InUse', 'ReleaseAddress',
+                              f"Address {address['PublicIp']} is in use.")
+        del self._store['eip'][address['AllocationId']]
+        return {}
+
+    def _create_nat_gateway(self, **params) -> Dict:
+        subnet = self._store['subnet'][params['SubnetId']]
+        nat = {'NatGatewayId': self._id('nat'), 'SubnetId': subnet['SubnetId'], 'VpcId': subnet['VpcId'],
+               'State': 'pending', 'NatGatewayAddresses': [{'AllocationId': params['AllocationId']}],
+               'Tags': self._tags(params, 'natgateway'), '_ready': self._ready_at('nat_gateway')}
+        self._store['nat'][nat['NatGatewayId']] = nat
+        self._store['eip'][params['AllocationId']]['AssociationId'] = self._id('eipassoc')
+        return {'NatGateway': self._public(nat)}
+
+    def _delete_nat_gateway(self, **params) -> Dict:
+        nat = self._get('nat', params['NatGatewayId'], 'NatGatewayNotFound')
+        if nat['State'] not in ('deleting', 'deleted'):
+            nat['State'] = 'deleting'
+            nat['_ready'] = self._ready_at('nat_gateway_delete')
+        return {'NatGatewayId': nat['NatGatewayId']}
+
+    def _describe_nat_gateways(self, **params) -> Dict:
+        return {'NatGateways': self._filter('nat', params.get('Filter'), {
+            'nat-gateway-id': lambda n: n['NatGatewayId'],
+            'state': lambda n: n['State'],
+            'vpc-id': lambda n: n['VpcId'],
+        })}
+
+    # Security groups
+
+    def _create_security_group(self, **params) -> Dict:
+        group = {'GroupId': self._id('sg'), 'GroupName': params['GroupName'], 'VpcId': params['VpcId'],
+                 'Description': params['Description'], 'IpPermissions': [],
+                 'Tags': self._tags(params, 'security-group')}
+        self._store['sg'][group['GroupId']] = group
+        return {'GroupId': group['GroupId']}
+
+    def _authorize_security_group_ingress(self, **params) -> Dict:
+        group_id = params['GroupId']
+        for permission in params['IpPermissions']:
+            base = {'GroupId': group_id, 'IsEgress': False, 'IpProtocol': permission['IpProtocol'],
+                    'FromPort': permission.get('FromPort', -1), 'ToPort': permission.get('ToPort', -1)}
+            sources = ([{'CidrIpv4': r['CidrIp']} for r in permission.get('IpRanges', [])] +
+                       [{'CidrIpv6': r['CidrIpv6']} for r in permission.get('Ipv6Ranges', [])] +
+                       [{'ReferencedGroupInfo': {'GroupId': p['GroupId']}}
+                        for p in permission.get('UserIdGroupPairs', [])])
+            for source in sources:
+                rule = {**base, **source}
+                if any({k: v for k, v in r.items() if k != 'SecurityGroupRuleId'} == rule
+                       for r in self._store['sgr'].values()):
+                    raise self._error('InvalidPermission.Duplicate', 'AuthorizeSecurityGroupIngress')
+                rule['SecurityGroupRuleId'] = self._id('sgr')
+                self._store['sgr'][rule['SecurityGroupRuleId']] = rule
+        self._store['sg'][group_id]['IpPermissions'] = params['IpPermissions']
+        return {'Return': True}
+
+    def _revoke_security_group_ingress(self, **params) -> Dict:
+        for rule_id in params.get('SecurityGroupRuleIds', []):
+            self._store['sgr'].pop(rule_id)
+        return {'Return': True}
+
+    def _describe_security_group_rules(self, **params) -> Dict:
+        return {'SecurityGroupRules': self._filter('sgr', params.get('Filters'), {'group-id': lambda r: r['GroupId']})}
+
+    def _describe_security_groups(self, **params) -> Dict:
+        return {'SecurityGroups': self._filter('sg', params.get('Filters'), {
+            'vpc-id': lambda g: g['VpcId'],
+            'group-id': lambda g: g['GroupId'],
+            'group-name': lambda g: g['GroupName'],
+        })}
+
+    def _delete_security_group(self, **params) -> Dict:
+        group_id = self._get('sg', params['GroupId'], 'InvalidGroup.NotFound')['GroupId']
+        in_use = [i for i in self._store['instance'].values() if i['State']['Name'] != 'terminated'
+                  and any(g['GroupId'] == group_id for g in i['SecurityGroups'])]
+        in_use += [r for r in self._store['sgr'].values()
+                   if r['GroupId'] != group_id and r.get('ReferencedGroupInfo', {}).get('GroupId') == group_id]
+        if in_use:
+            raise self._error('DependencyViolation', 'DeleteSecurityGroup',
+                              f"resource {group_id} has a dependent object")
+        del self._store['sg'][group_id]
+        for rule_id in [rule_id for rule_id, r in self._store['sgr'].items() if r['GroupId'] == group_id]:
+            del self._store['sgr'][rule_id]
+        return {}
+
+    # Instances
+
+    def _launch(self, count: int, image_id: str, instance_type: str, subnet_id: str, group_ids: List[str],
+                tags: List[Dict], lifecycle: Optional[str] = None) -> List[Dict]:
+        subnet = self._store['subnet'][subnet_id]
+        launched = []
+        for _ in range(count):
+            instance = {'InstanceId': self._id('i'), 'ImageId': image_id, 'InstanceType': instance_type,
+                        'SubnetId': subnet_id, 'VpcId': subnet['VpcId'], 'State': {'Name': 'pending'},
+                        'Placement': {'AvailabilityZone': subnet['AvailabilityZone']},
+                        'SecurityGroups': [{'GroupId': group_id} for group_id in group_ids],
+                        'HibernationOptions': {'Configured': False},
+                        'LaunchTime': time.time(), 'Tags': list(tags), '_ready': self._ready_at('instance')}
+            if lifecycle:
+                instance['InstanceLifecycle'] = lifecycle
+            self._store['instance'][instance['InstanceId']] = instance
+            launched.append(instance)
+        return launched
+
+    def _take_capacity(self, subnet_id: str, instance_type: str, count: int, minimum: int = 1) -> int:
+        """Claim up to count instances in the subnet's zone; claim nothing if fewer than minimum are left"""
+        zone = self._store['subnet'][subnet_id]['AvailabilityZone']
+        key = next((k for k in (f'{zone}:{instance_type}', zone) if k in self.capacity), None)
+        if key is None:
+            return count
+        granted = min(count, self.capacity[key])
+        if granted < minimum:
+            return 0
+        self.capacity[key] -= granted
+        return granted
+
+    def _run_instances(self, **params) -> Dict:
+        instance_type = params.get('InstanceType', 'm1.small')
+        group_id = params.get('Placement', {}).get('GroupId')
+        if group_id is not None and group_id not in self._store['pg']:
+            raise self._error('InvalidPlacementGroup.Unknown', 'RunInstances',
+                              f"The Placement Group '{group_id}' is unknown.")
+        count = self._take_capacity(params['SubnetId'], instance_type, params['MaxCount'], params['MinCount'])
+        if not count:
+            raise self._error('InsufficientInstanceCapacity', 'RunInstances',
+                              f"Insufficient capacity for {instance_type} in this zone")
+        launched = self._launch(count, params['ImageId'], instance_type, params['SubnetId'],
+                                params.get('SecurityGroupIds', []), self._tags(params, 'instance'))
+        powers_off = (params.get('InstanceInitiatedShutdownBehavior') == 'stop' and
+                      'poweroff' in params.get('UserData', ''))
+        for instance in launched:
+            if group_id is not None:
+                instance['Placement']['GroupName'] = self._store['pg'][group_id]['GroupName']
+                instance['Placement']['GroupId'] = group_id
+            instance['HibernationOptions'].update(params.get('HibernationOptions', {}))
+            instance['_powers_off'] = powers_off
+        return {'Instances': [self._public(i) for i in launched]}
+
+    def _describe_instances(self, **params) -> Dict:
+        instances = self._filter('instance', params.get('Filters'), {
+            'instance-id': lambda i: i['InstanceId'],
+            'instance-state-name': lambda i: i['State']['Name'],
+            'vpc-id': lambda i: i['VpcId'],
+            'subnet-id': lambda i: i['SubnetId'],
+            'availability-zone': lambda i: i['Placement']['AvailabilityZone'],
+            'placement-group-name': lambda i: i['Placement'].get('GroupName', ''),
+        })
+        return {'Reservations': [{'Instances': instances}] if instances else []}
+
+    def _instances(self, instance_ids: List[str]) -> List[Dict]:
+        return [self._get('instance', instance_id, 'InvalidInstanceID.NotFound') for instance_id in instance_ids]
+
+    def _start_instances(self, **params) -> Dict:
+        changes = []
+        for instance in self._instances(params['InstanceIds']):
+            previous = instance['State']['Name']
+            if previous not in ('stopped', 'pending', 'running'):
+                raise self._error('IncorrectInstanceState', 'StartInstances',
+                                  f"The instance '{instance['InstanceId']}' cannot be started from {previous}")
+            if previous == 'stopped':
+                instance['State'] = {'Name': 'pending'}
+                instance['_ready'] = self._ready_at('instance')
+            changes.append({'InstanceId': instance['InstanceId'], 'PreviousState': {'Name': previous},
+                            'CurrentState': instance['State']})
+        return {'StartingInstances': changes}
+
+    def _stop_instances(self, **params) -> Dict:
+        changes = []
+        for instance in self._instances(params['InstanceIds']):
+            previous = instance['State']['Name']
+            if previous not in ('pending', 'running', 'stopping', 'stopped'):
+                raise self._error('IncorrectInstanceState', 'StopInstances',
+                                  f"The instance '{instance['InstanceId']}' cannot be stopped from {previous}")
+            if params.get('Hibernate') and not instance['HibernationOptions']['Configured']:
+                raise self._error('UnsupportedHibernationConfiguration', 'StopInstances',
+                                  f"The instance '{instance['InstanceId']}' is not enabled for hibernation.")
+            if previous in ('pending', 'running'):
+                instance['State'] = {'Name': 'stopping'}
+                instance['_ready'] = self._ready_at('instance_stop')
+            changes.append({'InstanceId': instance['InstanceId'], 'PreviousState': {'Name': previous},
+                            'CurrentState': instance['State']})
+        return {'StoppingInstances': changes}
+
+    def _describe_instance_status(self, **params) -> Dict:
+        """Status checks of running instances, passing once status_checks has elapsed since they started"""
+        now = time.monotonic()
+        statuses = []
+        for instance in self._instances(params.get('InstanceIds', list(self._store['instance']))):
+            if instance['State']['Name'] != 'running' and not params.get('IncludeAllInstances'):
+                continue
+            running = instance['State']['Name'] == 'running'
+            check = ('ok' if now >= instance['_status_ok'] else 'initializing') if running else 'not-applicable'
+            statuses.append({
+                'InstanceId': instance['InstanceId'],
+                'AvailabilityZone': instance['Placement']['AvailabilityZone'],
+                'InstanceState': instance['State'],
+                'SystemStatus': {'Status': check},
+                'InstanceStatus': {'Status': check},
+            })
+        return {'InstanceStatuses': statuses}
+
+    def _get_console_output(self, **params) -> Dict:
+        """cloud-init's finishing line once the instance has passed its status checks"""
+        instance = self._get('instance', params['InstanceId'], 'InvalidInstanceID.NotFound')
+        booted = instance['State']['Name'] == 'running' and time.monotonic() >= instance['_status_ok']
+        return {'InstanceId': instance['InstanceId'], 'Output': CONSOLE_OUTPUT if booted else ''}
+
+    def _terminate_instances(self, **params) -> Dict:
+        for instance in self._instances(params['InstanceIds']):
+            if instance['State']['Name'] not in ('shutting-down', 'terminated'):
+                instance['State'] = {'Name': 'shutting-down'}
+                instance['_ready'] = self._ready_at('instance_terminate')
+        return {'TerminatingInstances': [{'InstanceId': i} for i in params['InstanceIds']]}
+
+    def _create_tags(self, **params) -> Dict:
+        keys = {tag['Key'] for tag in params['Tags']}
+        for resource_id in params['Resources']:
+            for resources in self._store.values():
+                if resource_id in resources:
+                    resource = resources[resource_id]
+                    resource['Tags'] = [t for t in resource.get('Tags', []) if t['Key'] not in keys] + params['Tags']
+        return {}
+
+    def _delete_tags(self, **params) -> Dict:
+        doomed = params.get('Tags')
+        for resource_id in params['Resources']:
+            for resources in self._store.values():
+                if resource_id in resources:
+                    resource = resources[resource_id]
+                    # A tag given without a value is deleted whatever its value
+                    resource['Tags'] = [t for t in resource.get('Tags', []) if doomed is not None and not any(
+                        d['Key'] == t['Key'] and d.get('Value', t['Value']) == t['Value'] for d in doomed)]
+        return {}
+
+    # Placement groups
+
+    def _create_placement_group(self, **params) -> Dict:
+        name = params['GroupName']
+        if any(group['GroupName'] == name for group in self._store['pg'].values()):
+            raise self._error('InvalidPlacementGroup.Duplicate', 'CreatePlacementGroup',
+                              f"Placement group '{name}' already exists.")
+        group = {'GroupId': self._id('pg'), 'GroupName': name, 'Strategy': params.get('Strategy', 'cluster'),
+                 'State': 'available', 'Tags': self._tags(params, 'placement-group')}
+        self._store['pg'][group['GroupId']] = group
+        return {'PlacementGroup': self._public(group)}
+
+    def _placement_group(self, name: str) -> Dict:
+        group = next((group for group in self._store['pg'].values() if group['GroupName'] == name), None)
+        if group is None:
+            raise self._error('InvalidPlacementGroup.Unknown', self._local.operation,
+                              f"The Placement Group '{name}' is unknown.")
+        return group
+
+    def _describe_placement_groups(self, **params) -> Dict:
+        groups = [self._placement_group(name) for name in params['GroupNames']] if 'GroupNames' in params else None
+        return {'PlacementGroups': self._filter('pg', params.get('Filters'), {
+            'group-id': lambda g: g['GroupId'],
+            'group-name': lambda g: g['GroupName'],
+            'state': lambda g: g['State'],
+            'strategy': lambda g: g['Strategy'],
+        }, groups)}
+
+    def _delete_placement_group(self, **params) -> Dict:
+        group = self._placement_group(params['GroupName'])
+        if any(i['Placement'].get('GroupId') == group['GroupId'] and i['State']['Name'] != 'terminated'
+               for i in self._store['instance'].values()):
+            raise self._error('InvalidPlacementGroup.InUse', 'DeletePlacementGroup',
+                              f"There are instances in placement group '{group['GroupName']}'.")
+        del self._store['pg'][group['GroupId']]
+        return {}
+
+    # Images
+
+    def _create_image(self, **params) -> Dict:
+        instance = self._get('instance', params['InstanceId'], 'InvalidInstanceID.NotFound')
+        if any(image['Name'] == params['Name'] for image in self._store['image'].values()):
+            raise self._error('InvalidAMIName.Duplicate', 'CreateImage',
+                              f"AMI name {params['Name']} is already in use by another AMI")
+        image = {'ImageId': self._id('ami'), 'Name': params['Name'], 'Description': params.get('Description', ''),
+                 'State': 'pending', 'SourceInstanceId': instance['InstanceId'],
+                 'CreationDate': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                 'Tags': self._tags(params, 'image'), '_ready': self._ready_at('image')}
+        self._store['image'][image['ImageId']] = image
+        return {'ImageId': image['ImageId']}
+
+    def _describe_images(self, **params) -> Dict:
+        images = [self._get('image', image_id, 'InvalidAMIID.NotFound')
+                  for image_id in params['ImageIds']] if 'ImageIds' in params else None
+        return {'Images': self._filter('image', params.get('Filters'), {
+            'image-id': lambda i: i['ImageId'],
+            'name': lambda i: i['Name'],
+            'state': lambda i: i['State'],
+        }, images)}
+
+    def _create_launch_template(self, **params) -> Dict:
+        template = {'LaunchTemplateId': self._id('lt'), 'LaunchTemplateName': params['LaunchTemplateName'],
+                    '_data': params['LaunchTemplateData']}
+        self._store['lt'][template['LaunchTemplateId']] = template
+        return {'LaunchTemplate': self._public(template)}
+
+    def _delete_launch_template(self, **params) -> Dict:
+        self._get('lt', params['LaunchTemplateId'], 'InvalidLaunchTemplateId.NotFound')
+        del self._store['lt'][params['LaunchTemplateId']]
+        return {}
+
+    def _create_fleet(self, **params) -> Dict:
+        """Fill an instant fleet round-robin across the overrides that still have capacity"""
+        # Only instant fleets tag their instances; volumes are tagged through the launch template
+        taggable = {'fleet', 'instance'} if params.get('Type') == 'instant' else {'fleet'}
+        untaggable = sorted({spec['ResourceType'] for spec in params.get('TagSpecifications', [])} - taggable)
+        if untaggable:
+            raise self._error('InvalidParameterValue', 'CreateFleet',
+                              f"Resource types {untaggable} cannot be tagged by this fleet")
+        config = params['LaunchTemplateConfigs'][0]
+        data = self._store['lt'][config['LaunchTemplateSpecification']['LaunchTemplateId']]['_data']
+        overrides = config['Overrides']
+        launched: Dict[int, List[str]] = {}
+        exhausted = set()
+        n = 0
+        for _ in range(params['TargetCapacitySpecification']['TotalTargetCapacity']):
+            while len(exhausted) < len(overrides):
+                index = n % len(overrides)
+                n += 1
+                override = overrides[index]
+                if index not in exhausted and self._take_capacity(override['SubnetId'], override['InstanceType'], 1):
+                    break
+                exhausted.add(index)
+            else:
+                break
+            instance = self._launch(1, data['ImageId'], override['InstanceType'], override['SubnetId'],
+                                    data.get('SecurityGroupIds', []), self._tags(params, 'instance'), 'spot')[0]
+            launched.setdefault(index, []).append(instance['InstanceId'])
+        return {
+            'FleetId': self._id('fleet'),
+            'Errors': [
+                {'LaunchTemplateAndOverrides': {'Overrides': overrides[index]}, 'Lifecycle': 'spot',
+                 'ErrorCode': 'InsufficientInstanceCapacity', 'ErrorMessage': 'There is no Spot capacity available'}
+                for index in sorted(exhausted)
+            ],
+            'Instances': [
+                {'LaunchTemplateAndOverrides': {'Overrides': overrides[index]}, 'Lifecycle': 'spot',
+                 'InstanceIds': instance_ids, 'InstanceType': overrides[index]['InstanceType']}
+                for index, instance_ids in launched.items()
+            ]
+        }
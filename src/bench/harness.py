@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import copy
+import logging
+import tempfile
+import time
+
+from src.bench.fake_ec2 import FakeEC2
+from src.core.images import ImageCatalog
+from src.core.poller import ResourcePoller
+from src.core.teardown import EnvironmentTeardown
+from src.environment import EnvironmentBuilder
+from src.reconciler import Reconciler
+
+BENCH_AMI = 'ami-0123456789abcdef0'
+
+
+def scenario_config(instances: int, subnets: int) -> Dict:
+    """An environment with `instances` spread over the workloads and `subnets` split between tiers
+
+    The database workload sits in a cluster placement group and keeps a warm
+    pool, so a build exercises both along with baking.
+    """
+    public = max(1, subnets // 2)
+    database = workflow = instances // 3
+    return {
+        'vpc': {
+            'cidr': '10.0.0.0/16',
+            'tiers': {'public': public, 'private': max(1, subnets - public)}
+        },
+        'workloads': {
+            'api': {'instance_type': 't3.medium', 'count': instances - database - workflow, 'spot': True},
+            'database': {'instance_type': 'm6i.large', 'count': database, 'spot': False,
+                         'placement_group': {'strategy': 'cluster'},
+                         'warm_pool': {'size': max(1, database // 2)}},
+            'workflow': {'instance_type': 't3.medium', 'count': workflow, 'spot': True}
+        }
+    }
+
+
+def run_scenario(instances: int, subnets: int, scale: float = 0.01, max_workers: int = 8,
+                 latency: Optional[Dict[str, float]] = None,
+                 delays: Optional[Dict[str, float]] = None,
+                 capacity: Optional[Dict[str, int]] = None) -> Dict:
+    """Run one environment's whole lifecycle against a fresh FakeEC2 and report its timing and API usage
+
+    The environment is built (baking images and filling the warm pool), its
+    pool parked, then grown by the pool's size with plan and apply, which
+    takes from the pool and refills it, and finally destroyed. scale shrinks every latency,
+    transition delay and poll interval alike, so simulated_seconds (wall
+    time divided by scale) approximates a real run.
+    """
+    ec2 = FakeEC2(latency=latency, delays=delays, scale=scale, capacity=capacity)
+    ResourcePoller.for_client(ec2, min_interval=2.0 * scale, max_interval=20.0 * scale)
+    config = scenario_config(instances, subnets)
+    phases: Dict[str, float] = {}
+
+    def phase(name: str, step: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = step()
+        phases[name] = time.perf_counter() - start
+        return result
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        images = ImageCatalog(Path(catalog_dir) / 'images.json')
+
+        def builder(config: Dict) -> EnvironmentBuilder:
+            return EnvironmentBuilder(ec2, 'bench', ec2.region, config, BENCH_AMI, max_workers,
+                                      images=images, bake=True)
+
+        def park(builder: EnvironmentBuilder) -> None:
+            for workload in builder.workloads.values():
+                if workload.warm_pool is not None:
+                    workload.warm_pool.wait()
+
+        first = builder(config)
+        result = phase('build', first.build)
+        phase('park', lambda: park(first))
+
+        grown = copy.deepcopy(config)
+        grown['workloads']['database']['count'] += grown['workloads']['database']['warm_pool']['size']
+        reconciler = Reconciler(builder(grown))
+        plan = phase('plan', reconciler.plan)
+        phase('apply', lambda: reconciler.apply(plan))
+        # Taking from the pool refilled it
+        phase('repark', lambda: park(reconciler.builder))
+        phase('destroy', EnvironmentTeardown(ec2, 'bench', ec2.region, max_workers=max_workers).run)
+
+    wall = sum(phases.values())
+    timing = result['timing']
+    return {
+        'scenario': f'{instances}-instances-{subnets}-subnets',
+        'instances': instances,
+        'subnets': subnets,
+        'wall_seconds': round(wall, 3),
+        'simulated_seconds': round(wall / scale, 1),
+        'phase_seconds': {name: round(seconds / scale, 1) for name, seconds in phases.items()},
+        'critical_path': timing['critical_path'],
+        'critical_path_seconds': timing['critical_path_seconds'],
+        'total_step_seconds': timing['total_step_seconds'],
+        **ec2.stats()
+    }
+
+
+def run_benchmarks(instance_counts: Iterable[int], subnet_counts: Iterable[int], scale: float = 0.01,
+                   max_workers: int = 8) -> Dict:
+    """Run every (instances, subnets) combination in turn"""
+    logger = logging.getLogger(__name__)
+    results = []
+    for instances in instance_counts:
+        for subnets in subnet_counts:
+            result = run_scenario(instances, subnets, scale, max_workers)
+            logger.info(
+                f"{result['scenario']}: {result['wall_seconds']}s "
+                f"({result['total_api_calls']} calls, peak concurrency {result['peak_concurrency']})"
+            )
+            results.append(result)
+    return {'scale': scale, 'max_workers': max_workers, 'results': results}
+
+
+def find_regressions(report: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """Scenarios that got slower than tolerance allows or make more API calls than the baseline"""
+    previous = {result['scenario']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        # Simulated time is comparable even when the baseline ran at another scale
+        if result['simulated_seconds'] > before['simulated_seconds'] * (1 + tolerance):
+            regressions.append(
+                f"{result['scenario']}: {result['simulated_seconds']}s vs {before['simulated_seconds']}s baseline"
+            )
+        if result['total_api_calls'] > before['total_api_calls']:
+            regressions.append(
+                f"{result['scenario']}: {result['total_api_calls']} API calls vs {before['total_api_calls']} baseline"
+            )
+    return regressions
@@ -0,0 +1,67 @@
+"""Measure CLI cold start and fail if it exceeds the budget
+
+    python -m src.bench.startup [--runs N]
+
+Commands that never reach AWS must stay under STARTUP_BUDGET_SECONDS
+(median wall time of a fresh interpreter) and must not import boto3 or
+botocore at all.
+"""
+from typing import Dict, List
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+STARTUP_BUDGET_SECONDS = 0.35
+
+LIGHT_COMMANDS = [
+    ['--help'],
+    ['validate', '--env', 'dev'],
+    ['plan', '--env', 'dev', '--offline', '--inventory-path', '/tmp/awsenv-startup-check.db'],
+]
+
+HEAVY_MODULES = ('boto3', 'botocore')
+
+
+def measure(args: List[str], runs: int) -> Dict:
+    command = [sys.executable, '-m', 'src.main', *args]
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+
+    # -X importtime lists every module the command imported on stderr
+    imports = subprocess.run([sys.executable, '-X', 'importtime', *command[1:]],
+                             check=True, capture_output=True, text=True).stderr
+    heavy = sorted({line.rsplit('|', 1)[-1].strip().split('.')[0] for line in imports.splitlines()
+                    if line.rsplit('|', 1)[-1].strip().split('.')[0] in HEAVY_MODULES})
+    return {
+        'command': ' '.join(args),
+        'median_seconds': round(statistics.median(timings), 3),
+        'max_seconds': round(max(timings), 3),
+        'heavy_imports': heavy,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS)
+    options = parser.parse_args()
+
+    results = [measure(args, options.runs) for args in LIGHT_COMMANDS]
+    print(json.dumps({'budget_seconds': options.budget, 'results': results}, indent=2))
+
+    failures = [r for r in results if r['median_seconds'] > options.budget or r['heavy_imports']]
+    for failure in failures:
+        print(f"OVER BUDGET: {failure['command']} took {failure['median_seconds']}s"
+              f"{' and imported ' + ', '.join(failure['heavy_imports']) if failure['heavy_imports'] else ''}",
+              file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
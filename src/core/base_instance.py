@@ -1,25 +1,370 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import base64
 import logging
+import uuid
+
+from src.core.inventory import NullInventory, env_scope
+from src.core.placement import CAPACITY_ERRORS, LaunchError, PlacementError, PlacementScheduler, error_code
+from src.core.poller import ResourcePoller
+from src.core.readiness import Probe, ReadinessPipeline, probe_from_config
+from src.core.tagging import TagContext
+from src.core.warm_pool import WarmPool
 
 class BaseInstance(ABC):
-    def __init__(self, ec2_client, region: str):
+    """Instances of one workload, launched from the workload's config block
+
+    Subclasses supply the install scripts and their defaults (probe, subnet
+    tier, spot); everything a config block sets is parsed here.
+    """
+
+    # Value of the Workload tag on everything this class launches
+    workload_name = 'instance'
+
+    # Subnet tier the workload launches into
+    tier = 'private'
+
+    # Whether to use spot capacity when a config does not say
+    default_spot = False
+
+    # EC2 Fleet allocation strategy for spot capacity
+    spot_strategy = 'price-capacity-optimized'
+
+    # How to tell the workload is serving once status checks pass; None stops at status checks
+    default_probe: Optional[Probe] = None
+
+    def __init__(self, ec2_client, region: str, instance_type: str, spot: Optional[bool] = None, count: int = 1,
+                 tags: Optional[TagContext] = None, inventory: Optional[NullInventory] = None,
+                 instance_types: Optional[List[str]] = None, spot_strategy: Optional[str] = None,
+                 readiness: Union[Dict, bool, None] = None, placement: Optional[Dict] = None,
+                 warm_pool: Optional[Dict] = None):
         self.ec2 = ec2_client
         self.region = region
+        self.instance_type = instance_type
+        # Spot capacity may come from any of these; on-demand tries instance_type first
+        self.instance_types = list(dict.fromkeys([instance_type, *(instance_types or [])]))
+        self.spot = self.default_spot if spot is None else spot
+        self.spot_strategy = spot_strategy or self.spot_strategy
+        self.count = count
+        self.tags = (tags or TagContext()).child(Workload=self.workload_name)
+        self.inventory = inventory or NullInventory()
+        # Image baked from get_bake_script(); launches from it only need the runtime script
+        self.baked_image: Optional[str] = None
+        self.readiness_probe = probe_from_config(readiness, self.default_probe)
+        # Zone of each subnet (filled in by the builder) and {'weights', 'max_per_az'} for the scheduler
+        self.subnet_zones: Dict[str, str] = {}
+        self.placement = placement or {}
+        # ID of the placement group to launch into (set by the builder), pinning the workload to its zone
+        self.placement_group: Optional[str] = None
+        self.poller = ResourcePoller.for_client(ec2_client)
         self.logger = logging.getLogger(self.__class__.__name__)
+        # Parked, already-initialised instances that launches start before running new ones
+        self.warm_pool = WarmPool.from_config(self, warm_pool)
+
+    @classmethod
+    def from_config(cls, ec2_client, region: str, config: Dict, tags: Optional[TagContext] = None,
+                    inventory: Optional[NullInventory] = None) -> 'BaseInstance':
+        """Build the workload from its block under 'workloads' in an environment config"""
+        return cls(ec2_client, region, tags=tags, inventory=inventory, **cls.config_options(config))
+
+    @classmethod
+    def config_options(cls, config: Dict) -> Dict:
+        """Constructor keyword arguments a workload's config block sets; subclasses add their own"""
+        return {
+            'instance_type': config['instance_type'],
+            'spot': config.get('spot'),
+            'count': config.get('count', 1),
+            'instance_types': config.get('instance_types'),
+            'spot_strategy': config.get('spot_strategy'),
+            'readiness': config.get('readiness'),
+            'placement': config.get('placement'),
+            'warm_pool': config.get('warm_pool')
+        }
 
     @abstractmethod
-    def create_instance(self, subnet_id: str, security_group_id: str, ami_id: str) -> List[str]:
+    def create_instance(self, subnet_ids: List[str], security_group_id: str, ami_id: str,
+                        count: Optional[int] = None, placed: Iterable[str] = ()) -> List[str]:
+        """Launch count (default self.count) instances around any already placed in the subnets listed"""
         pass
 
     @abstractmethod
-    def get_user_data(self) -> str:
+    def get_bake_script(self) -> str:
+        """Shell steps that install the workload; the part a baked image already contains"""
         pass
 
-    def wait_for_instances(self, instance_ids: List[str]) -> None:
-        waiter = self.ec2.get_waiter('instance_running')
-        waiter.wait(InstanceIds=instance_ids)
+    @abstractmethod
+    def get_runtime_script(self) -> str:
+        """Shell steps every boot still needs on a baked image, such as starting services"""
+        pass
+
+    def get_user_data(self, ami_id: Optional[str] = None) -> str:
+        """User data for launching from ami_id: runtime steps only when it is the baked image"""
+        if ami_id is not None and ami_id == self.baked_image:
+            return f"#!/bin/bash\n{self.get_runtime_script()}"
+        return f"#!/bin/bash\n{self.get_bake_script()}\n{self.get_runtime_script()}"
+
+    def launch_options(self) -> Dict:
+        """Parameters every launch adds, valid both for RunInstances and as launch template data"""
+        if self.placement_group is None:
+            return {}
+        return {'Placement': {'GroupId': self.placement_group}}
+
+    def wait_for_instances(self, instance_ids: List[str]) -> List[Dict]:
+        """Wait until every instance is running and write them through to the inventory"""
+        instances = self.poller.wait_for('instance', instance_ids)
+        our_tags = self.tags.as_dict(Name=self.tags.name(self.workload_name))
+        for instance in instances:
+            tags = {**our_tags, **{tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}}
+            self.inventory.put(
+                self.region,
+                'instances',
+                {**instance, 'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]},
+                [env_scope(self.tags.env)]
+            )
+        return instances
+
+    def stream_ready(self, instance_ids: List[str], timeout: float = 900.0) -> Iterator[Dict]:
+        """Yield readiness events as each instance is running, passes status checks, then the probe"""
+        return ReadinessPipeline(self.ec2, timeout).stream(
+            instance_ids, self.readiness_probe, workload=self.workload_name
+        )
+
+    def terminate_instances(self, instance_ids: List[str]) -> None:
+        """Terminate instances and wait until they are gone"""
+        try:
+            for start in range(0, len(instance_ids), 1000):
+                self.ec2.terminate_instances(InstanceIds=instance_ids[start:start + 1000])
+            self.poller.wait_for('instance', instance_ids, ready=('terminated',), failed=())
+            for instance_id in instance_ids:
+                self.inventory.delete(self.region, 'instances', instance_id)
+
+        except Exception as e:
+            self.logger.error(f"Error terminating instances: {str(e)}")
+            raise
+
+    def scheduler(self, subnet_ids: List[str], placed: Iterable[str] = ()) -> PlacementScheduler:
+        """A placement plan over these subnets, grouped by the zones recorded in subnet_zones
+
+        placed lists the subnet of each instance the workload already has, so
+        new instances are spread around them rather than as if none existed.
+        """
+        scheduler = PlacementScheduler(
+            {subnet_id: self.subnet_zones.get(subnet_id, subnet_id) for subnet_id in subnet_ids},
+            self.placement.get('weights'),
+            self.placement.get('max_per_az')
+        )
+        for subnet_id in placed:
+            scheduler.record(self.subnet_zones.get(subnet_id, subnet_id), 1)
+        return scheduler
+
+    def _place(self, scheduler: PlacementScheduler, count: int, variants: List, launch) -> Tuple[List[str], int]:
+        """Launch count instances zone by zone; return their IDs and how many could not be placed
+
+        launch(subnet_id, n, variant) may return fewer than n IDs. A zone that
+        comes up short, or answers with a capacity error, is dropped and its
+        shortfall re-planned over the other zones straight away; batches that
+        succeeded are kept. Only when every zone is short does the next
+        variant (such as an alternative instance type) get a turn. Any other
+        error is raised as a LaunchError once the batches alongside it have
+        returned, carrying every instance launched so far.
+        """
+        def attempt(zone: str, subnet_id: str, n: int, variant) -> Tuple[str, int, List[str], Optional[Exception]]:
+            try:
+                return zone, n, launch(subnet_id, n, variant), None
+            except Exception as e:
+                if error_code(e) not in CAPACITY_ERRORS:
+                    return zone, n, [], e
+                self.logger.warning(f"No capacity for {n} {self.workload_name} ({variant}) in {zone}: {error_code(e)}")
+                return zone, n, [], None
+
+        instance_ids: List[str] = []
+        remaining = count
+        for variant in variants:
+            exhausted = set()
+            while remaining > 0:
+                batches = scheduler.batches(scheduler.plan(remaining, exhausted))
+                if not batches:
+                    break
+                failure: Optional[Exception] = None
+                for zone, wanted, ids, error in self._launch_batches(
+                        batches, lambda zone, subnet_id, n, variant=variant: attempt(zone, subnet_id, n, variant)):
+                    scheduler.record(zone, len(ids))
+                    instance_ids.extend(ids)
+                    remaining -= len(ids)
+                    if len(ids) < wanted:
+                        exhausted.add(zone)
+                    failure = failure or error
+                if failure is not None:
+                    raise LaunchError(str(failure), instance_ids) from failure
+            if remaining <= 0:
+                break
+        return instance_ids, remaining
+
+    def _take_warm(self, scheduler: PlacementScheduler, subnet_ids: List[str], ami_id: str,
+                   count: int) -> List[str]:
+        """Start up to count warm-pool instances, counting each toward its zone's share of the launch"""
+        if self.warm_pool is None:
+            return []
+        started = self.warm_pool.take(subnet_ids, ami_id, count)
+        for instance in started:
+            scheduler.record(self.subnet_zones.get(instance['SubnetId'], instance['SubnetId']), 1)
+        return [instance['InstanceId'] for instance in started]
+
+    def _launch_batches(self, batches: List[Tuple], launch) -> List:
+        """Issue one launch call per batch concurrently and return their results in order"""
+        if len(batches) == 1:
+            return [launch(*batches[0])]
+        with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+            return list(pool.map(lambda batch: launch(*batch), batches))
+
+    def _create_ondemand_instance(self, subnet_ids: List[str], security_group_id: str, ami_id: str,
+                                  count: Optional[int] = None, placed: Iterable[str] = ()) -> List[str]:
+        """Launch count (default self.count) on-demand instances and wait for them"""
+        count = self.count if count is None else count
+        instance_ids: List[str] = []
+        try:
+            scheduler = self.scheduler(subnet_ids, placed)
+            instance_ids = self._take_warm(scheduler, subnet_ids, ami_id, count)
+            instance_ids += self._launch_ondemand(scheduler, security_group_id, ami_id, count - len(instance_ids))
+
+            # Wait for the whole group at once
+            self.wait_for_instances(instance_ids)
+            return instance_ids
+
+        except Exception as e:
+            self.logger.error(f"Error creating on-demand instances: {str(e)}")
+            raise self._launch_failure(e, instance_ids)
+
+    def _launch_ondemand(self, scheduler: PlacementScheduler, security_group_id: str, ami_id: str,
+                         count: int, **options) -> List[str]:
+        """Issue RunInstances per planned subnet batch, trying instance_types in order, without waiting
+
+        options are extra RunInstances parameters and override the defaults (e.g. TagSpecifications).
+        """
+        def launch(subnet_id: str, batch_size: int, instance_type: str) -> List[str]:
+            response = self.ec2.run_instances(**{
+                'ImageId': ami_id,
+                'InstanceType': instance_type,
+                # Take whatever part of the batch the zone has room for; the rest is placed elsewhere
+                'MinCount': 1,
+                'MaxCount': batch_size,
+                'SubnetId': subnet_id,
+                'SecurityGroupIds': [security_group_id],
+                'UserData': self.get_user_data(ami_id),
+                'TagSpecifications': self.tags.specs('instance', 'volume', Name=self.tags.name(self.workload_name)),
+                # Retried attempts resend the same token, so a retry never launches twice
+                'ClientToken': str(uuid.uuid4()),
+                **self.launch_options(),
+                **options
+            })
+            return [instance['InstanceId'] for instance in response['Instances']]
+
+        instance_ids, unplaced = self._place(scheduler, count, self.instance_types, launch)
+        if unplaced:
+            raise PlacementError(
+                f"No zone or instance type had capacity for {unplaced} of {count} {self.workload_name} instances",
+                instance_ids
+            )
+        return instance_ids
+
+    def _create_spot_instance(self, subnet_ids: List[str], security_group_id: str, ami_id: str,
+                              count: Optional[int] = None, placed: Iterable[str] = ()) -> List[str]:
+        """Launch count (default self.count) spot instances with instant-mode EC2 Fleets
+
+        Parked warm-pool instances are started first. One fleet per planned
+        subnet batch may pick any of self.instance_types and returns the
+        instance IDs it launched (or why each override could not)
+        synchronously. Shortfalls move to other zones, and whatever spot
+        capacity no zone has is made up with on-demand instances.
+        """
+        count = self.count if count is None else count
+        if count <= 0:
+            return []
+
+        instance_ids: List[str] = []
+        try:
+            scheduler = self.scheduler(subnet_ids, placed)
+            instance_ids = self._take_warm(scheduler, subnet_ids, ami_id, count)
+            if len(instance_ids) < count:
+                instance_ids += self._launch_fleet(scheduler, security_group_id, ami_id, count - len(instance_ids))
+
+            shortfall = count - len(instance_ids)
+            if shortfall > 0:
+                self.logger.warning(f"Spot capacity short by {shortfall}, launching on-demand instead")
+                instance_ids += self._launch_ondemand(scheduler, security_group_id, ami_id, shortfall)
+
+            self.wait_for_instances(instance_ids)
+            return instance_ids
+
+        except Exception as e:
+            self.logger.error(f"Error creating spot instances: {str(e)}")
+            raise self._launch_failure(e, instance_ids)
+
+    @staticmethod
+    def _launch_failure(error: Exception, instance_ids: List[str]) -> Exception:
+        """The error to raise for a failed launch, carrying every instance it had started so far"""
+        if isinstance(error, LaunchError):
+            error.instance_ids = instance_ids + error.instance_ids
+            return error
+        if instance_ids:
+            failure = LaunchError(str(error), instance_ids)
+            failure.__cause__ = error
+            return failure
+        return error
+
+    def _launch_fleet(self, scheduler: PlacementScheduler, security_group_id: str, ami_id: str,
+                      count: int) -> List[str]:
+        """Create instant fleets from one throwaway launch template and return their instance IDs
+
+        CreateFleet only tags fleets and instances, so volumes are tagged by the template.
+        """
+        name = self.tags.name(self.workload_name)
+        template = self.ec2.create_launch_template(
+            ClientToken=str(uuid.uuid4()),
+            LaunchTemplateName=f"{name}-{uuid.uuid4().hex[:12]}",
+            LaunchTemplateData={
+                'ImageId': ami_id,
+                'SecurityGroupIds': [security_group_id],
+                'UserData': base64.b64encode(self.get_user_data(ami_id).encode()).decode(),
+                'TagSpecifications': self.tags.specs('volume', Name=name),
+                **self.launch_options()
+            }
+        )['LaunchTemplate']
+
+        def launch(subnet_id: str, batch_size: int, instance_types: Tuple[str, ...]) -> List[str]:
+            response = self.ec2.create_fleet(
+                Type='instant',
+                ClientToken=str(uuid.uuid4()),
+                LaunchTemplateConfigs=[{
+                    'LaunchTemplateSpecification': {
+                        'LaunchTemplateId': template['LaunchTemplateId'],
+                        'Version': '$Latest'
+                    },
+                    'Overrides': [
+                        {'InstanceType': instance_type, 'SubnetId': subnet_id} for instance_type in instance_types
+                    ]
+                }],
+                TargetCapacitySpecification={
+                    'TotalTargetCapacity': batch_size,
+                    'DefaultTargetCapacityType': 'spot'
+                },
+                SpotOptions={'AllocationStrategy': self.spot_strategy},
+                TagSpecifications=self.tags.specs('fleet', 'instance', Name=name)
+            )
+            for error in response.get('Errors', []):
+                overrides = error.get('LaunchTemplateAndOverrides', {}).get('Overrides', {})
+                self.logger.warning(
+                    f"No spot {overrides.get('InstanceType')} in {overrides.get('SubnetId')}: "
+                    f"{error.get('ErrorCode')} {error.get('ErrorMessage', '')}"
+                )
+            return [instance_id for launched in response.get('Instances', [])
+                    for instance_id in launched['InstanceIds']]
 
-    def tag_instances(self, instance_ids: List[str], tags: List[Dict]) -> None:
-        self.ec2.create_tags(Resources=instance_ids, Tags=tags)
\ No newline at end of file
+        try:
+            # Each fleet already chooses among every instance type, so there is one variant
+            instance_ids, _ = self._place(scheduler, count, [tuple(self.instance_types)], launch)
+            return instance_ids
+        finally:
+            # An instant fleet does not need its template once the call returns
+            self.ec2.delete_launch_template(LaunchTemplateId=template['LaunchTemplateId'])
@@ -0,0 +1,118 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Tuple, Union
+import ipaddress
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# Subnet tiers in the order their share of the VPC is laid out
+TIERS = ('public', 'private')
+
+DEFAULT_SUBNET_PREFIX = 24
+
+
+class IntervalAllocator:
+    """Free space of one network as sorted, disjoint [start, end] address intervals
+
+    allocate() takes the lowest aligned block that fits, scanning the free
+    list from the front, since the first interval with room for a block is
+    not something the sorted starts can bisect to; exclude() removes ranges
+    already in use, finding the intervals they touch by bisection. With
+    sequential allocation the free list stays a handful of intervals long,
+    so carving hundreds of subnets (or VPCs out of a supernet) stays cheap.
+    """
+
+    def __init__(self, network: Union[str, Network]):
+        self.network = ipaddress.ip_network(network)
+        self._starts = [int(self.network.network_address)]
+        self._ends = [int(self.network.broadcast_address)]
+
+    def allocate(self, prefixlen: int) -> Network:
+        """Take the lowest free block of this prefix length"""
+        if prefixlen < self.network.prefixlen or prefixlen > self.network.max_prefixlen:
+            raise ValueError(f"/{prefixlen} does not fit in {self.network}")
+        size = 1 << (self.network.max_prefixlen - prefixlen)
+        for i, (start, end) in enumerate(zip(self._starts, self._ends)):
+            aligned = -(-start // size) * size
+            if aligned + size - 1 <= end:
+                self._remove(i, aligned, aligned + size - 1)
+                return self.network.__class__((aligned, prefixlen))
+        raise ValueError(f"No free /{prefixlen} left in {self.network}")
+
+    def exclude(self, network: Union[str, Network]) -> None:
+        """Mark whatever part of network lies inside this one as used"""
+        network = ipaddress.ip_network(network)
+        start = max(int(network.network_address), int(self.network.network_address))
+        end = min(int(network.broadcast_address), int(self.network.broadcast_address))
+        if start > end:
+            return
+        # Free intervals that could overlap [start, end], walked back to front so indexes hold
+        first = max(0, bisect_right(self._ends, start - 1))
+        last = bisect_left(self._starts, end + 1)
+        for i in reversed(range(first, last)):
+            self._remove(i, max(start, self._starts[i]), min(end, self._ends[i]))
+
+    def _remove(self, i: int, start: int, end: int) -> None:
+        """Cut [start, end] out of free interval i, keeping whatever is left on either side"""
+        pieces = []
+        if self._starts[i] < start:
+            pieces.append((self._starts[i], start - 1))
+        if end < self._ends[i]:
+            pieces.append((end + 1, self._ends[i]))
+        self._starts[i:i + 1] = [piece[0] for piece in pieces]
+        self._ends[i:i + 1] = [piece[1] for piece in pieces]
+
+
+def find_overlaps(networks: Iterable[Network]) -> List[Tuple[Network, Network]]:
+    """Overlapping pairs, in O(n log n): sorted by start, a network overlaps if it
+    starts before the furthest end seen so far"""
+    overlaps = []
+    furthest = None
+    for network in sorted(networks, key=lambda n: (n.version, n.network_address, n.prefixlen)):
+        if furthest is not None and furthest.version == network.version and \
+                network.network_address <= furthest.broadcast_address:
+            overlaps.append((furthest, network))
+        if furthest is None or furthest.version != network.version or \
+                network.broadcast_address > furthest.broadcast_address:
+            furthest = network
+    return overlaps
+
+
+def plan_subnets(vpc: Dict) -> Dict:
+    """Return the VPC config with <tier>_subnets filled in for every tier given under 'tiers'
+
+    A tier is a subnet count, or {"count": n, "prefix": p}; 'subnet_prefix'
+    sets the default size. Each tier is carved from its own share of the VPC
+    (public the lower half, private the upper), lowest address first and
+    around any hand-written subnets, so growing one tier never moves a
+    subnet that already exists.
+    """
+    tiers = vpc.get('tiers') or {}
+    if not tiers:
+        return vpc
+
+    unknown = set(tiers) - set(TIERS)
+    if unknown:
+        raise ValueError(f"Unknown subnet tiers {sorted(unknown)}; expected {list(TIERS)}")
+    network = ipaddress.ip_network(vpc['cidr'])
+    default_prefix = vpc.get('subnet_prefix', DEFAULT_SUBNET_PREFIX)
+    written = [ipaddress.ip_network(cidr) for tier in TIERS for cidr in vpc.get(f'{tier}_subnets', [])]
+
+    planned = dict(vpc)
+    shares = network.subnets(prefixlen_diff=(len(TIERS) - 1).bit_length())
+    for tier, share in zip(TIERS, shares):
+        if tier not in tiers:
+            continue
+        if vpc.get(f'{tier}_subnets'):
+            raise ValueError(f"{tier} subnets are both listed and given in tiers")
+        spec = tiers[tier]
+        count, prefix = (spec, default_prefix) if isinstance(spec, int) else \
+            (spec['count'], spec.get('prefix', default_prefix))
+
+        allocator = IntervalAllocator(share)
+        for cidr in written:
+            allocator.exclude(cidr)
+        try:
+            planned[f'{tier}_subnets'] = [str(allocator.allocate(prefix)) for _ in range(count)]
+        except ValueError as e:
+            raise ValueError(f"Cannot fit {count} /{prefix} {tier} subnets in {share}: {e}") from None
+    return planned
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import contextvars
+import logging
+import time
+
+# Name of the node whose function is running on this thread, for tracing
+current_step: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_step', default=None)
+
+
+class Node:
+    """A single provisioning step and the steps it depends on"""
+
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class DAGScheduler:
+    """Run provisioning steps concurrently as soon as their dependencies complete
+
+    Each node function receives the results of every completed node, keyed by
+    node name, and its return value becomes that node's result. on_complete,
+    if set, is called with each executed node's name and result as soon as
+    that result is stored, before any dependent node starts.
+    """
+
+    def __init__(self, max_workers: int = 8, on_complete: Optional[Callable[[str, Any], None]] = None):
+        self.max_workers = max_workers
+        self.on_complete = on_complete
+        self.nodes: Dict[str, Node] = {}
+        self.seeded: Dict[str, Any] = {}
+        self.results: Dict[str, Any] = {}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, name: str, func: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = ()) -> None:
+        """Register a node; dependencies may be added later but must exist before run()"""
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node: {name}")
+        self.nodes[name] = Node(name, func, deps)
+
+    def replace(self, name: str, func: Callable[[Dict[str, Any]], Any]) -> None:
+        """Swap the function of an existing node, keeping its dependencies"""
+        self.nodes[name].func = func
+
+    def seed(self, name: str, result: Any) -> None:
+        """Mark a node as already done (e.g. the resource exists) so run() skips it"""
+        if name not in self.nodes:
+            raise ValueError(f"Cannot seed unknown node: {name}")
+        self.seeded[name] = result
+
+    def pending(self) -> List[str]:
+        """Names of the nodes run() would execute, in dependency order"""
+        return [name for name in self._topological_order() if name not in self.seeded]
+
+    def run(self) -> Dict[str, Any]:
+        """Execute every node and return the results keyed by node name"""
+        self._validate()
+        self.results.update(self.seeded)
+        pending = {
+            name: set(node.deps) - set(self.seeded)
+            for name, node in self.nodes.items()
+            if name not in self.seeded
+        }
+        running = {}
+        error: Optional[BaseException] = None
+
+        self.started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dag') as pool:
+            while pending or running:
+                if error is None:
+                    ready = [name for name, deps in pending.items() if not deps]
+                    for name in ready:
+                        del pending[name]
+                        running[pool.submit(self._execute, self.nodes[name])] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        if error is None:
+                            self.logger.error(f"Step {name} failed: {str(e)}")
+                            error = e
+                        continue
+                    if self.on_complete is not None:
+                        self.on_complete(name, self.results[name])
+                    for deps in pending.values():
+                        deps.discard(name)
+        self.finished = time.monotonic()
+
+        if error is not None:
+            raise error
+        return self.results
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """Return the longest chain of dependent nodes by measured duration"""
+        longest: Dict[str, Tuple[float, Optional[str]]] = {}
+
+        def visit(name: str) -> float:
+            if name not in longest:
+                best, via = 0.0, None
+                for dep in self.nodes[name].deps:
+                    length = visit(dep)
+                    if length > best:
+                        best, via = length, dep
+                longest[name] = (best + self.nodes[name].duration, via)
+            return longest[name][0]
+
+        if not self.nodes:
+            return [], 0.0
+        tail = max(self.nodes, key=visit)
+        path = []
+        current: Optional[str] = tail
+        while current is not None:
+            path.append(current)
+            current = longest[current][1]
+        return list(reversed(path)), longest[tail][0]
+
+    def report(self) -> Dict[str, Any]:
+        """Summarize wall-clock time against the critical path"""
+        path, path_seconds = self.critical_path()
+        wall = (self.finished or time.monotonic()) - (self.started or time.monotonic())
+        return {
+            'wall_seconds': round(wall, 3),
+            'critical_path': path,
+            'critical_path_seconds': round(path_seconds, 3),
+            'total_step_seconds': round(sum(node.duration for node in self.nodes.values()), 3),
+            'steps': {
+                name: round(node.duration, 3) for name, node in self.nodes.items()
+            },
+        }
+
+    def log_report(self, logger: Optional[logging.Logger] = None) -> None:
+        logger = logger or self.logger
+        report = self.report()
+        logger.info(
+            f"Provisioned {len(self.nodes) - len(self.seeded)} steps in {report['wall_seconds']}s "
+            f"(critical path {report['critical_path_seconds']}s, "
+            f"serial would be {report['total_step_seconds']}s)"
+        )
+        logger.info(f"Critical path: {' -> '.join(report['critical_path'])}")
+
+    def _execute(self, node: Node) -> Any:
+        node.started = time.monotonic()
+        token = current_step.set(node.name)
+        try:
+            return node.func(self.results)
+        finally:
+            current_step.reset(token)
+            node.finished = time.monotonic()
+
+    def _validate(self) -> None:
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError(f"Node {node.name} depends on unknown node {dep}")
+        self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        visiting, visited = set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through node {name}")
+            visiting.add(name)
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import threading
+import time
+
+
+class Target:
+    """One environment to provision in one region"""
+
+    def __init__(self, env: str, region: str, ami_id: Optional[str] = None):
+        self.env = env
+        self.region = region
+        self.ami_id = ami_id
+
+    @classmethod
+    def parse(cls, spec: str, default_ami_id: Optional[str] = None) -> 'Target':
+        """Parse 'env:region' or 'env:region:ami-id'"""
+        parts = spec.split(':')
+        if len(parts) not in (2, 3) or not all(parts):
+            raise ValueError(f"Invalid target '{spec}', expected env:region[:ami-id]")
+        ami_id = parts[2] if len(parts) == 3 else default_ami_id
+        if ami_id is None:
+            raise ValueError(f"Target '{spec}' has no AMI and no default AMI was given")
+        return cls(parts[0], parts[1], ami_id)
+
+    def __str__(self) -> str:
+        return f"{self.env}:{self.region}"
+
+
+class FanOutRunner:
+    """Provision many (env, region) targets in parallel
+
+    Clients are created once per region and shared by every target in that
+    region. A semaphore per region caps how many builds hit the same regional
+    endpoint at once, on top of the overall max_parallel limit.
+    """
+
+    def __init__(self, client_factory: Callable[[str], Any], max_parallel: int = 4,
+                 per_region: int = 2):
+        self.client_factory = client_factory
+        self.max_parallel = max_parallel
+        self.per_region = per_region
+        self.logger = logging.getLogger(__name__)
+        self._clients: Dict[str, Any] = {}
+        self._region_limits: Dict[str, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def client(self, region: str):
+        """Return the pooled client for a region, creating it on first use"""
+        # Client creation through the default session is not thread-safe
+        with self._lock:
+            if region not in self._clients:
+                self._clients[region] = self.client_factory(region)
+            return self._clients[region]
+
+    def run(self, targets: List[Target], build: Callable[[Any, Target], Dict]) -> Dict:
+        """Run build(client, target) for every target and aggregate the outcomes"""
+        for target in targets:
+            self._region_limits.setdefault(target.region, threading.Semaphore(self.per_region))
+
+        # Submit round-robin across regions so a saturated region does not
+        # park every pool thread on its semaphore
+        rank, seen = [], {}
+        for target in targets:
+            rank.append(seen.get(target.region, 0))
+            seen[target.region] = rank[-1] + 1
+        order = sorted(range(len(targets)), key=lambda i: (rank[i], i))
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='fanout') as pool:
+            futures = {i: pool.submit(self._run_one, targets[i], build) for i in order}
+            results = [futures[i].result() for i in range(len(targets))]
+        wall = time.monotonic() - started
+
+        failed = [result for result in results if result['status'] != 'ok']
+        return {
+            'targets': results,
+            'succeeded': len(results) - len(failed),
+            'failed': len(failed),
+            'wall_seconds': round(wall, 3),
+            'serial_seconds': round(sum(result['seconds'] for result in results), 3)
+        }
+
+    def _run_one(self, target: Target, build: Callable[[Any, Target], Dict]) -> Dict:
+        with self._region_limits[target.region]:
+            started = time.monotonic()
+            try:
+                result = build(self.client(target.region), target)
+                status, error = 'ok', None
+            except Exception as e:
+                self.logger.error(f"Error provisioning {target}: {str(e)}")
+                result, status, error = None, 'failed', str(e)
+
+        return {
+            'env': target.env,
+            'region': target.region,
+            'status': status,
+            'seconds': round(time.monotonic() - started, 3),
+            'result': result,
+            'error': error
+        }
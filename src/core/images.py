@@ -0,0 +1,160 @@
+from pathlib import Path
+from typing import Dict, Optional
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from src.core.poller import ResourcePoller
+from src.core.tagging import TagContext
+
+DEFAULT_CATALOG_PATH = Path.home() / ".cache" / "awsenv" / "images.json"
+
+# Seconds a bake instance may take to install and power itself off, and an image to become available
+BAKE_TIMEOUT = 1800.0
+
+
+def bake_key(base_ami: str, workload) -> str:
+    """Content hash of what a baked image contains: the base AMI and the workload's bake script"""
+    content = json.dumps({
+        'base_ami': base_ami,
+        'workload': workload.workload_name,
+        'script': workload.get_bake_script()
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class NullImageCatalog:
+    """Catalog stand-in that knows no baked images; every launch uses the base AMI"""
+
+    def lookup(self, region: str, key: str) -> Optional[str]:
+        return None
+
+    def put(self, region: str, key: str, image_id: str, **details: str) -> None:
+        pass
+
+
+class ImageCatalog(NullImageCatalog):
+    """Local JSON record of baked images, keyed by region and bake_key()
+
+    Images are shared by every environment built from the same base AMI and
+    bake script, so entries carry no environment and are never torn down.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or DEFAULT_CATALOG_PATH)
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def lookup(self, region: str, key: str) -> Optional[str]:
+        entry = self._load().get(region, {}).get(key)
+        return entry['image_id'] if entry else None
+
+    def put(self, region: str, key: str, image_id: str, **details: str) -> None:
+        with self._lock:
+            catalog = self._load()
+            catalog.setdefault(region, {})[key] = {'image_id': image_id, 'baked_at': time.time(), **details}
+            # Write then rename so a concurrent reader never sees a partial file
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            staging = self.path.with_suffix('.tmp')
+            staging.write_text(json.dumps(catalog, indent=2))
+            staging.replace(self.path)
+
+    def _load(self) -> Dict[str, Dict[str, Dict]]:
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.logger.warning(f"Ignoring unreadable image catalog {self.path}")
+            return {}
+
+
+class ImageBaker:
+    """Build a workload's image once per bake_key() and record it in the catalog
+
+    A bake instance runs the workload's bake script and powers itself off;
+    the image is taken from the stopped instance, which is then terminated.
+    A script that fails leaves the instance running, so the bake times out
+    rather than capturing a half-installed image.
+    """
+
+    # One bake per key at a time in this process; builds sharing a key wait and reuse it
+    _key_locks: Dict[str, threading.Lock] = {}
+    _key_locks_lock = threading.Lock()
+
+    def __init__(self, ec2_client, region: str, catalog: NullImageCatalog, tags: Optional[TagContext] = None):
+        self.ec2 = ec2_client
+        self.region = region
+        self.catalog = catalog
+        self.tags = tags or TagContext()
+        self.poller = ResourcePoller.for_client(ec2_client)
+        self.logger = logging.getLogger(__name__)
+
+    def bake(self, workload, subnet_id: str, security_group_id: str, base_ami: str) -> str:
+        """Return the image for this workload and base AMI, baking it if no account image matches"""
+        key = bake_key(base_ami, workload)
+        with self._key_locks_lock:
+            lock = self._key_locks.setdefault(f'{self.region}:{key}', threading.Lock())
+        with lock:
+            image_id = self.catalog.lookup(self.region, key) or self.find(key) or \
+                self._bake(workload, key, subnet_id, security_group_id, base_ami)
+            self.catalog.put(self.region, key, image_id, workload=workload.workload_name, base_ami=base_ami)
+        return image_id
+
+    def find(self, key: str) -> Optional[str]:
+        """An image already baked for this key (by any machine), waiting for it if still pending"""
+        images = self.ec2.describe_images(
+            Owners=['self'],
+            Filters=[{'Name': 'tag:BakeKey', 'Values': [key]}, {'Name': 'state', 'Values': ['pending', 'available']}]
+        )['Images']
+        if not images:
+            return None
+        image = max(images, key=lambda i: i.get('CreationDate', ''))
+        if image['State'] == 'pending':
+            self.poller.wait_for('image', [image['ImageId']], timeout=BAKE_TIMEOUT)
+        self.logger.info(f"Reusing baked image {image['ImageId']} for {key[:12]}")
+        return image['ImageId']
+
+    def _bake(self, workload, key: str, subnet_id: str, security_group_id: str, base_ami: str) -> str:
+        name = f"awsenv-{workload.workload_name}-{key[:16]}"
+        self.logger.info(f"Baking {name} from {base_ami}")
+        start = time.monotonic()
+
+        instance_id = self.ec2.run_instances(
+            ImageId=base_ami,
+            InstanceType=workload.instance_type,
+            MinCount=1,
+            MaxCount=1,
+            SubnetId=subnet_id,
+            SecurityGroupIds=[security_group_id],
+            UserData=f"#!/bin/bash\nset -e\n{workload.get_bake_script()}\npoweroff\n",
+            InstanceInitiatedShutdownBehavior='stop',
+            TagSpecifications=self.tags.specs('instance', 'volume', Name=name, BakeKey=key),
+            ClientToken=str(uuid.uuid4())
+        )['Instances'][0]['InstanceId']
+
+        try:
+            self.poller.wait_for('instance', [instance_id], ready=('stopped',),
+                                 failed=('shutting-down', 'terminated'), timeout=BAKE_TIMEOUT)
+            image_tags = {'ManagedBy': 'awsenv', 'Name': name, 'BakeKey': key,
+                          'Workload': workload.workload_name, 'BaseImage': base_ami}
+            image_id = self.ec2.create_image(
+                InstanceId=instance_id,
+                Name=name,
+                Description=f"{workload.workload_name} baked from {base_ami}",
+                # The instance is already stopped, so the filesystem is consistent
+                NoReboot=True,
+                TagSpecifications=[
+                    {'ResourceType': resource_type, 'Tags': [{'Key': k, 'Value': v} for k, v in image_tags.items()]}
+                    for resource_type in ('image', 'snapshot')
+                ]
+            )['ImageId']
+            self.poller.wait_for('image', [image_id], timeout=BAKE_TIMEOUT)
+        finally:
+            self.ec2.terminate_instances(InstanceIds=[instance_id])
+
+        self.logger.info(f"Baked {image_id} ({name}) in {time.monotonic() - start:.0f}s")
+        return image_id
@@ -0,0 +1,182 @@
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = Path.home() / ".cache" / "awsenv" / "inventory.db"
+
+# Seconds a cached listing stays valid; instances move fastest, AZs almost never
+DEFAULT_TTLS = {
+    'vpcs': 600,
+    'subnets': 600,
+    'route_tables': 300,
+    'internet_gateways': 600,
+    'nat_gateways': 120,
+    'addresses': 300,
+    'security_groups': 300,
+    'security_group_rules': 300,
+    'instances': 30,
+    'placement_groups': 600,
+    'availability_zones': 86400,
+}
+
+ID_KEYS = {
+    'vpcs': 'VpcId',
+    'subnets': 'SubnetId',
+    'route_tables': 'RouteTableId',
+    'internet_gateways': 'InternetGatewayId',
+    'nat_gateways': 'NatGatewayId',
+    'addresses': 'AllocationId',
+    'security_groups': 'GroupId',
+    'security_group_rules': 'SecurityGroupRuleId',
+    'instances': 'InstanceId',
+    'placement_groups': 'GroupId',
+    'availability_zones': 'ZoneName',
+}
+
+
+def env_scope(env: Optional[str]) -> str:
+    """Scope of the listings a snapshot of one environment reads and writes"""
+    return f'env:{env}'
+
+
+class NullInventory:
+    """Inventory stand-in that never caches; every listing goes to the API"""
+
+    def list(self, region: str, kind: str, scope: str, fetch: Callable[[], List[Dict]],
+             fresh: bool = False) -> List[Dict]:
+        return fetch()
+
+    def put(self, region: str, kind: str, resource: Dict, scopes: Iterable[str] = ()) -> None:
+        pass
+
+    def delete(self, region: str, kind: str, resource_id: str) -> None:
+        pass
+
+    def invalidate(self, region: str, kind: Optional[str] = None) -> None:
+        pass
+
+
+class InventoryCache(NullInventory):
+    """Local SQLite cache of describe_* results keyed by region and resource type
+
+    A listing is the set of resource IDs one describe (for one scope, such as
+    an environment or a VPC tier) returned. Listings expire after a per-type
+    TTL; creates and deletes made through the managers write through so the
+    cache stays usable between refreshes. Mutations that change a resource
+    in place (routes, associations, rules) invalidate that type instead.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttls: Optional[Dict[str, float]] = None):
+        self.path = Path(path or DEFAULT_PATH)
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS resources ('
+            'region TEXT, kind TEXT, resource_id TEXT, data TEXT, '
+            'PRIMARY KEY (region, kind, resource_id))'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS listings ('
+            'region TEXT, kind TEXT, scope TEXT, fetched_at REAL, ids TEXT, '
+            'PRIMARY KEY (region, kind, scope))'
+        )
+
+    def list(self, region: str, kind: str, scope: str, fetch: Callable[[], List[Dict]],
+             fresh: bool = False) -> List[Dict]:
+        """Return a listing from the cache if it is within its TTL, otherwise fetch and store it"""
+        if not fresh:
+            cached = self._cached(region, kind, scope)
+            if cached is not None:
+                return cached
+
+        resources = fetch()
+        id_key = ID_KEYS[kind]
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                'INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)',
+                [(region, kind, r[id_key], json.dumps(r, default=str)) for r in resources]
+            )
+            self._db.execute(
+                'INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)',
+                (region, kind, scope, time.time(), json.dumps([r[id_key] for r in resources]))
+            )
+            self._db.execute('COMMIT')
+        return resources
+
+    def put(self, region: str, kind: str, resource: Dict, scopes: Iterable[str] = ()) -> None:
+        """Write a created resource through and add it to any cached listings of its scopes"""
+        resource_id = resource[ID_KEYS[kind]]
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.execute(
+                'INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)',
+                (region, kind, resource_id, json.dumps(resource, default=str))
+            )
+            for scope in scopes:
+                row = self._db.execute(
+                    'SELECT ids FROM listings WHERE region = ? AND kind = ? AND scope = ?',
+                    (region, kind, scope)
+                ).fetchone()
+                if row is not None:
+                    ids = json.loads(row[0])
+                    if resource_id not in ids:
+                        ids.append(resource_id)
+                    self._db.execute(
+                        'UPDATE listings SET ids = ? WHERE region = ? AND kind = ? AND scope = ?',
+                        (json.dumps(ids), region, kind, scope)
+                    )
+            self._db.execute('COMMIT')
+
+    def delete(self, region: str, kind: str, resource_id: str) -> None:
+        """Drop a deleted resource from the cache and from every listing"""
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.execute(
+                'DELETE FROM resources WHERE region = ? AND kind = ? AND resource_id = ?',
+                (region, kind, resource_id)
+            )
+            for scope, ids in self._db.execute(
+                    'SELECT scope, ids FROM listings WHERE region = ? AND kind = ?', (region, kind)).fetchall():
+                remaining = [i for i in json.loads(ids) if i != resource_id]
+                self._db.execute(
+                    'UPDATE listings SET ids = ? WHERE region = ? AND kind = ? AND scope = ?',
+                    (json.dumps(remaining), region, kind, scope)
+                )
+            self._db.execute('COMMIT')
+
+    def invalidate(self, region: str, kind: Optional[str] = None) -> None:
+        """Force the next listing of a type (or every type) in a region back to the API"""
+        with self._lock:
+            if kind is None:
+                self._db.execute('DELETE FROM listings WHERE region = ?', (region,))
+            else:
+                self._db.execute('DELETE FROM listings WHERE region = ? AND kind = ?', (region, kind))
+
+    def _cached(self, region: str, kind: str, scope: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT fetched_at, ids FROM listings WHERE region = ? AND kind = ? AND scope = ?',
+                (region, kind, scope)
+            ).fetchone()
+            if row is None or time.time() - row[0] > self.ttls.get(kind, 0):
+                return None
+
+            ids = json.loads(row[1])
+            data = dict(self._db.execute(
+                'SELECT resource_id, data FROM resources WHERE region = ? AND kind = ?',
+                (region, kind)
+            ).fetchall())
+
+        if any(resource_id not in data for resource_id in ids):
+            return None
+        return [json.loads(data[resource_id]) for resource_id in ids]
@@ -0,0 +1,139 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+DEFAULT_JOURNAL_DIR = Path.home() / ".cache" / "awsenv" / "journals"
+
+# ID prefixes of resources an environment snapshot describes, so a journaled ID can be checked
+VERIFIABLE_PREFIXES = ('vpc-', 'subnet-', 'igw-', 'rtb-', 'eipalloc-', 'nat-', 'sg-', 'i-', 'pg-')
+
+
+def journal_path(env: str, region: str, directory: Path = DEFAULT_JOURNAL_DIR) -> Path:
+    return Path(directory) / f"{env}-{region}.jsonl"
+
+
+def resource_ids(result: Any) -> List[str]:
+    """Every verifiable resource ID in a step result (a string, list or dict of them)"""
+    if isinstance(result, str):
+        return [result] if result.startswith(VERIFIABLE_PREFIXES) else []
+    if isinstance(result, (list, tuple)):
+        return [i for item in result for i in resource_ids(item)]
+    if isinstance(result, dict):
+        return [i for item in result.values() for i in resource_ids(item)]
+    return []
+
+
+class BuildJournal:
+    """Write-ahead log of the steps a build has completed, one JSON object per line
+
+    The first line records the environment, region and run ID; every later
+    line is a finished step and its result, flushed to disk before the build
+    moves on. A resumed build reads it back (ignoring a torn last line) and
+    keeps the run ID, so resumed resources carry the same RunId tag.
+    """
+
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = Path(path)
+        self.run_id: Optional[str] = None
+        self.completed: Dict[str, Any] = {}
+        self.abandoned: Dict[str, List[str]] = {}
+        self.logger = logging.getLogger(__name__)
+        self._file = None
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+
+    def start(self, env: str, region: str, run_id: str) -> None:
+        """Rewrite the journal with a header and whatever completed steps are still trusted"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'w')
+        self._write({'env': env, 'region': region, 'run_id': run_id, 'started': time.time()})
+        for step, result in self.completed.items():
+            self._write({'step': step, 'result': result})
+
+    def record(self, step: str, result: Any) -> None:
+        with self._lock:
+            self.completed[step] = result
+            self._write({'step': step, 'result': result, 'finished': time.time()})
+
+    def record_partial(self, step: str, result: Any) -> None:
+        """Journal what a failed step had already created, so a resume builds on it instead of leaking it"""
+        with self._lock:
+            self.completed[step] = result
+            self._write({'step': step, 'result': result, 'partial': True, 'finished': time.time()})
+
+    def finish(self) -> None:
+        """The build succeeded, so there is nothing to resume"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def verify(self, known_ids: Iterable[str], deps: Dict[str, List[str]], order: List[str],
+               divisible: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        """Keep only completed steps whose resources all still exist and whose dependencies were kept
+
+        order must list dependencies before dependents. Steps without
+        verifiable IDs (routes, associations, rules) stand or fall with the
+        steps they depend on. Dropped steps are forgotten, so a second resume
+        never trusts a step whose dependency was redone under a new ID.
+
+        Steps starting with a divisible prefix (a list of interchangeable
+        instances) keep whichever IDs survive, for the caller to top up; their
+        dependents are redone. If such a step is dropped anyway, its surviving
+        IDs are left in abandoned for the caller to clean up.
+        """
+        known = set(known_ids)
+        kept: Dict[str, Any] = {}
+        shrunk = set()
+        self.abandoned = {}
+        for step in order:
+            if step not in self.completed:
+                continue
+            result = self.completed[step]
+            deps_kept = all(dep in kept and dep not in shrunk for dep in deps.get(step, []))
+            missing = [i for i in resource_ids(result) if i not in known]
+            if step.startswith(divisible):
+                survivors = [i for i in result if i in known]
+                if not deps_kept:
+                    if survivors:
+                        self.abandoned[step] = survivors
+                    continue
+                if missing:
+                    self.logger.warning(f"Topping up {step}: {', '.join(missing)} no longer exist")
+                    shrunk.add(step)
+                kept[step] = survivors
+            elif missing:
+                self.logger.warning(f"Redoing {step}: {', '.join(missing)} no longer exist")
+            elif deps_kept:
+                kept[step] = result
+        self.completed = kept
+        return kept
+
+    def _write(self, entry: Dict) -> None:
+        self._file.write(json.dumps(entry, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _load(self) -> None:
+        try:
+            lines = self.path.read_text().splitlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash mid-write leaves at most one torn line at the end
+                continue
+            if 'run_id' in entry:
+                self.run_id = entry['run_id']
+            elif 'step' in entry:
+                self.completed[entry['step']] = entry['result']
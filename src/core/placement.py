@@ -0,0 +1,87 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+
+# Errors meaning "not here, not now": retry the same request in another zone or on another type
+CAPACITY_ERRORS = {
+    'InsufficientInstanceCapacity',
+    'InsufficientCapacity',
+    'InsufficientHostCapacity',
+    'Unsupported',
+}
+
+
+class LaunchError(Exception):
+    """Raised when a launch fails after some of its instances were already started
+
+    instance_ids holds those instances; whoever catches this owns them.
+    """
+
+    def __init__(self, message: str, instance_ids: List[str]):
+        super().__init__(message)
+        self.instance_ids = instance_ids
+
+
+class PlacementError(LaunchError):
+    """Raised when no zone and instance type has capacity left for the rest of a launch"""
+
+
+def error_code(error: Exception) -> str:
+    return getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+
+
+class PlacementScheduler:
+    """Spread one workload's instances over availability zones by weight
+
+    Each instance goes to the zone with the lowest (placed + 1) / weight, so
+    counts track the weights as closely as whole instances allow and even
+    weights give an even spread (the anti-affinity default). max_per_az caps
+    any one zone. Within a zone, instances are split evenly across its
+    subnets. Zones that ran out of capacity are excluded from later plans.
+    """
+
+    def __init__(self, subnet_zones: Dict[str, str], weights: Optional[Dict[str, float]] = None,
+                 max_per_az: Optional[int] = None):
+        if not subnet_zones:
+            raise ValueError("At least one subnet is required to launch instances")
+        self.subnets: Dict[str, List[str]] = {}
+        for subnet_id, zone in subnet_zones.items():
+            self.subnets.setdefault(zone, []).append(subnet_id)
+        self.weights = {zone: float((weights or {}).get(zone, 1.0)) for zone in self.subnets}
+        self.max_per_az = max_per_az
+        self.placed: Counter = Counter()
+
+    def plan(self, count: int, exclude: Iterable[str] = ()) -> Dict[str, int]:
+        """How many of count to place in each zone; may total less when caps or exclusions leave no room"""
+        excluded = set(exclude)
+        heap = [((self.placed[zone] + 1) / weight, zone) for zone, weight in self.weights.items()
+                if weight > 0 and zone not in excluded and self._room(zone, 0)]
+        heapq.heapify(heap)
+
+        planned: Counter = Counter()
+        for _ in range(count):
+            if not heap:
+                break
+            _, zone = heapq.heappop(heap)
+            planned[zone] += 1
+            if self._room(zone, planned[zone]):
+                heapq.heappush(heap, ((self.placed[zone] + planned[zone] + 1) / self.weights[zone], zone))
+        return dict(planned)
+
+    def batches(self, zone_counts: Dict[str, int]) -> List[Tuple[str, str, int]]:
+        """(zone, subnet, count) launch batches, splitting each zone's count over its subnets"""
+        batches = []
+        for zone, count in zone_counts.items():
+            subnets = self.subnets[zone]
+            base, extra = divmod(count, len(subnets))
+            for i, subnet_id in enumerate(subnets):
+                n = base + (1 if i < extra else 0)
+                if n:
+                    batches.append((zone, subnet_id, n))
+        return batches
+
+    def record(self, zone: str, count: int) -> None:
+        self.placed[zone] += count
+
+    def _room(self, zone: str, planned: int) -> bool:
+        return self.max_per_az is None or self.placed[zone] + planned < self.max_per_az
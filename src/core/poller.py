@@ -0,0 +1,274 @@
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+import time
+
+
+class ResourceFailed(Exception):
+    """Raised when a polled resource reaches a terminal state other than the one awaited"""
+
+    def __init__(self, kind: str, resource_id: str, state: str):
+        super().__init__(f"{kind} {resource_id} entered state {state}")
+        self.kind = kind
+        self.resource_id = resource_id
+        self.state = state
+
+
+class _Kind:
+    """How to batch-describe one resource type and read its state"""
+
+    def __init__(self, operation: str, filter_name: str, id_key: str,
+                 extract: Callable[[Dict], List[Dict]], state: Callable[[Dict], str],
+                 ready: Tuple[str, ...], failed: Tuple[str, ...], filter_param: str = 'Filters',
+                 ids_param: Optional[str] = None, batch_size: Optional[int] = None):
+        self.operation = operation
+        self.filter_name = filter_name
+        self.id_key = id_key
+        self.extract = extract
+        self.state = state
+        self.ready = ready
+        self.failed = failed
+        self.filter_param = filter_param
+        # Operations without an ID filter take the IDs as a parameter instead, often with a lower cap
+        self.ids_param = ids_param
+        self.batch_size = batch_size
+
+
+KINDS: Dict[str, _Kind] = {
+    'vpc': _Kind(
+        'describe_vpcs', 'vpc-id', 'VpcId',
+        lambda response: response['Vpcs'],
+        lambda vpc: vpc['State'],
+        ready=('available',), failed=()
+    ),
+    'instance': _Kind(
+        'describe_instances', 'instance-id', 'InstanceId',
+        lambda response: [i for r in response['Reservations'] for i in r['Instances']],
+        lambda instance: instance['State']['Name'],
+        ready=('running',), failed=('shutting-down', 'terminated')
+    ),
+    'nat_gateway': _Kind(
+        'describe_nat_gateways', 'nat-gateway-id', 'NatGatewayId',
+        lambda response: response['NatGateways'],
+        lambda nat: nat['State'],
+        ready=('available',), failed=('failed', 'deleting', 'deleted'),
+        filter_param='Filter'
+    ),
+    'image': _Kind(
+        'describe_images', 'image-id', 'ImageId',
+        lambda response: response['Images'],
+        lambda image: image['State'],
+        ready=('available',), failed=('invalid', 'deregistered', 'failed', 'error', 'disabled')
+    ),
+    'instance_status': _Kind(
+        'describe_instance_status', '', 'InstanceId',
+        lambda response: response['InstanceStatuses'],
+        lambda status: _status_checks(status),
+        ready=('ok',), failed=('impaired',),
+        ids_param='InstanceIds', batch_size=100
+    ),
+}
+
+
+class _Wait:
+    def __init__(self, kind: str, resource_id: str, ready: Tuple[str, ...],
+                 failed: Tuple[str, ...], deadline: float):
+        self.kind = kind
+        self.resource_id = resource_id
+        self.ready = ready
+        self.failed = failed
+        self.deadline = deadline
+        self.future: Future = Future()
+        self.state: Optional[str] = None
+
+
+class ResourcePoller:
+    """Resolve many resource waits with shared, batched describe calls
+
+    Every outstanding wait of the same kind is merged into one filtered
+    describe call per 200 IDs (the EC2 filter value limit). Each kind backs
+    off independently while nothing changes and snaps back to the minimum
+    interval as soon as a resource moves or a new wait is registered.
+    """
+
+    BATCH_SIZE = 200
+
+    # Attribute holding a client's shared poller, so the poller lives and dies with its client
+    CLIENT_ATTRIBUTE = '_awsenv_resource_poller'
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ec2_client, min_interval: float = 2.0, max_interval: float = 20.0,
+                 backoff: float = 1.5, timeout: float = 900.0):
+        self.ec2 = ec2_client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._waits: Dict[str, Dict[str, List[_Wait]]] = {kind: {} for kind in KINDS}
+        self._interval = {kind: min_interval for kind in KINDS}
+        self._next_poll = {kind: 0.0 for kind in KINDS}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_client(cls, ec2_client, **options) -> 'ResourcePoller':
+        """Return the poller shared by everything using this client
+
+        options (intervals, timeout) only apply when the poller is first created.
+        """
+        with cls._shared_lock:
+            # Read the instance dict directly: a lazy client must not build itself just to be asked
+            poller = vars(ec2_client).get(cls.CLIENT_ATTRIBUTE)
+            if poller is None:
+                poller = cls(ec2_client, **options)
+                setattr(ec2_client, cls.CLIENT_ATTRIBUTE, poller)
+            return poller
+
+    def watch(self, kind: str, resource_id: str, ready: Optional[Iterable[str]] = None,
+              failed: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> Future:
+        """Register a wait and return a future resolving to the resource description"""
+        spec = KINDS[kind]
+        wait = _Wait(
+            kind,
+            resource_id,
+            tuple(ready) if ready is not None else spec.ready,
+            tuple(failed) if failed is not None else spec.failed,
+            time.monotonic() + (timeout if timeout is not None else self.timeout)
+        )
+        with self._cond:
+            self._waits[kind].setdefault(resource_id, []).append(wait)
+            self._interval[kind] = self.min_interval
+            self._next_poll[kind] = min(self._next_poll[kind], time.monotonic() + self.min_interval)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='resource-poller', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return wait.future
+
+    def wait_for(self, kind: str, resource_ids: List[str], ready: Optional[Iterable[str]] = None,
+                 failed: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> List[Dict]:
+        """Block until every resource is ready and return their descriptions in order"""
+        futures = [self.watch(kind, resource_id, ready, failed, timeout) for resource_id in resource_ids]
+        return [future.result() for future in futures]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not any(self._waits.values()):
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                due = [kind for kind, waits in self._waits.items() if waits and self._next_poll[kind] <= now]
+                if not due:
+                    wake = min(self._next_poll[kind] for kind, waits in self._waits.items() if waits)
+                    self._cond.wait(timeout=max(0.0, wake - now))
+                    continue
+                batches = {kind: list(self._waits[kind]) for kind in due}
+
+            for kind, resource_ids in batches.items():
+                changed = self._poll(kind, resource_ids)
+                with self._cond:
+                    if changed:
+                        self._interval[kind] = self.min_interval
+                    else:
+                        self._interval[kind] = min(self._interval[kind] * self.backoff, self.max_interval)
+                    self._next_poll[kind] = time.monotonic() + self._interval[kind]
+
+    def _poll(self, kind: str, resource_ids: List[str]) -> bool:
+        """Describe one kind in batches and settle any waits; return True if anything moved"""
+        spec = KINDS[kind]
+        batch_size = spec.batch_size or self.BATCH_SIZE
+        changed = False
+        for start in range(0, len(resource_ids), batch_size):
+            chunk = resource_ids[start:start + batch_size]
+            try:
+                described = self._describe(spec, chunk)
+            except Exception as e:
+                if _is_throttle(e):
+                    self.logger.warning(f"Throttled polling {kind}, backing off")
+                    continue
+                self.logger.error(f"Error polling {kind}: {str(e)}")
+                self._settle(kind, chunk, error=e)
+                changed = True
+                continue
+
+            for resource_id in chunk:
+                resource = described.get(resource_id)
+                if resource is not None and self._observe(kind, resource_id, spec.state(resource), resource):
+                    changed = True
+
+        self._expire(kind)
+        return changed
+
+    def _describe(self, spec: _Kind, resource_ids: List[str]) -> Dict[str, Dict]:
+        described = {}
+        if spec.ids_param:
+            params = {spec.ids_param: resource_ids}
+        else:
+            params = {spec.filter_param: [{'Name': spec.filter_name, 'Values': resource_ids}]}
+        while True:
+            response = getattr(self.ec2, spec.operation)(**params)
+            for resource in spec.extract(response):
+                described[resource[spec.id_key]] = resource
+            token = response.get('NextToken')
+            if not token:
+                return described
+            params['NextToken'] = token
+
+    def _observe(self, kind: str, resource_id: str, state: str, resource: Dict) -> bool:
+        with self._cond:
+            waits = self._waits[kind].get(resource_id, [])
+            moved = any(wait.state != state for wait in waits)
+            remaining = []
+            for wait in waits:
+                wait.state = state
+                if state in wait.ready:
+                    wait.future.set_result(resource)
+                elif state in wait.failed:
+                    wait.future.set_exception(ResourceFailed(kind, resource_id, state))
+                else:
+                    remaining.append(wait)
+            self._store(kind, resource_id, remaining)
+        return moved
+
+    def _settle(self, kind: str, resource_ids: List[str], error: Exception) -> None:
+        with self._cond:
+            for resource_id in resource_ids:
+                for wait in self._waits[kind].get(resource_id, []):
+                    wait.future.set_exception(error)
+                self._store(kind, resource_id, [])
+
+    def _expire(self, kind: str) -> None:
+        now = time.monotonic()
+        with self._cond:
+            for resource_id, waits in list(self._waits[kind].items()):
+                remaining = []
+                for wait in waits:
+                    if wait.deadline <= now:
+                        wait.future.set_exception(TimeoutError(
+                            f"Timed out waiting for {kind} {resource_id} (last state: {wait.state})"))
+                    else:
+                        remaining.append(wait)
+                self._store(kind, resource_id, remaining)
+
+    def _store(self, kind: str, resource_id: str, waits: List[_Wait]) -> None:
+        if waits:
+            self._waits[kind][resource_id] = waits
+        else:
+            self._waits[kind].pop(resource_id, None)
+
+
+def _status_checks(status: Dict) -> str:
+    """Combine an instance's system and instance status checks into one state"""
+    checks = {status['SystemStatus']['Status'], status['InstanceStatus']['Status']}
+    if 'impaired' in checks:
+        return 'impaired'
+    return 'ok' if checks <= {'ok', 'not-applicable'} else 'initializing'
+
+
+def _is_throttle(error: Exception) -> bool:
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+    return 'Throttl' in code or code == 'RequestLimitExceeded'
@@ -0,0 +1,155 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+import random
+import threading
+import time
+
+THROTTLE_CODES = {'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'RequestThrottled'}
+
+# EC2's documented request token buckets: (refill per second, bucket size)
+MUTATE_BUCKET = (5.0, 200)
+DESCRIBE_BUCKET = (20.0, 100)
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose refill rate adapts to throttling
+
+    Throttling halves the rate and drains the bucket (multiplicative
+    decrease); every successful call wins back a small share of the
+    configured rate (additive increase), so callers settle just under what
+    the endpoint will sustain.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping (with jitter) until one is available; return seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            # Jitter keeps waiting threads from waking in lockstep
+            delay *= random.uniform(1.0, 1.5)
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self) -> bool:
+        """Slow down; throttles from requests already in flight count once per second"""
+        with self._lock:
+            self._refill()
+            self._tokens = 0.0
+            if self._updated - self._last_decrease < 1.0:
+                return False
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._last_decrease = self._updated
+            return True
+
+    def succeeded(self) -> None:
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.01)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """Client-side request limiter for one region, shared by every client and thread
+
+    Mutating and describe calls draw from separate buckets, as EC2 meters
+    them separately. A token is taken before every HTTP attempt, including
+    botocore's retries, and each attempt's outcome feeds the bucket's rate.
+    """
+
+    _shared: Dict[str, 'RateLimiter'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, mutate: Tuple[float, int] = MUTATE_BUCKET, describe: Tuple[float, int] = DESCRIBE_BUCKET):
+        self.mutate = TokenBucket(*mutate)
+        self.describe = TokenBucket(*describe)
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_region(cls, region: str) -> 'RateLimiter':
+        """Return the limiter shared by everything calling this region"""
+        with cls._shared_lock:
+            if region not in cls._shared:
+                cls._shared[region] = cls()
+            return cls._shared[region]
+
+    def attach(self, client):
+        """Register on a boto3 client's events and return the client"""
+        events = client.meta.events
+        events.register('before-send.ec2.*', self._before_send, unique_id=f'ratelimit-send-{id(self)}')
+        events.register('needs-retry.ec2.*', self._observe, unique_id=f'ratelimit-retry-{id(self)}')
+        return client
+
+    def bucket(self, operation: str) -> TokenBucket:
+        return self.describe if operation.startswith(('Describe', 'Get', 'List')) else self.mutate
+
+    def _before_send(self, event_name: str, **kwargs) -> None:
+        operation = event_name.rsplit('.', 1)[-1]
+        waited = self.bucket(operation).acquire()
+        if waited > 1:
+            self.logger.debug(f"Waited {waited:.1f}s for a {operation} token")
+
+    def _observe(self, event_name: str, response, **kwargs) -> None:
+        """Adjust the bucket from each attempt's outcome; never decides whether to retry"""
+        if response is None:
+            return
+        bucket = self.bucket(event_name.rsplit('.', 1)[-1])
+        code = response[1].get('Error', {}).get('Code', '')
+        if code in THROTTLE_CODES:
+            if bucket.throttled():
+                self.logger.warning(f"Throttled ({code}), slowing to {bucket.rate:.2f} requests/s")
+        elif not code:
+            bucket.succeeded()
+
+
+def create_ec2_client(region: str, max_pool_connections: int = 10, max_attempts: int = 10,
+                      limiter: Optional[RateLimiter] = None):
+    """An EC2 client with standard (jittered, throttle-aware) retries and the region's shared limiter"""
+    # Deferred so commands that never reach AWS do not pay for loading botocore
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=max_pool_connections,
+        retries={'mode': 'standard', 'max_attempts': max_attempts}
+    )
+    client = boto3.client('ec2', region_name=region, config=config)
+    return (limiter or RateLimiter.for_region(region)).attach(client)
+
+
+class LazyClient:
+    """Stand-in that builds the real client on first use
+
+    Commands that can be answered locally (offline plans, cached listings)
+    never import boto3 or load the EC2 model.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
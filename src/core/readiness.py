@@ -0,0 +1,202 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+import asyncio
+import logging
+import queue
+import re
+import socket
+import threading
+import time
+
+from src.core.poller import ResourcePoller
+
+# Stages in the order an instance passes them; 'failed' ends an instance early
+STAGES = ('running', 'status_ok', 'ready')
+
+# cloud-init's last line on the serial console once every boot script has run
+CLOUD_INIT_FINISHED = r'Cloud-init v\. \S+ finished at'
+
+
+class TcpProbe:
+    """Ready once a TCP connection to port succeeds, on the public address if there is one"""
+
+    def __init__(self, port: int, connect_timeout: float = 2.0):
+        self.port = port
+        self.connect_timeout = connect_timeout
+
+    def __str__(self) -> str:
+        return f'tcp:{self.port}'
+
+    def check(self, ec2_client, instance: Dict) -> bool:
+        address = instance.get('PublicIpAddress') or instance.get('PrivateIpAddress')
+        if not address:
+            return False
+        try:
+            with socket.create_connection((address, self.port), timeout=self.connect_timeout):
+                return True
+        except OSError:
+            return False
+
+
+class ConsoleProbe:
+    """Ready once the serial console shows a marker, by default cloud-init finishing
+
+    Needs no network path to the instance, so it suits private subnets.
+    EC2 refreshes console output every few minutes, so it lags the boot.
+    """
+
+    def __init__(self, pattern: str = CLOUD_INIT_FINISHED):
+        self.pattern = re.compile(pattern)
+
+    def __str__(self) -> str:
+        return 'cloud-init' if self.pattern.pattern == CLOUD_INIT_FINISHED else f'console:{self.pattern.pattern}'
+
+    def check(self, ec2_client, instance: Dict) -> bool:
+        output = ec2_client.get_console_output(InstanceId=instance['InstanceId'], Latest=True).get('Output', '')
+        return bool(output) and bool(self.pattern.search(output))
+
+
+Probe = Union[TcpProbe, ConsoleProbe]
+
+
+def probe_from_config(readiness: Union[Dict, bool, None], default: Optional[Probe]) -> Optional[Probe]:
+    """A workload's 'readiness' setting: {"tcp": port}, {"console": regex}, {"cloud_init": true} or false"""
+    if readiness is None or readiness is True:
+        return default
+    if readiness is False:
+        return None
+    if 'tcp' in readiness:
+        return TcpProbe(int(readiness['tcp']))
+    if 'console' in readiness:
+        return ConsoleProbe(readiness['console'])
+    if readiness.get('cloud_init'):
+        return ConsoleProbe()
+    raise ValueError(f"Unknown readiness probe {readiness}")
+
+
+class ReadinessPipeline:
+    """Stream instances through running, status checks and a workload probe as each one gets there
+
+    Running and status-check waits ride the shared ResourcePoller, so every
+    instance in flight costs one batched describe per kind per interval.
+    Probes run on a small thread pool. Events arrive in completion order,
+    so a caller can act on the first ready instance instead of the slowest.
+    """
+
+    def __init__(self, ec2_client, timeout: float = 900.0, probe_interval: float = 5.0,
+                 max_probes: int = 16):
+        self.ec2 = ec2_client
+        self.timeout = timeout
+        self.probe_interval = probe_interval
+        self.max_probes = max_probes
+        self.poller = ResourcePoller.for_client(ec2_client)
+        self.logger = logging.getLogger(__name__)
+
+    def stream(self, instance_ids: List[str], probe: Optional[Probe] = None,
+               **labels: str) -> Iterator[Dict]:
+        """Yield one event per instance per stage passed, ending with 'ready' or 'failed'
+
+        Events are dicts with instance_id, stage, elapsed_seconds and any labels.
+        A failure carries probe only when the instance came up but its probe never passed.
+        """
+        instance_ids = list(dict.fromkeys(instance_ids))
+        if not instance_ids:
+            return
+        events: 'queue.Queue[Dict]' = queue.Queue()
+        stopped = threading.Event()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        probes = ThreadPoolExecutor(max_workers=min(len(instance_ids), self.max_probes),
+                                    thread_name_prefix='readiness-probe')
+
+        def emit(instance_id: str, stage: str, **details) -> None:
+            events.put({'instance_id': instance_id, 'stage': stage,
+                        'elapsed_seconds': round(time.monotonic() - start, 1), **labels, **details})
+
+        def on_running(instance_id: str, future: Future) -> None:
+            try:
+                instance = future.result()
+            except Exception as e:
+                emit(instance_id, 'failed', error=str(e))
+                return
+            address = instance.get('PublicIpAddress') or instance.get('PrivateIpAddress')
+            emit(instance_id, 'running', **({'address': address} if address else {}))
+            status = self.poller.watch('instance_status', instance_id, timeout=max(0.0, deadline - time.monotonic()))
+            status.add_done_callback(lambda f: on_status(instance, f))
+
+        def on_status(instance: Dict, future: Future) -> None:
+            try:
+                future.result()
+            except Exception as e:
+                emit(instance['InstanceId'], 'failed', error=str(e))
+                return
+            emit(instance['InstanceId'], 'status_ok')
+            if probe is None:
+                emit(instance['InstanceId'], 'ready')
+            else:
+                probes.submit(run_probe, instance)
+
+        def run_probe(instance: Dict) -> None:
+            while True:
+                try:
+                    if probe.check(self.ec2, instance):
+                        emit(instance['InstanceId'], 'ready', probe=str(probe))
+                        return
+                except Exception as e:
+                    self.logger.debug(f"Probe {probe} on {instance['InstanceId']} raised {e}")
+                if time.monotonic() + self.probe_interval > deadline:
+                    emit(instance['InstanceId'], 'failed', probe=str(probe),
+                         error=f"probe {probe} did not pass in {self.timeout:.0f}s")
+                    return
+                # Returns early once the caller stops listening
+                if stopped.wait(self.probe_interval):
+                    return
+
+        try:
+            for instance_id in instance_ids:
+                self.poller.watch('instance', instance_id, timeout=self.timeout).add_done_callback(
+                    lambda f, instance_id=instance_id: on_running(instance_id, f))
+
+            remaining = set(instance_ids)
+            while remaining:
+                event = events.get()
+                if event['stage'] in ('ready', 'failed'):
+                    remaining.discard(event['instance_id'])
+                yield event
+        finally:
+            stopped.set()
+            probes.shutdown(wait=False, cancel_futures=True)
+
+    async def astream(self, instance_ids: List[str], probe: Optional[Probe] = None,
+                      **labels: str) -> AsyncIterator[Dict]:
+        """stream() as an async iterator; the waiting happens off the event loop"""
+        loop = asyncio.get_running_loop()
+        events = self.stream(instance_ids, probe, **labels)
+        while True:
+            event = await loop.run_in_executor(None, next, events, None)
+            if event is None:
+                return
+            yield event
+
+
+def merge_streams(streams: List[Iterator[Dict]]) -> Iterator[Dict]:
+    """Interleave several event streams (e.g. one per workload) in arrival order"""
+    events: 'queue.Queue[Optional[Dict]]' = queue.Queue()
+
+    def drain(stream: Iterator[Dict]) -> None:
+        try:
+            for event in stream:
+                events.put(event)
+        finally:
+            events.put(None)
+
+    for stream in streams:
+        threading.Thread(target=drain, args=(stream,), name='readiness-merge', daemon=True).start()
+
+    open_streams = len(streams)
+    while open_streams:
+        event = events.get()
+        if event is None:
+            open_streams -= 1
+        else:
+            yield event
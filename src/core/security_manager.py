@@ -1,136 +1,182 @@
-from typing import Dict, List
-import boto3
+from typing import Dict, List, Optional, Set
 import logging
 
+from src.core.dag import DAGScheduler
+from src.core.inventory import NullInventory, env_scope
+from src.core.sg_rules import RULES_PER_GROUP_LIMIT, Rule, compile_rules, diff_rules, from_described, to_permissions
+from src.core.snapshot import describe_all
+from src.core.tagging import TagContext
+
+# Groups used when a config does not declare its own 'security_groups'
+DEFAULT_SECURITY_GROUPS = {
+    'api': {
+        'description': 'Security group for API servers',
+        'ingress': [
+            {'protocol': 'tcp', 'ports': [80, 443], 'cidrs': ['0.0.0.0/0']},
+            {'protocol': 'tcp', 'ports': [22], 'cidrs': ['10.0.0.0/16']}
+        ]
+    },
+    'database': {
+        'description': 'Security group for database servers',
+        'ingress': [
+            {'protocol': 'tcp', 'ports': [5432], 'groups': ['api']},
+            {'protocol': 'tcp', 'ports': [22], 'cidrs': ['10.0.0.0/16']}
+        ]
+    },
+    'workflow': {
+        'description': 'Security group for workflow servers',
+        'ingress': [
+            {'protocol': 'tcp', 'ports': [8080], 'groups': ['api']},
+            {'protocol': 'tcp', 'ports': [22], 'cidrs': ['10.0.0.0/16']}
+        ]
+    }
+}
+
 class SecurityManager:
-    def __init__(self, ec2_client):
+    def __init__(self, ec2_client, tags: Optional[TagContext] = None, inventory: Optional[NullInventory] = None,
+                 region: Optional[str] = None, groups: Optional[Dict[str, Dict]] = None):
         self.ec2 = ec2_client
+        self.tags = tags or TagContext()
+        self.inventory = inventory or NullInventory()
+        self.region = region
+        self.groups = groups or DEFAULT_SECURITY_GROUPS
         self.logger = logging.getLogger(__name__)
 
-    def create_security_groups(self, vpc_id: str) -> Dict[str, str]:
+        for name in self.groups:
+            unknown = set(self.references(name)) - set(self.groups)
+            if unknown:
+                raise ValueError(f"Security group {name} references undeclared groups: {sorted(unknown)}")
+
+    def create_security_groups(self, vpc_id: str, max_workers: int = 8) -> Dict[str, str]:
         """Create security groups for different components"""
         try:
-            security_groups = {}
-            
-            # Create API Security Group
-            security_groups['api'] = self._create_api_security_group(vpc_id)
-            
-            # Create Database Security Group
-            security_groups['database'] = self._create_database_security_group(vpc_id, security_groups['api'])
-            
-            # Create Workflow Security Group
-            security_groups['workflow'] = self._create_workflow_security_group(vpc_id, security_groups['api'])
-            
-            return security_groups
-            
+            graph = DAGScheduler(max_workers)
+            graph.add('vpc', lambda r: vpc_id)
+            self.add_security_group_nodes(graph)
+            results = graph.run()
+            return self.security_group_ids(results)
+
         except Exception as e:
             self.logger.error(f"Error creating security groups: {str(e)}")
             raise
 
-    def _create_api_security_group(self, vpc_id: str) -> str:
-        """Create security group for API servers"""
+    def add_security_group_nodes(self, graph: DAGScheduler) -> None:
+        """Register security group steps on a graph that already has a 'vpc' node
+
+        Every group only needs the VPC, so all of them are created together;
+        a group's ingress waits only for the groups its rules reference.
+        """
+        for name, group in self.groups.items():
+            graph.add(f'sg:{name}', lambda r, name=name, group=group: self._create_security_group(
+                r['vpc'], self.group_name(name), group.get('description', f'Security group for {name} servers')),
+                ['vpc'])
+            graph.add(f'sg_ingress:{name}',
+                      lambda r, name=name: self._authorize_ingress(r[f'sg:{name}'], self.desired_rules(name, r)),
+                      [f'sg:{name}'] + [f'sg:{ref}' for ref in self.references(name)])
+
+    def references(self, name: str) -> List[str]:
+        """Other groups named as sources in a group's ingress"""
+        refs = {ref for entry in self.groups[name].get('ingress', []) for ref in entry.get('groups', [])}
+        return sorted(refs - {name})
+
+    def desired_rules(self, name: str, results: Dict) -> Set[Rule]:
+        """Compile a group's declared ingress against the group IDs in graph results"""
+        group_ids = {ref: results[f'sg:{ref}'] for ref in self.references(name) + [name]}
+        return compile_rules(self.groups[name].get('ingress', []), group_ids)
+
+    def group_name(self, workload: str) -> str:
+        """Security group names are unique per VPC, so qualify them with the environment"""
+        return self.tags.name(f'{workload}-servers')
+
+    @staticmethod
+    def security_group_ids(results: Dict) -> Dict[str, str]:
+        """Map workload names to group IDs from graph results"""
+        return {
+            name.split(':', 1)[1]: group_id
+            for name, group_id in results.items()
+            if name.startswith('sg:')
+        }
+
+    def existing_rules(self, group_ids: List[str], fresh: bool = True) -> Dict[str, Dict[Rule, str]]:
+        """Current ingress rules of several groups, read with one paginated call unless cached and not fresh"""
+        existing: Dict[str, Dict[Rule, str]] = {group_id: {} for group_id in group_ids}
+        if not group_ids:
+            return existing
+
+        rules = self.inventory.list(
+            self.region,
+            'security_group_rules',
+            # The listing is only valid for this exact set of groups
+            f"groups:{','.join(sorted(group_ids))}",
+            lambda: describe_all(
+                self.ec2,
+                'describe_security_group_rules',
+                'SecurityGroupRules',
+                Filters=[{'Name': 'group-id', 'Values': group_ids}]
+            ),
+            fresh
+        )
+        for rule in rules:
+            if not rule.get('IsEgress'):
+                existing[rule['GroupId']][from_described(rule)] = rule['SecurityGroupRuleId']
+        return existing
+
+    def sync_ingress(self, group_id: str, desired: Set[Rule], existing: Dict[Rule, str]) -> None:
+        """Revoke and authorize only the difference between existing and desired rules"""
+        authorize, revoke = diff_rules(desired, existing)
         try:
-            api_sg = self.ec2.create_security_group(
-                GroupName='api-servers',
-                Description='Security group for API servers',
-                VpcId=vpc_id
-            )
-            
-            # Add inbound rules
-            self.ec2.authorize_security_group_ingress(
-                GroupId=api_sg['GroupId'],
-                IpPermissions=[
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 80,
-                        'ToPort': 80,
-                        'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
-                    },
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 443,
-                        'ToPort': 443,
-                        'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
-                    },
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 22,
-                        'ToPort': 22,
-                        'IpRanges': [{'CidrIp': '10.0.0.0/16'}]
-                    }
-                ]
-            )
-            
-            return api_sg['GroupId']
-            
+            # Revoke first so the group never holds both rule sets against its limit
+            if revoke:
+                self.ec2.revoke_security_group_ingress(GroupId=group_id, SecurityGroupRuleIds=revoke)
+                self.inventory.invalidate(self.region, 'security_groups')
+                self.inventory.invalidate(self.region, 'security_group_rules')
+
         except Exception as e:
-            self.logger.error(f"Error creating API security group: {str(e)}")
+            self.logger.error(f"Error revoking ingress for {group_id}: {str(e)}")
             raise
 
-    def _create_database_security_group(self, vpc_id: str, api_sg_id: str) -> str:
-        """Create security group for database servers"""
+        self._authorize_ingress(group_id, authorize)
+
+    def _create_security_group(self, vpc_id: str, name: str, description: str) -> str:
+        """Create an empty security group"""
         try:
-            db_sg = self.ec2.create_security_group(
-                GroupName='database-servers',
-                Description='Security group for database servers',
-                VpcId=vpc_id
+            tag_specs = self.tags.specs('security-group', Name=name)
+            group = self.ec2.create_security_group(
+                GroupName=name,
+                Description=description,
+                VpcId=vpc_id,
+                TagSpecifications=tag_specs
             )
-            
-            # Add inbound rules
-            self.ec2.authorize_security_group_ingress(
-                GroupId=db_sg['GroupId'],
-                IpPermissions=[
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 5432,
-                        'ToPort': 5432,
-                        'UserIdGroupPairs': [{'GroupId': api_sg_id}]
-                    },
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 22,
-                        'ToPort': 22,
-                        'IpRanges': [{'CidrIp': '10.0.0.0/16'}]
-                    }
-                ]
+            self.inventory.put(
+                self.region,
+                'security_groups',
+                {'GroupId': group['GroupId'], 'GroupName': name, 'Description': description, 'VpcId': vpc_id,
+                 'IpPermissions': [], 'Tags': tag_specs[0]['Tags']},
+                [env_scope(self.tags.env)]
             )
-            
-            return db_sg['GroupId']
-            
+            return group['GroupId']
+
         except Exception as e:
-            self.logger.error(f"Error creating database security group: {str(e)}")
+            self.logger.error(f"Error creating security group {name}: {str(e)}")
             raise
 
-    def _create_workflow_security_group(self, vpc_id: str, api_sg_id: str) -> str:
-        """Create security group for workflow servers"""
-        try:
-            workflow_sg = self.ec2.create_security_group(
-                GroupName='workflow-servers',
-                Description='Security group for workflow servers',
-                VpcId=vpc_id
+    def _authorize_ingress(self, group_id: str, rules: Set[Rule]) -> None:
+        """Authorize every rule in one call"""
+        if not rules:
+            return
+        if len(rules) > RULES_PER_GROUP_LIMIT:
+            self.logger.warning(
+                f"{group_id} needs {len(rules)} ingress rules, above the default limit of {RULES_PER_GROUP_LIMIT}"
             )
-            
-            # Add inbound rules
+
+        try:
             self.ec2.authorize_security_group_ingress(
-                GroupId=workflow_sg['GroupId'],
-                IpPermissions=[
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 8080,
-                        'ToPort': 8080,
-                        'UserIdGroupPairs': [{'GroupId': api_sg_id}]
-                    },
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 22,
-                        'ToPort': 22,
-                        'IpRanges': [{'CidrIp': '10.0.0.0/16'}]
-                    }
-                ]
+                GroupId=group_id,
+                IpPermissions=to_permissions(rules)
             )
-            
-            return workflow_sg['GroupId']
-            
+            self.inventory.invalidate(self.region, 'security_groups')
+            self.inventory.invalidate(self.region, 'security_group_rules')
+
         except Exception as e:
-            self.logger.error(f"Error creating workflow security group: {str(e)}")
+            self.logger.error(f"Error authorizing ingress for {group_id}: {str(e)}")
             raise
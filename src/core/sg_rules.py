@@ -0,0 +1,119 @@
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+import ipaddress
+
+# Protocols whose FromPort/ToPort are a port range that can be merged
+PORT_PROTOCOLS = {'tcp', 'udp'}
+
+PROTOCOL_ALIASES = {'all': '-1', '6': 'tcp', '17': 'udp', '1': 'icmp'}
+
+# Default inbound rules per group; the quota can be raised, so this only warns
+RULES_PER_GROUP_LIMIT = 60
+
+
+class Rule(NamedTuple):
+    """One normalized ingress rule: a protocol, a port range and a single source
+
+    kind is 'cidr', 'cidr6' or 'group'; source is the CIDR or the group ID.
+    """
+    protocol: str
+    from_port: int
+    to_port: int
+    kind: str
+    source: str
+
+
+def parse_ports(ports) -> Tuple[int, int]:
+    """Accept 443, '443' or '8000-8100'"""
+    if isinstance(ports, int):
+        return ports, ports
+    low, _, high = str(ports).partition('-')
+    return int(low), int(high or low)
+
+
+def compile_rules(ingress: Iterable[Dict], group_ids: Dict[str, str]) -> Set[Rule]:
+    """Compile declared ingress entries into a minimal set of rules
+
+    Each entry names a protocol, ports and any mix of 'cidrs' and 'groups'
+    (other group names from the same config, resolved through group_ids).
+    Duplicate sources are dropped, overlapping or adjacent port ranges for
+    the same source are merged, and CIDRs that together cover a larger
+    block are collapsed into it.
+    """
+    by_source: Dict[Tuple[str, str, str], List[Tuple[int, int]]] = {}
+    for entry in ingress:
+        protocol = str(entry.get('protocol', 'tcp')).lower()
+        protocol = PROTOCOL_ALIASES.get(protocol, protocol)
+        if protocol == '-1':
+            ranges = [(-1, -1)]
+        else:
+            ranges = [parse_ports(p) for p in entry.get('ports', [])]
+
+        sources = [('cidr6' if ':' in cidr else 'cidr', str(ipaddress.ip_network(cidr, strict=False)))
+                   for cidr in entry.get('cidrs', [])]
+        sources += [('group', group_ids[name]) for name in entry.get('groups', [])]
+
+        for kind, source in sources:
+            by_source.setdefault((protocol, kind, source), []).extend(ranges)
+
+    # Merge port ranges per source, then collapse CIDRs per port range
+    by_ports: Dict[Tuple[str, int, int, str], Set[str]] = {}
+    for (protocol, kind, source), ranges in by_source.items():
+        merged = merge_ranges(ranges) if protocol in PORT_PROTOCOLS else set(ranges)
+        for from_port, to_port in merged:
+            by_ports.setdefault((protocol, from_port, to_port, kind), set()).add(source)
+
+    rules: Set[Rule] = set()
+    for (protocol, from_port, to_port, kind), sources in by_ports.items():
+        if kind != 'group':
+            sources = {str(n) for n in ipaddress.collapse_addresses(ipaddress.ip_network(s) for s in sources)}
+        rules.update(Rule(protocol, from_port, to_port, kind, source) for source in sources)
+    return rules
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    """Merge overlapping and adjacent (e.g. 80-80 and 81-81) port ranges"""
+    merged: List[List[int]] = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return {(low, high) for low, high in merged}
+
+
+def to_permissions(rules: Iterable[Rule]) -> List[Dict]:
+    """Group rules into IpPermissions, one entry per protocol and port range"""
+    permissions: Dict[Tuple[str, int, int], Dict] = {}
+    for rule in sorted(rules):
+        permission = permissions.setdefault((rule.protocol, rule.from_port, rule.to_port), {
+            'IpProtocol': rule.protocol,
+            **({} if rule.protocol == '-1' else {'FromPort': rule.from_port, 'ToPort': rule.to_port})
+        })
+        if rule.kind == 'cidr':
+            permission.setdefault('IpRanges', []).append({'CidrIp': rule.source})
+        elif rule.kind == 'cidr6':
+            permission.setdefault('Ipv6Ranges', []).append({'CidrIpv6': rule.source})
+        else:
+            permission.setdefault('UserIdGroupPairs', []).append({'GroupId': rule.source})
+    return list(permissions.values())
+
+
+def from_described(rule: Dict) -> Rule:
+    """Normalize one describe_security_group_rules entry"""
+    protocol = PROTOCOL_ALIASES.get(rule['IpProtocol'], rule['IpProtocol'])
+    from_port, to_port = rule.get('FromPort', -1), rule.get('ToPort', -1)
+    if 'CidrIpv4' in rule:
+        return Rule(protocol, from_port, to_port, 'cidr', rule['CidrIpv4'])
+    if 'CidrIpv6' in rule:
+        return Rule(protocol, from_port, to_port, 'cidr6', rule['CidrIpv6'])
+    if 'ReferencedGroupInfo' in rule:
+        return Rule(protocol, from_port, to_port, 'group', rule['ReferencedGroupInfo']['GroupId'])
+    # Prefix lists are never declared in config, so they are always revoked
+    return Rule(protocol, from_port, to_port, 'prefix-list', rule.get('PrefixListId', ''))
+
+
+def diff_rules(desired: Set[Rule], existing: Dict[Rule, str]) -> Tuple[Set[Rule], List[str]]:
+    """Rules to authorize and rule IDs to revoke to turn existing into desired"""
+    authorize = desired - set(existing)
+    revoke = [rule_id for rule, rule_id in existing.items() if rule not in desired]
+    return authorize, revoke
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from src.core.inventory import NullInventory, env_scope
+
+
+# (operation, response key, name of the filter parameter)
+DESCRIBES = {
+    'vpcs': ('describe_vpcs', 'Vpcs', 'Filters'),
+    'subnets': ('describe_subnets', 'Subnets', 'Filters'),
+    'route_tables': ('describe_route_tables', 'RouteTables', 'Filters'),
+    'internet_gateways': ('describe_internet_gateways', 'InternetGateways', 'Filters'),
+    'nat_gateways': ('describe_nat_gateways', 'NatGateways', 'Filter'),
+    'addresses': ('describe_addresses', 'Addresses', 'Filters'),
+    'security_groups': ('describe_security_groups', 'SecurityGroups', 'Filters'),
+    'instances': ('describe_instances', 'Reservations', 'Filters'),
+    'placement_groups': ('describe_placement_groups', 'PlacementGroups', 'Filters'),
+}
+
+# Resources in these states are gone or going and never count as existing
+LIVE_STATES = {
+    'nat_gateways': ['pending', 'available'],
+    'instances': ['pending', 'running'],
+    'placement_groups': ['pending', 'available'],
+}
+
+
+def tag_value(resource: Dict, key: str) -> Optional[str]:
+    for tag in resource.get('Tags', []):
+        if tag['Key'] == key:
+            return tag['Value']
+    return None
+
+
+class EnvironmentSnapshot:
+    """Every resource tagged with an environment, gathered with one describe call per type"""
+
+    def __init__(self, env: str, resources: Dict[str, List[Dict]]):
+        self.env = env
+        self.resources = resources
+
+    @classmethod
+    def capture(cls, ec2_client, env: str, kinds: Optional[Iterable[str]] = None,
+                states: Optional[Dict[str, List[str]]] = None, max_workers: int = 8,
+                region: Optional[str] = None, inventory: Optional[NullInventory] = None,
+                fresh: bool = False) -> 'EnvironmentSnapshot':
+        """Describe every resource kind concurrently, filtered to the environment's tags
+
+        With an inventory, listings still within their TTL are served locally
+        unless fresh is set. Custom state filters always go to the API.
+        """
+        logger = logging.getLogger(__name__)
+        kinds = list(kinds or DESCRIBES)
+        inventory = inventory if inventory is not None and states is None else NullInventory()
+        states = LIVE_STATES if states is None else states
+
+        def describe(kind: str) -> List[Dict]:
+            operation, key, filter_param = DESCRIBES[kind]
+            filters = [
+                {'Name': 'tag:Environment', 'Values': [env]},
+                {'Name': 'tag:ManagedBy', 'Values': ['awsenv']}
+            ]
+            if kind in states:
+                filters.append({'Name': 'instance-state-name' if kind == 'instances' else 'state',
+                                'Values': states[kind]})
+
+            def fetch() -> List[Dict]:
+                items = describe_all(ec2_client, operation, key, **{filter_param: filters})
+                if kind == 'instances':
+                    items = [i for r in items for i in r['Instances']]
+                return items
+
+            return inventory.list(region, kind, env_scope(env), fetch, fresh)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                described = dict(zip(kinds, pool.map(describe, kinds)))
+        except Exception as e:
+            logger.error(f"Error capturing snapshot of {env}: {str(e)}")
+            raise
+
+        return cls(env, described)
+
+    def of(self, kind: str, vpc_id: Optional[str] = None) -> List[Dict]:
+        """Resources of one kind, optionally limited to a VPC"""
+        resources = self.resources.get(kind, [])
+        if vpc_id is None:
+            return resources
+        if kind == 'internet_gateways':
+            return [igw for igw in resources
+                    if any(a['VpcId'] == vpc_id for a in igw.get('Attachments', []))]
+        return [resource for resource in resources if resource.get('VpcId') == vpc_id]
+
+    def find_vpc(self, cidr: str) -> Optional[Dict]:
+        matches = [vpc for vpc in self.of('vpcs') if vpc['CidrBlock'] == cidr]
+        return matches[0] if matches else None
+
+
+def describe_all(ec2_client, operation: str, key: str, **params) -> List[Dict]:
+    """Call a describe operation and follow NextToken until every page is read"""
+    items: List[Dict] = []
+    while True:
+        response = getattr(ec2_client, operation)(**params)
+        items.extend(response.get(key, []))
+        token = response.get('NextToken')
+        if not token:
+            return items
+        params['NextToken'] = token
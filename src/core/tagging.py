@@ -0,0 +1,35 @@
+from typing import Dict, List, Optional
+import uuid
+
+
+class TagContext:
+    """Environment-wide tags that every created resource carries"""
+
+    def __init__(self, env: Optional[str] = None, run_id: Optional[str] = None,
+                 extra: Optional[Dict[str, str]] = None):
+        self.env = env
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.extra = dict(extra or {})
+
+    def child(self, **extra: str) -> 'TagContext':
+        """Return a context that adds extra tags (e.g. Workload) to these ones"""
+        return TagContext(self.env, self.run_id, {**self.extra, **extra})
+
+    def name(self, *parts: str) -> str:
+        """Build a Name tag value prefixed with the environment"""
+        return '-'.join([self.env, *parts] if self.env else parts)
+
+    def as_dict(self, **extra: str) -> Dict[str, str]:
+        tags = {'ManagedBy': 'awsenv', 'RunId': self.run_id}
+        if self.env:
+            tags['Environment'] = self.env
+        tags.update(self.extra)
+        tags.update(extra)
+        return tags
+
+    def tags(self, **extra: str) -> List[Dict[str, str]]:
+        return [{'Key': key, 'Value': value} for key, value in self.as_dict(**extra).items()]
+
+    def specs(self, *resource_types: str, **extra: str) -> List[Dict]:
+        """TagSpecifications so resources are tagged atomically at creation"""
+        return [{'ResourceType': resource_type, 'Tags': self.tags(**extra)} for resource_type in resource_types]
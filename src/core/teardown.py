@@ -0,0 +1,179 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import logging
+
+from src.core.dag import DAGScheduler
+from src.core.inventory import NullInventory
+from src.core.poller import ResourcePoller
+from src.core.snapshot import EnvironmentSnapshot, describe_all
+
+# Everything that still has to be deleted (or waited on) during teardown
+TEARDOWN_STATES = {
+    'instances': ['pending', 'running', 'stopping', 'stopped', 'shutting-down'],
+    'nat_gateways': ['pending', 'available', 'deleting'],
+    'placement_groups': ['pending', 'available'],
+}
+
+# Error codes meaning a previous teardown already did this; most such codes end in NotFound
+ALREADY_GONE = ('InvalidPlacementGroup.Unknown',)
+
+
+class EnvironmentTeardown:
+    """Delete every resource tagged with an environment in reverse dependency order
+
+    Each resource type is one step, so everything in a layer (all subnets,
+    all route tables, all security groups) is deleted together, and the slow
+    waits (instance termination, NAT gateway deletion) are a single batched
+    wait each.
+    """
+
+    def __init__(self, ec2_client, env: str, region: str, inventory: Optional[NullInventory] = None,
+                 max_workers: int = 8):
+        self.ec2 = ec2_client
+        self.env = env
+        self.region = region
+        self.inventory = inventory or NullInventory()
+        self.max_workers = max_workers
+        self.poller = ResourcePoller.for_client(ec2_client)
+        self.logger = logging.getLogger(__name__)
+
+    def plan(self, snapshot: Optional[EnvironmentSnapshot] = None) -> DAGScheduler:
+        """Build the teardown graph from a fresh snapshot of the environment"""
+        snapshot = snapshot or EnvironmentSnapshot.capture(self.ec2, self.env, states=TEARDOWN_STATES)
+        graph = DAGScheduler(self.max_workers)
+
+        def add(name: str, ids: List[str], func: Callable[[List[str]], None], deps: List[str] = ()) -> None:
+            if ids:
+                graph.add(name, lambda r: func(ids), [dep for dep in deps if dep in graph.nodes])
+
+        instance_ids = [i['InstanceId'] for i in snapshot.of('instances')]
+        nat_ids = [n['NatGatewayId'] for n in snapshot.of('nat_gateways')]
+        group_ids = [g['GroupId'] for g in snapshot.of('security_groups')]
+
+        add('instances', instance_ids, self._terminate_instances)
+        add('nat_gateways', nat_ids, lambda ids: self._delete_nat_gateways(ids, snapshot.of('nat_gateways')))
+        add('addresses', [a['AllocationId'] for a in snapshot.of('addresses')], self._release_addresses,
+            ['nat_gateways', 'instances'])
+        add('route_tables', [rt['RouteTableId'] for rt in snapshot.of('route_tables')
+                             if not any(a.get('Main') for a in rt.get('Associations', []))],
+            lambda ids: self._delete_route_tables(ids, snapshot.of('route_tables')))
+        add('security_group_references', group_ids, self._revoke_group_references)
+        add('security_groups', group_ids, self._delete_security_groups,
+            ['instances', 'security_group_references'])
+        add('subnets', [s['SubnetId'] for s in snapshot.of('subnets')], self._delete_subnets,
+            ['instances', 'nat_gateways', 'route_tables'])
+        # Detaching fails while the VPC still has public addresses mapped
+        add('internet_gateways', [igw['InternetGatewayId'] for igw in snapshot.of('internet_gateways')],
+            lambda ids: self._delete_internet_gateways(ids, snapshot.of('internet_gateways')),
+            ['instances', 'nat_gateways', 'addresses'])
+        add('placement_groups', [g['GroupName'] for g in snapshot.of('placement_groups')],
+            self._delete_placement_groups, ['instances'])
+        add('vpcs', [v['VpcId'] for v in snapshot.of('vpcs')], self._delete_vpcs, list(graph.nodes))
+        return graph
+
+    def run(self, graph: Optional[DAGScheduler] = None) -> Dict:
+        """Run the teardown graph and return its timing report"""
+        self.logger.info(f"Destroying {self.env} in {self.region}")
+        graph = graph or self.plan()
+        try:
+            graph.run()
+            graph.log_report(self.logger)
+            return graph.report()
+
+        except Exception as e:
+            self.logger.error(f"Error destroying {self.env}: {str(e)}")
+            raise
+
+        finally:
+            self.inventory.invalidate(self.region)
+
+    def _each(self, ids: List[str], call: Callable[[str], None]) -> None:
+        """Make one delete call per resource concurrently, tolerating ones already gone"""
+        def delete(resource_id: str) -> None:
+            try:
+                call(resource_id)
+            except Exception as e:
+                if not _is_missing(e):
+                    raise
+
+        if not ids:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ids))) as pool:
+            list(pool.map(delete, ids))
+
+    def _terminate_instances(self, instance_ids: List[str]) -> None:
+        for start in range(0, len(instance_ids), 1000):
+            self.ec2.terminate_instances(InstanceIds=instance_ids[start:start + 1000])
+        self.poller.wait_for('instance', instance_ids, ready=('terminated',), failed=())
+
+    def _delete_nat_gateways(self, nat_ids: List[str], nat_gateways: List[Dict]) -> None:
+        # Gateways an earlier teardown started deleting only need waiting on
+        deleting = {nat['NatGatewayId'] for nat in nat_gateways if nat['State'] in ('deleting', 'deleted')}
+        self._each([nat_id for nat_id in nat_ids if nat_id not in deleting],
+                   lambda nat_id: self.ec2.delete_nat_gateway(NatGatewayId=nat_id))
+        self.poller.wait_for('nat_gateway', nat_ids, ready=('deleted',), failed=('failed',))
+
+    def _release_addresses(self, allocation_ids: List[str]) -> None:
+        self._each(allocation_ids, lambda allocation_id: self.ec2.release_address(AllocationId=allocation_id))
+
+    def _delete_route_tables(self, route_table_ids: List[str], route_tables: List[Dict]) -> None:
+        associations = [
+            a['RouteTableAssociationId']
+            for rt in route_tables if rt['RouteTableId'] in route_table_ids
+            for a in rt.get('Associations', []) if not a.get('Main')
+        ]
+        self._each(associations, lambda association_id: self.ec2.disassociate_route_table(
+            AssociationId=association_id))
+        self._each(route_table_ids, lambda route_table_id: self.ec2.delete_route_table(
+            RouteTableId=route_table_id))
+
+    def _revoke_group_references(self, group_ids: List[str]) -> None:
+        """Drop rules that reference other groups so the groups can be deleted in any order"""
+        rules = describe_all(
+            self.ec2,
+            'describe_security_group_rules',
+            'SecurityGroupRules',
+            Filters=[{'Name': 'group-id', 'Values': group_ids}]
+        )
+        by_group: Dict[str, List[str]] = {}
+        for rule in rules:
+            if 'ReferencedGroupInfo' in rule and not rule.get('IsEgress'):
+                by_group.setdefault(rule['GroupId'], []).append(rule['SecurityGroupRuleId'])
+        self._each(list(by_group), lambda group_id: self.ec2.revoke_security_group_ingress(
+            GroupId=group_id, SecurityGroupRuleIds=by_group[group_id]))
+
+    def _delete_security_groups(self, group_ids: List[str]) -> None:
+        self._each(group_ids, lambda group_id: self.ec2.delete_security_group(GroupId=group_id))
+
+    def _delete_subnets(self, subnet_ids: List[str]) -> None:
+        self._each(subnet_ids, lambda subnet_id: self.ec2.delete_subnet(SubnetId=subnet_id))
+
+    def _delete_internet_gateways(self, igw_ids: List[str], igws: List[Dict]) -> None:
+        def delete(igw: Dict) -> None:
+            for attachment in igw.get('Attachments', []):
+                try:
+                    self.ec2.detach_internet_gateway(InternetGatewayId=igw['InternetGatewayId'],
+                                                     VpcId=attachment['VpcId'])
+                except Exception as e:
+                    # An earlier teardown detached it but stopped before the delete
+                    if _error_code(e) != 'Gateway.NotAttached':
+                        raise
+            self.ec2.delete_internet_gateway(InternetGatewayId=igw['InternetGatewayId'])
+
+        by_id = {igw['InternetGatewayId']: igw for igw in igws}
+        self._each(igw_ids, lambda igw_id: delete(by_id[igw_id]))
+
+    def _delete_placement_groups(self, group_names: List[str]) -> None:
+        self._each(group_names, lambda group_name: self.ec2.delete_placement_group(GroupName=group_name))
+
+    def _delete_vpcs(self, vpc_ids: List[str]) -> None:
+        self._each(vpc_ids, lambda vpc_id: self.ec2.delete_vpc(VpcId=vpc_id))
+
+
+def _error_code(error: Exception) -> str:
+    return getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+
+
+def _is_missing(error: Exception) -> bool:
+    code = _error_code(error)
+    return code.endswith('NotFound') or code in ALREADY_GONE
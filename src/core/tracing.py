@@ -0,0 +1,215 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from src.core.dag import current_step
+from src.core.ratelimit import THROTTLE_CODES
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Span:
+    """One API call, from parameter handling to the parsed response"""
+
+    def __init__(self, operation: str, started: float, thread: int, args: Dict[str, Any]):
+        self.operation = operation
+        self.started = started
+        self.finished: Optional[float] = None
+        self.thread = thread
+        self.args = args
+        self.retries = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or self.started) - self.started
+
+
+class Tracer:
+    """Record a span for every API call made by the clients it is attached to
+
+    Hooks the botocore event system, so nothing in the managers changes. Each
+    span is tagged with the graph step and the project method that made the
+    call (calls from the ResourcePoller are waiter polls), plus the resource
+    it concerns. Retries and throttles are recorded as instant events inside
+    their call's span.
+    """
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.spans: List[Span] = []
+        self.events: List[Dict[str, Any]] = []
+        self.threads: Dict[int, str] = {}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def attach(self, client) -> Any:
+        """Register on a boto3 client's events and return the client"""
+        events = client.meta.events
+        events.register('provide-client-params.ec2.*', self._start, unique_id=f'trace-start-{id(self)}')
+        events.register('after-call.ec2.*', self._finish, unique_id=f'trace-finish-{id(self)}')
+        events.register('after-call-error.ec2.*', self._fail, unique_id=f'trace-fail-{id(self)}')
+        events.register('needs-retry.ec2.*', self._outcome, unique_id=f'trace-outcome-{id(self)}')
+        events.register('request-created.ec2.*', self._retry, unique_id=f'trace-retry-{id(self)}')
+        return client
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Time, calls, errors and retries per operation, slowest total first"""
+        rows: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            row = rows.setdefault(span.operation, {
+                'operation': span.operation, 'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                'errors': 0, 'retries': 0
+            })
+            row['calls'] += 1
+            row['total_seconds'] += span.duration
+            row['max_seconds'] = max(row['max_seconds'], span.duration)
+            row['errors'] += 1 if 'error' in span.args else 0
+            row['retries'] += span.retries
+
+        for row in rows.values():
+            row['mean_seconds'] = round(row['total_seconds'] / row['calls'], 3)
+            row['total_seconds'] = round(row['total_seconds'], 3)
+            row['max_seconds'] = round(row['max_seconds'], 3)
+        return sorted(rows.values(), key=lambda row: row['total_seconds'], reverse=True)
+
+    def summary_lines(self) -> List[str]:
+        lines = [f"{'operation':<36} {'calls':>6} {'total s':>9} {'mean s':>8} {'max s':>8} {'retries':>8} {'errors':>7}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['operation']:<36} {row['calls']:>6} {row['total_seconds']:>9} {row['mean_seconds']:>8} "
+                f"{row['max_seconds']:>8} {row['retries']:>8} {row['errors']:>7}"
+            )
+        return lines
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Trace Event Format, loadable in chrome://tracing and Perfetto"""
+        events: List[Dict[str, Any]] = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}}
+            for tid, name in self.threads.items()
+        ]
+        for span in self.spans:
+            method = span.args.get('method', '')
+            category = 'poll' if method.startswith('ResourcePoller') else (
+                'describe' if span.operation.startswith('Describe') else 'mutate')
+            events.append({
+                'name': span.operation, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': span.thread,
+                'ts': round(span.started * 1e6), 'dur': round(span.duration * 1e6), 'args': span.args
+            })
+        events.extend(self.events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: Path) -> None:
+        path.write_text(json.dumps(self.chrome_trace(), default=str))
+        self.logger.info(f"Wrote {len(self.spans)} spans to {path}")
+
+    def _now(self) -> float:
+        return time.monotonic() - self.origin
+
+    def _start(self, params: Dict, model, context: Dict, **kwargs) -> None:
+        thread = threading.current_thread()
+        args = {'method': _caller(), 'step': current_step.get()}
+        resource = _resource(params)
+        if resource:
+            args['resource'] = resource
+
+        span = Span(model.name, self._now(), thread.ident, {k: v for k, v in args.items() if v})
+        context['trace_span'] = span
+        with self._lock:
+            self.threads.setdefault(thread.ident, thread.name)
+            self.spans.append(span)
+
+    def _finish(self, parsed: Dict, context: Dict, **kwargs) -> None:
+        span = context.get('trace_span')
+        if span is None:
+            return
+        span.finished = self._now()
+        error = parsed.get('Error', {}).get('Code')
+        if error:
+            span.args['error'] = error
+            return
+
+        # A create call is about what it created; what it named becomes the parent
+        created = _created_resource(parsed)
+        if created:
+            if 'resource' in span.args:
+                span.args['parent'] = span.args['resource']
+            span.args['resource'] = created
+
+    def _fail(self, exception: Exception, context: Dict, **kwargs) -> None:
+        span = context.get('trace_span')
+        if span is not None:
+            span.finished = self._now()
+            span.args['error'] = type(exception).__name__
+
+    def _outcome(self, response, caught_exception, request_dict: Dict, **kwargs) -> None:
+        """Remember each attempt's error for the retry that may follow; never decides whether to retry"""
+        if caught_exception is not None:
+            code = type(caught_exception).__name__
+        elif response is not None and response[1].get('Error'):
+            code = response[1]['Error'].get('Code', '')
+        else:
+            return
+        request_dict.get('context', {})['trace_last_error'] = code
+
+    def _retry(self, request, **kwargs) -> None:
+        """Count a retry when botocore builds a request for a second or later attempt
+
+        Errors botocore does not retry never get here, so they stay errors only.
+        """
+        context = getattr(request, 'context', {})
+        attempt = context.get('retries', {}).get('attempt', 1)
+        if attempt <= 1:
+            return
+        code = context.get('trace_last_error', '')
+
+        span = context.get('trace_span')
+        if span is not None:
+            span.retries += 1
+        with self._lock:
+            self.events.append({
+                'name': 'throttle' if code in THROTTLE_CODES else 'retry', 'cat': 'retry', 'ph': 'i', 's': 't',
+                'pid': 1, 'tid': threading.get_ident(), 'ts': round(self._now() * 1e6),
+                'args': {'operation': span.operation if span else '', 'attempt': attempt, 'code': code}
+            })
+
+
+def _caller() -> str:
+    """Qualified name of the innermost project function on the stack, outside this module"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SRC_DIR) and filename != __file__ and '<lambda>' not in frame.f_code.co_name:
+            return getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+        frame = frame.f_back
+    return ''
+
+
+def _resource(params: Dict) -> str:
+    """The first resource ID a call's parameters name, or how many IDs a batched call names"""
+    for key, value in params.items():
+        if key.endswith('Ids') and isinstance(value, list) and value:
+            return value[0] if len(value) == 1 else f"{len(value)} {key[:-3]}s"
+        if key.endswith('Id') and isinstance(value, str):
+            return value
+    for f in params.get('Filters', params.get('Filter', [])):
+        if f.get('Name', '').endswith('-id'):
+            values = f.get('Values', [])
+            return values[0] if len(values) == 1 else f"{len(values)} {f['Name']}s"
+    return ''
+
+
+def _created_resource(parsed: Dict) -> str:
+    """ID of the resource a create call returned, e.g. Vpc.VpcId or GroupId"""
+    for key, value in parsed.items():
+        if key.endswith('Id') and isinstance(value, str) and key != 'RequestId':
+            return value
+        if isinstance(value, dict):
+            for inner_key, inner in value.items():
+                if inner_key.endswith('Id') and isinstance(inner, str) and inner_key == f'{key}Id':
+                    return inner
+    return ''
@@ -0,0 +1,207 @@
+from typing import Dict, List, Optional
+import ipaddress
+import re
+
+from src.core.cidr_planner import TIERS, find_overlaps, plan_subnets
+from src.core.readiness import probe_from_config
+from src.core.security_manager import DEFAULT_SECURITY_GROUPS
+from src.core.sg_rules import PORT_PROTOCOLS, PROTOCOL_ALIASES, compile_rules, parse_ports
+from src.workloads.database_workload import DATA_DEVICES, DATA_VOLUME_TYPES, INSTANCE_STORE_USES
+
+AMI_PATTERN = re.compile(r'^ami-[0-9a-f]{8}([0-9a-f]{9})?$')
+
+# Burstable instance families, which cannot launch into a cluster placement group
+BURSTABLE_FAMILIES = ('t2', 't3', 't3a', 't4g')
+
+# Most IOPS a data volume may have per GiB, and the IOPS every gp3 volume gets whatever its size
+IOPS_PER_GIB = {'gp3': 500, 'io2': 1000}
+GP3_BASELINE_IOPS = 3000
+
+
+def validate_config(config: Dict, workload_types: List[str], ami_id: Optional[str] = None) -> List[str]:
+    """Check an environment config without contacting AWS; return every problem found"""
+    errors: List[str] = []
+    errors.extend(_validate_vpc(config.get('vpc')))
+
+    workloads = config.get('workloads', {})
+    for workload_type in workload_types:
+        workload = workloads.get(workload_type)
+        if workload is None:
+            errors.append(f"workloads.{workload_type} is missing")
+            continue
+        if not isinstance(workload.get('instance_type'), str):
+            errors.append(f"workloads.{workload_type}.instance_type must be a string")
+        if not isinstance(workload.get('spot'), bool):
+            errors.append(f"workloads.{workload_type}.spot must be true or false")
+        count = workload.get('count', 1)
+        if not isinstance(count, int) or count < 0:
+            errors.append(f"workloads.{workload_type}.count must be a non-negative integer")
+        if not isinstance(workload.get('instance_types', []), list):
+            errors.append(f"workloads.{workload_type}.instance_types must be a list")
+        errors.extend(_validate_placement(f"workloads.{workload_type}.placement", workload.get('placement') or {}))
+        errors.extend(_validate_warm_pool(f"workloads.{workload_type}.warm_pool", workload.get('warm_pool') or {}))
+        errors.extend(_validate_storage(f"workloads.{workload_type}", workload))
+        if workload.get('placement_group'):
+            errors.extend(_validate_placement_group(workload_type, workload['placement_group'], workloads,
+                                                    workload_types))
+        try:
+            probe_from_config(workload.get('readiness'), None)
+        except (AttributeError, TypeError, ValueError, re.error):
+            errors.append(f"workloads.{workload_type}.readiness must be false or one of "
+                          f"{{\"tcp\": port}}, {{\"console\": pattern}}, {{\"cloud_init\": true}}")
+
+    groups = config.get('security_groups') or DEFAULT_SECURITY_GROUPS
+    errors.extend(f"security_groups.{name} is missing" for name in workload_types if name not in groups)
+    errors.extend(_validate_security_groups(groups))
+
+    if ami_id is not None and not AMI_PATTERN.match(ami_id):
+        errors.append(f"{ami_id} is not an AMI ID")
+    return errors
+
+
+def _validate_vpc(vpc: Optional[Dict]) -> List[str]:
+    if not vpc:
+        return ["vpc is missing"]
+    try:
+        network = ipaddress.ip_network(vpc.get('cidr', ''))
+        vpc = plan_subnets(vpc)
+    except (KeyError, TypeError, ValueError) as e:
+        return [f"vpc: {e}"]
+
+    errors = []
+    subnets = []
+    for tier in TIERS:
+        cidrs = vpc.get(f'{tier}_subnets', [])
+        if not cidrs:
+            errors.append(f"vpc.{tier}_subnets must list at least one subnet (or give vpc.tiers.{tier})")
+        for cidr in cidrs:
+            try:
+                subnet = ipaddress.ip_network(cidr)
+            except ValueError as e:
+                errors.append(f"vpc.{tier}_subnets: {e}")
+                continue
+            if not subnet.subnet_of(network):
+                errors.append(f"Subnet {cidr} is outside VPC {network}")
+            subnets.append(subnet)
+
+    errors.extend(f"Subnets {first} and {second} overlap" for first, second in find_overlaps(subnets))
+    return errors
+
+
+def _validate_placement(where: str, placement: Dict) -> List[str]:
+    errors = []
+    weights = placement.get('weights', {})
+    if not isinstance(weights, dict) or not all(
+            isinstance(w, (int, float)) and not isinstance(w, bool) and w >= 0 for w in weights.values()):
+        errors.append(f"{where}.weights must map zone names to non-negative numbers")
+    max_per_az = placement.get('max_per_az')
+    if max_per_az is not None and (not isinstance(max_per_az, int) or max_per_az < 1):
+        errors.append(f"{where}.max_per_az must be a positive integer")
+    return errors
+
+
+def _validate_warm_pool(where: str, warm_pool: Dict) -> List[str]:
+    errors = []
+    size = warm_pool.get('size', 0)
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        errors.append(f"{where}.size must be a non-negative integer")
+    if not isinstance(warm_pool.get('hibernate', False), bool):
+        errors.append(f"{where}.hibernate must be true or false")
+    return errors
+
+
+def _validate_storage(where: str, workload: Dict) -> List[str]:
+    errors = []
+    volumes = workload.get('data_volumes')
+    if volumes is not None:
+        errors.extend(_validate_data_volumes(f"{where}.data_volumes", volumes))
+    instance_store = workload.get('instance_store')
+    if instance_store is not None and instance_store not in INSTANCE_STORE_USES:
+        errors.append(f"{where}.instance_store must be one of {list(INSTANCE_STORE_USES)}")
+    if instance_store == 'wal' and (workload.get('warm_pool') or {}).get('size'):
+        errors.append(f"{where}: WAL on the instance store would be lost when warm pool instances stop")
+    if not isinstance(workload.get('ebs_optimized', False), bool):
+        errors.append(f"{where}.ebs_optimized must be true or false")
+    return errors
+
+
+def _validate_data_volumes(where: str, volumes: Dict) -> List[str]:
+    """Per-volume limits for gp3 and io2, so a bad size or rate fails here and not mid-launch
+
+    Besides each value's range, AWS caps IOPS per GiB of size and gp3
+    throughput at 0.25 MiB/s per IOPS; it only checks those when the
+    volumes are created, after the instances are already up.
+    """
+    volume_type = volumes.get('type')
+    if volume_type not in DATA_VOLUME_TYPES:
+        return [f"{where}.type must be one of {list(DATA_VOLUME_TYPES)}"]
+
+    def whole(key: str, low: int, high: int, required: bool = False) -> None:
+        value = volumes.get(key)
+        if value is None and not required:
+            return
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            errors.append(f"{where}.{key} must be a whole number from {low} to {high} for {volume_type}")
+
+    errors: List[str] = []
+    whole('volumes', 1, len(DATA_DEVICES))
+    if volume_type == 'gp3':
+        whole('size', 1, 16384, required=True)
+        whole('iops', 3000, 16000)
+        whole('throughput', 125, 1000)
+    else:
+        whole('size', 4, 16384, required=True)
+        whole('iops', 100, 64000, required=True)
+        if 'throughput' in volumes:
+            errors.append(f"{where}.throughput only applies to gp3; io2 throughput follows its IOPS")
+    if errors:
+        return errors
+
+    size = volumes['size']
+    iops = volumes.get('iops', GP3_BASELINE_IOPS)
+    max_iops = IOPS_PER_GIB[volume_type] * size
+    if iops > max_iops and not (volume_type == 'gp3' and iops <= GP3_BASELINE_IOPS):
+        errors.append(f"{where}.iops: {volume_type} allows at most {IOPS_PER_GIB[volume_type]} IOPS per GiB, "
+                      f"so {max_iops} for {size} GiB")
+    if volume_type == 'gp3' and volumes.get('throughput', 125) > iops / 4:
+        errors.append(f"{where}.throughput: gp3 allows at most 0.25 MiB/s per IOPS, so {iops // 4} for {iops} IOPS")
+    return errors
+
+
+def _validate_placement_group(owner: str, group: Dict, workloads: Dict, workload_types: List[str]) -> List[str]:
+    where = f"workloads.{owner}.placement_group"
+    if not isinstance(group, dict) or group.get('strategy', 'cluster') != 'cluster':
+        return [f"{where} must be {{\"strategy\": \"cluster\", \"share_with\": [workloads]}}"]
+    share_with = group.get('share_with', [])
+    errors = [f"{where}.share_with: unknown workload {name}" for name in share_with if name not in workload_types]
+    for name in [owner, *(name for name in share_with if name in workload_types)]:
+        member = workloads.get(name) or {}
+        types = [member.get('instance_type'), *member.get('instance_types', [])]
+        burstable = sorted({t for t in types if isinstance(t, str) and t.split('.', 1)[0] in BURSTABLE_FAMILIES})
+        if burstable:
+            errors.append(f"{where}: burstable {', '.join(burstable)} ({name}) cannot launch "
+                          f"in a cluster placement group")
+    return errors
+
+
+def _validate_security_groups(groups: Dict[str, Dict]) -> List[str]:
+    errors = []
+    placeholder_ids = {name: f'sg-{name}' for name in groups}
+    for name, group in groups.items():
+        for i, entry in enumerate(group.get('ingress', [])):
+            where = f"security_groups.{name}.ingress[{i}]"
+            unknown = [ref for ref in entry.get('groups', []) if ref not in groups]
+            if unknown:
+                errors.append(f"{where} references undeclared groups: {unknown}")
+                continue
+            protocol = str(entry.get('protocol', 'tcp')).lower()
+            ranged = PROTOCOL_ALIASES.get(protocol, protocol) in PORT_PROTOCOLS
+            try:
+                for ports in entry.get('ports', []) if ranged else []:
+                    low, high = parse_ports(ports)
+                    if not 0 <= low <= high <= 65535:
+                        errors.append(f"{where} has invalid port range {ports}")
+                compile_rules([entry], placeholder_ids)
+            except ValueError as e:
+                errors.append(f"{where}: {e}")
+    return errors
@@ -1,175 +1,278 @@
-from typing import Dict, List
-import boto3
+from typing import Dict, List, Optional
 import logging
-import time
+import threading
+import uuid
+
+from src.core.dag import DAGScheduler
+from src.core.inventory import NullInventory, env_scope
+from src.core.poller import ResourcePoller
+from src.core.tagging import TagContext
 
 class VPCManager:
-    def __init__(self, ec2_client, region: str):
+    def __init__(self, ec2_client, region: str, tags: Optional[TagContext] = None,
+                 inventory: Optional[NullInventory] = None):
         self.ec2 = ec2_client
         self.region = region
+        self.tags = tags or TagContext()
+        self.inventory = inventory or NullInventory()
+        self.poller = ResourcePoller.for_client(ec2_client)
         self.logger = logging.getLogger(__name__)
+        self._zones: Optional[List[str]] = None
+        self._zones_lock = threading.Lock()
 
-    def create_vpc(self, vpc_cidr: str, public_cidrs: List[str], private_cidrs: List[str]) -> Dict:
+    def create_vpc(self, vpc_cidr: str, public_cidrs: List[str], private_cidrs: List[str],
+                   max_workers: int = 8) -> Dict:
         """Create VPC with public and private subnets"""
         try:
-            # Create VPC
-            vpc = self.ec2.create_vpc(
-                CidrBlock=vpc_cidr,
-                EnableDnsHostnames=True,
-                EnableDnsSupport=True
-            )
-            vpc_id = vpc['Vpc']['VpcId']
-            
-            # Wait for VPC to be available
-            waiter = self.ec2.get_waiter('vpc_available')
-            waiter.wait(VpcIds=[vpc_id])
-            
-            # Create and attach internet gateway
-            igw = self.ec2.create_internet_gateway()
-            igw_id = igw['InternetGateway']['InternetGatewayId']
-            self.ec2.attach_internet_gateway(VpcId=vpc_id, InternetGatewayId=igw_id)
-            
-            # Create NAT Gateway for private subnets
-            public_subnet_id = self._create_public_subnets(vpc_id, public_cidrs, igw_id)[0]
-            nat_gateway_id = self._create_nat_gateway(public_subnet_id)
-            
-            # Create private subnets
-            private_subnet_ids = self._create_private_subnets(vpc_id, private_cidrs, nat_gateway_id)
-            
-            self.logger.info(f"VPC {vpc_id} created successfully with all components")
-            
-            return {
-                'vpc_id': vpc_id,
-                'public_subnets': self._get_public_subnet_ids(vpc_id),
-                'private_subnets': private_subnet_ids,
-                'internet_gateway_id': igw_id,
-                'nat_gateway_id': nat_gateway_id
-            }
-            
+            graph = DAGScheduler(max_workers)
+            self.add_vpc_nodes(graph, vpc_cidr, public_cidrs, private_cidrs)
+            results = graph.run()
+            graph.log_report(self.logger)
+
+            vpc_info = self.vpc_info(results, public_cidrs, private_cidrs)
+            self.logger.info(f"VPC {vpc_info['vpc_id']} created successfully with all components")
+            return vpc_info
+
         except Exception as e:
             self.logger.error(f"Error creating VPC: {str(e)}")
             raise
 
-    def _create_public_subnets(self, vpc_id: str, cidrs: List[str], igw_id: str) -> List[str]:
-        """Create public subnets with route to internet gateway"""
-        subnet_ids = []
-        try:
-            # Create route table for public subnets
-            public_route_table = self.ec2.create_route_table(VpcId=vpc_id)
-            public_rt_id = public_route_table['RouteTable']['RouteTableId']
-            
-            # Add route to internet gateway
-            self.ec2.create_route(
-                RouteTableId=public_rt_id,
-                DestinationCidrBlock='0.0.0.0/0',
-                GatewayId=igw_id
-            )
-            
-            # Create public subnets
-            for i, cidr in enumerate(cidrs):
-                subnet = self.ec2.create_subnet(
-                    VpcId=vpc_id,
-                    CidrBlock=cidr,
-                    AvailabilityZone=f'{self.region}{"abcd"[i]}',
-                    MapPublicIpOnLaunch=True
-                )
-                subnet_id = subnet['Subnet']['SubnetId']
-                subnet_ids.append(subnet_id)
-                
-                # Associate subnet with public route table
-                self.ec2.associate_route_table(
-                    RouteTableId=public_rt_id,
-                    SubnetId=subnet_id
-                )
-                
-                # Tag subnet as public
-                self.ec2.create_tags(
-                    Resources=[subnet_id],
-                    Tags=[{'Key': 'Type', 'Value': 'Public'}]
+    def add_vpc_nodes(self, graph: DAGScheduler, vpc_cidr: str, public_cidrs: List[str],
+                      private_cidrs: List[str]) -> None:
+        """Register every networking step on the graph with its real dependencies
+
+        Subnets, route tables and the internet gateway only need the VPC (or
+        nothing at all), so they run side by side; only the NAT gateway waits
+        on a public subnet and an attached internet gateway.
+        """
+        graph.add('vpc', lambda r: self._create_vpc(vpc_cidr))
+        graph.add('igw', lambda r: self._create_internet_gateway())
+        graph.add('igw_attach', lambda r: self._attach_internet_gateway(r['vpc'], r['igw']), ['vpc', 'igw'])
+
+        graph.add('rt:public', lambda r: self._create_route_table(r['vpc'], 'public'), ['vpc'])
+        graph.add('route:public',
+                  lambda r: self._create_default_route(r['rt:public'], GatewayId=r['igw']),
+                  ['rt:public', 'igw_attach'])
+
+        for i, cidr in enumerate(public_cidrs):
+            self._add_subnet_nodes(graph, 'public', cidr, i)
+
+        graph.add('eip', lambda r: self._allocate_eip())
+        first_public = f'subnet:public:{public_cidrs[0]}'
+        graph.add('nat',
+                  lambda r: self._create_nat_gateway(r[first_public], r['eip']),
+                  [first_public, 'eip', 'igw_attach'])
+
+        graph.add('rt:private', lambda r: self._create_route_table(r['vpc'], 'private'), ['vpc'])
+        graph.add('route:private',
+                  lambda r: self._create_default_route(r['rt:private'], NatGatewayId=r['nat']),
+                  ['rt:private', 'nat'])
+
+        for i, cidr in enumerate(private_cidrs):
+            self._add_subnet_nodes(graph, 'private', cidr, i)
+
+    def vpc_info(self, results: Dict, public_cidrs: List[str], private_cidrs: List[str]) -> Dict:
+        """Assemble the create_vpc return value from graph results"""
+        return {
+            'vpc_id': results['vpc'],
+            'public_subnets': [results[f'subnet:public:{cidr}'] for cidr in public_cidrs],
+            'private_subnets': [results[f'subnet:private:{cidr}'] for cidr in private_cidrs],
+            'internet_gateway_id': results['igw'],
+            'nat_gateway_id': results['nat']
+        }
+
+    @staticmethod
+    def tier_ready_nodes(tier: str, cidrs: List[str]) -> List[str]:
+        """Nodes that must finish before instances in a subnet tier have working egress"""
+        return [f'route:{tier}'] + [f'assoc:{tier}:{cidr}' for cidr in cidrs]
+
+    def availability_zones(self) -> List[str]:
+        """The region's usable zones, from one describe_availability_zones call cached in the inventory"""
+        with self._zones_lock:
+            if self._zones is None:
+                zones = self.inventory.list(
+                    self.region,
+                    'availability_zones',
+                    'region',
+                    lambda: self.ec2.describe_availability_zones(Filters=[
+                        {'Name': 'state', 'Values': ['available']},
+                        {'Name': 'zone-type', 'Values': ['availability-zone']},
+                        {'Name': 'opt-in-status', 'Values': ['opt-in-not-required', 'opted-in']}
+                    ])['AvailabilityZones']
                 )
-                
-            return subnet_ids
-            
+                if not zones:
+                    raise ValueError(f"No available zones in {self.region}")
+                self._zones = sorted(zone['ZoneName'] for zone in zones)
+            return self._zones
+
+    def _add_subnet_nodes(self, graph: DAGScheduler, tier: str, cidr: str, index: int) -> None:
+        subnet_node = f'subnet:{tier}:{cidr}'
+        # Zones are looked up when the subnet is created, so building the graph needs no API call
+        graph.add(subnet_node,
+                  lambda r: self._create_subnet(r['vpc'], cidr, self.subnet_zone(index), tier == 'public'),
+                  ['vpc'])
+        graph.add(f'assoc:{tier}:{cidr}',
+                  lambda r: self._associate_route_table(r[f'rt:{tier}'], r[subnet_node]),
+                  [subnet_node, f'rt:{tier}'])
+
+    def subnet_zone(self, index: int) -> str:
+        """Zone of a tier's index-th subnet: subnets go round-robin over the region's zones"""
+        zones = self.availability_zones()
+        return zones[index % len(zones)]
+
+    def _create_vpc(self, vpc_cidr: str) -> str:
+        """Create the VPC and wait until it is available"""
+        tag_specs = self.tags.specs('vpc', Name=self.tags.name('vpc'))
+        vpc = self.ec2.create_vpc(
+            CidrBlock=vpc_cidr,
+            TagSpecifications=tag_specs
+        )
+        vpc_id = vpc['Vpc']['VpcId']
+
+        # Wait for VPC to be available
+        description = self.poller.wait_for('vpc', [vpc_id])[0]
+        self._record('vpcs', description, tag_specs)
+
+        # DNS attributes can only be changed one per call
+        self.ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={'Value': True})
+        self.ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={'Value': True})
+        return vpc_id
+
+    def _create_internet_gateway(self) -> str:
+        tag_specs = self.tags.specs('internet-gateway', Name=self.tags.name('igw'))
+        igw = self.ec2.create_internet_gateway(TagSpecifications=tag_specs)
+        self._record('internet_gateways', igw['InternetGateway'], tag_specs)
+        return igw['InternetGateway']['InternetGatewayId']
+
+    def _attach_internet_gateway(self, vpc_id: str, igw_id: str) -> None:
+        self.ec2.attach_internet_gateway(VpcId=vpc_id, InternetGatewayId=igw_id)
+        self.inventory.invalidate(self.region, 'internet_gateways')
+
+    def _create_route_table(self, vpc_id: str, tier: str) -> str:
+        tag_specs = self.tags.specs('route-table', Name=self.tags.name(tier), Type=tier.capitalize())
+        route_table = self.ec2.create_route_table(
+            VpcId=vpc_id,
+            TagSpecifications=tag_specs
+        )
+        self._record('route_tables', route_table['RouteTable'], tag_specs)
+        return route_table['RouteTable']['RouteTableId']
+
+    def _create_default_route(self, route_table_id: str, **target) -> None:
+        """Add a 0.0.0.0/0 route to the given gateway"""
+        self.ec2.create_route(
+            RouteTableId=route_table_id,
+            DestinationCidrBlock='0.0.0.0/0',
+            **target
+        )
+        self.inventory.invalidate(self.region, 'route_tables')
+
+    def replace_default_route(self, route_table_id: str, **target) -> None:
+        """Point an existing 0.0.0.0/0 route at a different gateway"""
+        self.ec2.replace_route(
+            RouteTableId=route_table_id,
+            DestinationCidrBlock='0.0.0.0/0',
+            **target
+        )
+        self.inventory.invalidate(self.region, 'route_tables')
+
+    def delete_subnet(self, subnet_id: str) -> None:
+        try:
+            self.ec2.delete_subnet(SubnetId=subnet_id)
+            self.inventory.delete(self.region, 'subnets', subnet_id)
+
         except Exception as e:
-            self.logger.error(f"Error creating public subnets: {str(e)}")
+            self.logger.error(f"Error deleting subnet {subnet_id}: {str(e)}")
             raise
 
-    def _create_private_subnets(self, vpc_id: str, cidrs: List[str], nat_gateway_id: str) -> List[str]:
-        """Create private subnets with route to NAT gateway"""
-        subnet_ids = []
+    def _create_subnet(self, vpc_id: str, cidr: str, availability_zone: str, public: bool) -> str:
+        """Create a subnet tagged with its tier at creation time"""
         try:
-            # Create route table for private subnets
-            private_route_table = self.ec2.create_route_table(VpcId=vpc_id)
-            private_rt_id = private_route_table['RouteTable']['RouteTableId']
-            
-            # Add route to NAT gateway
-            self.ec2.create_route(
-                RouteTableId=private_rt_id,
-                DestinationCidrBlock='0.0.0.0/0',
-                NatGatewayId=nat_gateway_id
+            tier = 'Public' if public else 'Private'
+            tag_specs = self.tags.specs('subnet', Name=self.tags.name(tier.lower(), availability_zone), Type=tier)
+            subnet = self.ec2.create_subnet(
+                VpcId=vpc_id,
+                CidrBlock=cidr,
+                AvailabilityZone=availability_zone,
+                TagSpecifications=tag_specs
             )
-            
-            # Create private subnets
-            for i, cidr in enumerate(cidrs):
-                subnet = self.ec2.create_subnet(
-                    VpcId=vpc_id,
-                    CidrBlock=cidr,
-                    AvailabilityZone=f'{self.region}{"abcd"[i]}'
-                )
-                subnet_id = subnet['Subnet']['SubnetId']
-                subnet_ids.append(subnet_id)
-                
-                # Associate subnet with private route table
-                self.ec2.associate_route_table(
-                    RouteTableId=private_rt_id,
-                    SubnetId=subnet_id
-                )
-                
-                # Tag subnet as private
-                self.ec2.create_tags(
-                    Resources=[subnet_id],
-                    Tags=[{'Key': 'Type', 'Value': 'Private'}]
-                )
-                
-            return subnet_ids
-            
+            subnet_id = subnet['Subnet']['SubnetId']
+            self._record('subnets', subnet['Subnet'], tag_specs, f'vpc:{vpc_id}:{tier}')
+
+            if public:
+                self.ec2.modify_subnet_attribute(SubnetId=subnet_id, MapPublicIpOnLaunch={'Value': True})
+            return subnet_id
+
         except Exception as e:
-            self.logger.error(f"Error creating private subnets: {str(e)}")
+            self.logger.error(f"Error creating subnet {cidr}: {str(e)}")
             raise
 
-    def _create_nat_gateway(self, public_subnet_id: str) -> str:
+    def _associate_route_table(self, route_table_id: str, subnet_id: str) -> None:
+        self.ec2.associate_route_table(
+            RouteTableId=route_table_id,
+            SubnetId=subnet_id
+        )
+        self.inventory.invalidate(self.region, 'route_tables')
+
+    def _allocate_eip(self) -> str:
+        """Allocate Elastic IP for NAT Gateway"""
+        tag_specs = self.tags.specs('elastic-ip', Name=self.tags.name('nat'))
+        eip = self.ec2.allocate_address(
+            Domain='vpc',
+            TagSpecifications=tag_specs
+        )
+        self._record('addresses', {'AllocationId': eip['AllocationId'], 'Domain': 'vpc'}, tag_specs)
+        return eip['AllocationId']
+
+    def _create_nat_gateway(self, public_subnet_id: str, allocation_id: str) -> str:
         """Create NAT Gateway in the public subnet"""
         try:
-            # Allocate Elastic IP for NAT Gateway
-            eip = self.ec2.allocate_address(Domain='vpc')
-            
-            # Create NAT Gateway
+            tag_specs = self.tags.specs('natgateway', Name=self.tags.name('nat'))
             nat_gateway = self.ec2.create_nat_gateway(
                 SubnetId=public_subnet_id,
-                AllocationId=eip['AllocationId']
+                AllocationId=allocation_id,
+                TagSpecifications=tag_specs,
+                # Retried attempts resend the same token, so a retry never creates a second NAT
+                ClientToken=str(uuid.uuid4())
             )
-            
+            nat_gateway_id = nat_gateway['NatGateway']['NatGatewayId']
+
             # Wait for NAT Gateway to be available
-            waiter = self.ec2.get_waiter('nat_gateway_available')
-            waiter.wait(NatGatewayIds=[nat_gateway['NatGateway']['NatGatewayId']])
-            
-            return nat_gateway['NatGateway']['NatGatewayId']
-            
+            description = self.poller.wait_for('nat_gateway', [nat_gateway_id])[0]
+            self._record('nat_gateways', description, tag_specs)
+            self.inventory.invalidate(self.region, 'addresses')
+
+            return nat_gateway_id
+
         except Exception as e:
             self.logger.error(f"Error creating NAT Gateway: {str(e)}")
             raise
 
-    def _get_public_subnet_ids(self, vpc_id: str) -> List[str]:
-        """Get all public subnet IDs in the VPC"""
+    def _get_public_subnet_ids(self, vpc_id: str, fresh: bool = False) -> List[str]:
+        """Get all public subnet IDs in the VPC, from the inventory unless fresh"""
         try:
-            subnets = self.ec2.describe_subnets(
-                Filters=[
-                    {'Name': 'vpc-id', 'Values': [vpc_id]},
-                    {'Name': 'tag:Type', 'Values': ['Public']}
-                ]
+            subnets = self.inventory.list(
+                self.region,
+                'subnets',
+                f'vpc:{vpc_id}:Public',
+                lambda: self.ec2.describe_subnets(
+                    Filters=[
+                        {'Name': 'vpc-id', 'Values': [vpc_id]},
+                        {'Name': 'tag:Type', 'Values': ['Public']}
+                    ]
+                )['Subnets'],
+                fresh
             )
-            return [subnet['SubnetId'] for subnet in subnets['Subnets']]
+            return [subnet['SubnetId'] for subnet in subnets]
             
         except Exception as e:
             self.logger.error(f"Error getting public subnet IDs: {str(e)}")
             raise
+
+    def _record(self, kind: str, resource: Dict, tag_specs: List[Dict], *scopes: str) -> None:
+        """Write a created resource through to the inventory, with the tags it was created with"""
+        self.inventory.put(
+            self.region,
+            kind,
+            {'Tags': tag_specs[0]['Tags'], **resource},
+            [env_scope(self.tags.env), *scopes]
+        )
@@ -0,0 +1,188 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import threading
+
+from src.core.snapshot import describe_all, tag_value
+
+# Tag marking a pool member; its value is the config hash the member was launched with
+WARM_POOL_TAG = 'WarmPool'
+
+# States a pool member passes through: warming up, being parked, parked
+POOL_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+
+class WarmPool:
+    """Stopped (or hibernated) instances of one workload that have already run their user data
+
+    Members carry a WarmPool tag holding config_hash(). take() starts parked
+    members with batched start_instances and untags them, so they become
+    ordinary workload instances; replenish() launches members up to size
+    and parks them on a background thread once the workload's readiness
+    probe passes. Either call terminates members whose hash no longer
+    matches the workload. Members are always on-demand, since a spot
+    instance can only be stopped under a persistent request. Hibernation
+    needs an AMI with an encrypted root volume.
+    """
+
+    def __init__(self, workload, size: int, hibernate: bool = False, timeout: float = 900.0):
+        self.workload = workload
+        self.size = size
+        self.hibernate = hibernate
+        self.timeout = timeout
+        self.ec2 = workload.ec2
+        self.logger = logging.getLogger(f"{workload.__class__.__name__}.pool")
+        # take() and replenish() may run at once in one build; members are claimed under this lock
+        self._lock = threading.Lock()
+        self._parking: List[threading.Thread] = []
+
+    @classmethod
+    def from_config(cls, workload, config: Optional[Dict]) -> Optional['WarmPool']:
+        """A workload's 'warm_pool' setting: {"size": n, "hibernate": bool}; no size means no pool"""
+        if not config or not config.get('size'):
+            return None
+        return cls(workload, int(config['size']), bool(config.get('hibernate', False)))
+
+    def config_hash(self, ami_id: str) -> str:
+        """Hash of everything a member was launched with: image, user data, instance types and storage"""
+        content = json.dumps({
+            'workload': self.workload.workload_name,
+            'image': ami_id,
+            'user_data': self.workload.get_user_data(ami_id),
+            'instance_types': self.workload.instance_types,
+            'launch_options': self.workload.launch_options(),
+            'hibernate': self.hibernate
+        }, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def members(self, subnet_ids: List[str]) -> List[Dict]:
+        """Every pool member of this workload in these subnets, from one describe call"""
+        tags = self.workload.tags.as_dict()
+        filters = [
+            {'Name': 'tag:ManagedBy', 'Values': [tags['ManagedBy']]},
+            {'Name': 'tag:Workload', 'Values': [self.workload.workload_name]},
+            {'Name': 'tag-key', 'Values': [WARM_POOL_TAG]},
+            {'Name': 'subnet-id', 'Values': subnet_ids},
+            {'Name': 'instance-state-name', 'Values': POOL_STATES}
+        ]
+        if 'Environment' in tags:
+            filters.append({'Name': 'tag:Environment', 'Values': [tags['Environment']]})
+        reservations = describe_all(self.ec2, 'describe_instances', 'Reservations', Filters=filters)
+        return [instance for reservation in reservations for instance in reservation['Instances']]
+
+    def take(self, subnet_ids: List[str], ami_id: str, count: int) -> List[Dict]:
+        """Start up to count parked members and return them; the caller waits for them to run"""
+        if count <= 0:
+            return []
+        with self._lock:
+            parked = sorted(
+                (member for member in self._current(subnet_ids, ami_id) if member['State']['Name'] == 'stopped'),
+                key=lambda member: str(member.get('LaunchTime', ''))
+            )[:count]
+            if not parked:
+                return []
+
+            instance_ids = [member['InstanceId'] for member in parked]
+            # Untag first: a started member must never be counted, or taken, as part of the pool again
+            for start in range(0, len(instance_ids), 1000):
+                batch = instance_ids[start:start + 1000]
+                self.ec2.delete_tags(Resources=batch, Tags=[{'Key': WARM_POOL_TAG}])
+                self.ec2.start_instances(InstanceIds=batch)
+        self.logger.info(f"Started {len(parked)} warm {self.workload.workload_name} instances")
+        return parked
+
+    def replenish(self, subnet_ids: List[str], security_group_id: str, ami_id: str) -> List[str]:
+        """Launch members until the pool holds size and return their IDs without waiting for them
+
+        New members, and any an earlier refill left running, are parked on a
+        non-daemon thread, so the build finishes first and the process only
+        exits once they are stopped. A member killed mid-warm-up stays in the
+        pool and is probed again by the next refill.
+        """
+        with self._lock:
+            current = self._current(subnet_ids, ami_id)
+            shortfall = self.size - len(current)
+            launched: List[str] = []
+            if shortfall > 0:
+                options = {
+                    'TagSpecifications': self.workload.tags.specs(
+                        'instance', 'volume',
+                        Name=self.workload.tags.name(self.workload.workload_name, 'warm'),
+                        **{WARM_POOL_TAG: self.config_hash(ami_id)}
+                    )
+                }
+                if self.hibernate:
+                    options['HibernationOptions'] = {'Configured': True}
+                launched = self.workload._launch_ondemand(self.workload.scheduler(subnet_ids), security_group_id,
+                                                          ami_id, shortfall, **options)
+            warming = launched + [member['InstanceId'] for member in current
+                                  if member['State']['Name'] in ('pending', 'running')]
+
+        if warming:
+            thread = threading.Thread(target=self._park_in_background, args=(warming,),
+                                      name=f'warm-pool-{self.workload.workload_name}')
+            thread.start()
+            self._parking.append(thread)
+            self.logger.info(f"Parking {len(warming)} warm {self.workload.workload_name} instances in the background")
+        return launched
+
+    def park(self, instance_ids: List[str]) -> List[str]:
+        """Stop members once the readiness probe passes; return the ones parked
+
+        Members that never ran are terminated. Members whose probe did not
+        pass in time are left running, since stopping one mid-install would
+        park it half set up, and the next refill probes them again.
+        """
+        ready, lost, unready = [], [], []
+        for event in self.workload.stream_ready(instance_ids, self.timeout):
+            if event['stage'] == 'ready':
+                ready.append(event['instance_id'])
+            elif event['stage'] == 'failed':
+                (unready if 'probe' in event else lost).append(event['instance_id'])
+        if lost:
+            self.logger.warning(f"Terminating {len(lost)} warm instances that failed to launch")
+            self._evict(lost)
+        if unready:
+            self.logger.warning(f"Warm instances {', '.join(unready)} did not pass {self.workload.readiness_probe} "
+                                f"in {self.timeout:.0f}s; left running for the next refill")
+        if ready:
+            for start in range(0, len(ready), 1000):
+                self.ec2.stop_instances(InstanceIds=ready[start:start + 1000], Hibernate=self.hibernate)
+            self.workload.poller.wait_for('instance', ready, ready=('stopped',),
+                                          failed=('shutting-down', 'terminated'))
+            self.logger.info(f"Parked {len(ready)} warm {self.workload.workload_name} instances")
+        return ready
+
+    def wait(self) -> None:
+        """Block until every background park has finished"""
+        while self._parking:
+            self._parking.pop().join()
+
+    def census(self, subnet_ids: List[str], ami_id: Optional[str]) -> Tuple[List[Dict], List[Dict]]:
+        """Members launched with the current config and stale ones; with no image every member is current"""
+        members = self.members(subnet_ids)
+        if ami_id is None:
+            return members, []
+        current = self.config_hash(ami_id)
+        return ([member for member in members if tag_value(member, WARM_POOL_TAG) == current],
+                [member for member in members if tag_value(member, WARM_POOL_TAG) != current])
+
+    def _current(self, subnet_ids: List[str], ami_id: str) -> List[Dict]:
+        """Members launched with the current config; stale ones are terminated on the way"""
+        current, stale = self.census(subnet_ids, ami_id)
+        if stale:
+            self.logger.info(f"Evicting {len(stale)} warm {self.workload.workload_name} instances of an old config")
+            self._evict([member['InstanceId'] for member in stale])
+        return current
+
+    def _park_in_background(self, instance_ids: List[str]) -> None:
+        try:
+            self.park(instance_ids)
+        except Exception as e:
+            self.logger.error(f"Error parking warm instances: {str(e)}")
+
+    def _evict(self, instance_ids: List[str]) -> None:
+        # Nothing waits on an evicted member, so there is no point watching it terminate
+        for start in range(0, len(instance_ids), 1000):
+            self.ec2.terminate_instances(InstanceIds=instance_ids[start:start + 1000])
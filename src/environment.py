@@ -0,0 +1,305 @@
+from typing import Dict, List, Optional
+import json
+import logging
+from pathlib import Path
+
+from src.core.cidr_planner import plan_subnets
+from src.core.vpc_manager import VPCManager
+from src.core.security_manager import SecurityManager
+from src.core.dag import DAGScheduler
+from src.core.images import ImageBaker, NullImageCatalog, bake_key
+from src.core.inventory import ID_KEYS, NullInventory
+from src.core.journal import BuildJournal
+from src.core.placement import LaunchError, error_code
+from src.core.snapshot import EnvironmentSnapshot
+from src.core.tagging import TagContext
+from src.workloads.api_workload import APIWorkload
+from src.workloads.database_workload import DatabaseWorkload
+from src.workloads.workflow_workload import WorkflowWorkload
+
+CONFIG_DIR = Path(__file__).parent / "config"
+
+WORKLOAD_CLASSES = {
+    'api': APIWorkload,
+    'database': DatabaseWorkload,
+    'workflow': WorkflowWorkload
+}
+
+
+def load_config(env: str, config_path: Optional[Path] = None) -> Dict:
+    """Load the config for an environment, defaulting to config/<env>_config.json"""
+    if config_path is None:
+        config_path = CONFIG_DIR / f"{env}_config.json"
+
+    with open(config_path) as f:
+        return json.load(f)
+
+
+class EnvironmentBuilder:
+    """Provision one environment (VPC, security groups, workloads) in one region"""
+
+    def __init__(self, ec2_client, env: str, region: str, config: Dict, ami_id: Optional[str] = None,
+                 max_workers: int = 8, inventory: Optional[NullInventory] = None,
+                 images: Optional[NullImageCatalog] = None, bake: bool = False,
+                 journal: Optional[BuildJournal] = None):
+        self.ec2 = ec2_client
+        self.env = env
+        self.region = region
+        # Tiers given as subnet counts are carved into CIDRs here, before any API call
+        self.config = {**config, 'vpc': plan_subnets(config['vpc'])}
+        self.ami_id = ami_id
+        self.max_workers = max_workers
+        self.inventory = inventory or NullInventory()
+        self.images = images or NullImageCatalog()
+        self.bake = bake
+        self.journal = journal
+        self.logger = logging.getLogger(__name__)
+
+        # Every resource is tagged with the environment and this run's ID; a resumed run keeps its ID
+        self.tags = TagContext(env, journal.run_id if journal else None)
+
+        # Initialize managers
+        self.vpc_manager = VPCManager(ec2_client, region, self.tags, self.inventory)
+        self.security_manager = SecurityManager(
+            ec2_client, self.tags, self.inventory, region, config.get('security_groups')
+        )
+
+        # Initialize workload managers
+        self.workloads = {
+            workload_type: workload_class.from_config(
+                ec2_client, region, config['workloads'][workload_type], self.tags, self.inventory
+            )
+            for workload_type, workload_class in WORKLOAD_CLASSES.items()
+        }
+
+        # Workloads already baked from this AMI launch from their image with runtime-only user data
+        self.baker = ImageBaker(ec2_client, region, self.images, self.tags)
+        if ami_id is not None:
+            for workload in self.workloads.values():
+                workload.baked_image = self.images.lookup(region, bake_key(ami_id, workload))
+
+    def build_graph(self) -> DAGScheduler:
+        """Model the whole environment as one dependency graph without running it"""
+        vpc_config = self.config['vpc']
+
+        # Independent steps (subnets, security groups, workloads) overlap
+        graph = DAGScheduler(self.max_workers)
+        self.vpc_manager.add_vpc_nodes(
+            graph,
+            vpc_config['cidr'],
+            vpc_config['public_subnets'],
+            vpc_config['private_subnets']
+        )
+        self.security_manager.add_security_group_nodes(graph)
+        for owner in self.placement_groups():
+            graph.add(f'placement_group:{owner}', lambda r, owner=owner: self.create_placement_group(owner))
+
+        for workload_type, workload in self.workloads.items():
+            deps = self.workload_dependencies(workload_type)
+            if self.bake and self.ami_id is not None and workload.baked_image is None:
+                graph.add(f'bake:{workload_type}',
+                          lambda r, workload_type=workload_type: self.bake_workload(workload_type, r), deps)
+                deps = deps + [f'bake:{workload_type}']
+            group_node = self.placement_group_node(workload_type)
+            if group_node is not None:
+                deps = deps + [group_node]
+            graph.add(
+                f'workload:{workload_type}',
+                lambda r, workload_type=workload_type: self.launch_workload(workload_type, r),
+                deps
+            )
+            # Refilling the pool comes after the launch has taken from it; only the launch call is on the graph
+            if workload.warm_pool is not None:
+                graph.add(f'pool:{workload_type}',
+                          lambda r, workload_type=workload_type: self.replenish_pool(workload_type, r),
+                          [f'workload:{workload_type}'])
+        return graph
+
+    def build(self, graph: Optional[DAGScheduler] = None) -> Dict:
+        """Run the environment graph (a fresh one unless given) and return what was created"""
+        self.logger.info(f"Setting up {self.env} in {self.region} (run {self.tags.run_id})")
+        vpc_config = self.config['vpc']
+
+        try:
+            graph = graph or self.build_graph()
+            if self.journal is not None:
+                self.resume(graph)
+                self.journal.start(self.env, self.region, self.tags.run_id)
+                graph.on_complete = self.journal.record
+            results = graph.run()
+            if self.journal is not None:
+                self.journal.finish()
+            graph.log_report(self.logger)
+
+            vpc_info = self.vpc_manager.vpc_info(
+                results,
+                vpc_config['public_subnets'],
+                vpc_config['private_subnets']
+            )
+            self.logger.info(f"VPC {vpc_info['vpc_id']} created successfully with all components")
+
+            return {
+                'env': self.env,
+                'region': self.region,
+                'run_id': self.tags.run_id,
+                'vpc': vpc_info,
+                'security_groups': SecurityManager.security_group_ids(results),
+                'instances': {
+                    workload_type: results[f'workload:{workload_type}'] for workload_type in self.workloads
+                },
+                'timing': graph.report()
+            }
+
+        except Exception as e:
+            self.logger.error(f"Error setting up environment: {str(e)}")
+            if self.journal is not None:
+                self.journal.close()
+                self.logger.error(f"Completed steps are journaled in {self.journal.path}; rerun with --resume")
+            raise
+
+    def resume(self, graph: DAGScheduler) -> None:
+        """Seed the graph with journaled steps whose resources one snapshot shows still exist
+
+        A workload keeps whichever of its instances survive and launches only
+        the missing number.
+        """
+        if not self.journal.completed:
+            return
+        snapshot = EnvironmentSnapshot.capture(self.ec2, self.env, max_workers=self.max_workers,
+                                               region=self.region, inventory=self.inventory, fresh=True)
+        known = (resource[ID_KEYS[kind]] for kind, resources in snapshot.resources.items() for resource in resources)
+        deps = {name: node.deps for name, node in graph.nodes.items()}
+        kept = self.journal.verify(known, deps, graph.pending(), divisible=('workload:',))
+        instances = {instance['InstanceId']: instance for instance in snapshot.of('instances')}
+        for step, result in kept.items():
+            kind, _, name = step.partition(':')
+            if kind == 'workload' and len(result) < self.workloads[name].count:
+                # Instances that were lost, or never launched before a failure, are launched around the rest
+                keep = [instances[instance_id] for instance_id in result]
+                graph.replace(step, lambda r, workload_type=name, keep=keep: self.launch_workload(workload_type, r, keep))
+                continue
+            graph.seed(step, result)
+            if kind == 'bake':
+                self.workloads[name].baked_image = result
+        # Instances of a workload launched into a network that is being redone would be orphaned
+        for step, instance_ids in self.journal.abandoned.items():
+            workload_type = step.split(':', 1)[1]
+            self.logger.warning(f"Terminating {len(instance_ids)} {workload_type} instances of a redone step")
+            graph.add(f'delete:instances:{workload_type}',
+                      lambda r, workload=self.workloads[workload_type], instance_ids=instance_ids:
+                      workload.terminate_instances(instance_ids))
+        self.logger.info(f"Resuming run {self.tags.run_id}: {len(graph.seeded)} of {len(graph.nodes)} steps already done")
+
+    def workload_tier(self, workload_type: str) -> str:
+        return self.workloads[workload_type].tier
+
+    def workload_dependencies(self, workload_type: str) -> List[str]:
+        """A workload launches once its security group and subnet tier are ready"""
+        tier = self.workload_tier(workload_type)
+        return [f'sg:{workload_type}'] + VPCManager.tier_ready_nodes(tier, self.config['vpc'][f'{tier}_subnets'])
+
+    def tier_subnet_ids(self, workload_type: str, results: Dict) -> List[str]:
+        tier = self.workload_tier(workload_type)
+        return [results[f'subnet:{tier}:{cidr}'] for cidr in self.config['vpc'][f'{tier}_subnets']]
+
+    def tier_subnet_zones(self, workload_type: str, results: Dict) -> Dict[str, str]:
+        """Zone of each subnet in a workload's tier, as VPCManager assigned them"""
+        return {subnet_id: self.vpc_manager.subnet_zone(i)
+                for i, subnet_id in enumerate(self.tier_subnet_ids(workload_type, results))}
+
+    def launch_subnet_ids(self, workload_type: str, results: Dict) -> List[str]:
+        """Subnets a workload launches into, recording their zones and its placement group on the workload
+
+        A cluster placement group lives in one zone, so its members only use
+        subnets in the zone every tier's first subnet is in.
+        """
+        workload = self.workloads[workload_type]
+        workload.subnet_zones.update(self.tier_subnet_zones(workload_type, results))
+        subnet_ids = self.tier_subnet_ids(workload_type, results)
+        group_node = self.placement_group_node(workload_type)
+        if group_node is None:
+            return subnet_ids
+        workload.placement_group = results[group_node]
+        zone = self.vpc_manager.subnet_zone(0)
+        return [subnet_id for subnet_id in subnet_ids if workload.subnet_zones[subnet_id] == zone]
+
+    def placement_groups(self) -> Dict[str, List[str]]:
+        """Members of each cluster placement group, keyed by the workload whose config declares it"""
+        return {
+            workload_type: [workload_type, *workload_config['placement_group'].get('share_with', [])]
+            for workload_type, workload_config in self.config['workloads'].items()
+            if workload_type in self.workloads and workload_config.get('placement_group')
+        }
+
+    def placement_group_node(self, workload_type: str) -> Optional[str]:
+        return next((f'placement_group:{owner}' for owner, members in self.placement_groups().items()
+                     if workload_type in members), None)
+
+    def placement_group_name(self, owner: str) -> str:
+        return self.tags.name(owner, 'cluster')
+
+    def create_placement_group(self, owner: str) -> str:
+        """Create the cluster placement group a workload's config declares, or find it on a rerun"""
+        name = self.placement_group_name(owner)
+        try:
+            group = self.ec2.create_placement_group(
+                GroupName=name,
+                Strategy='cluster',
+                TagSpecifications=self.tags.specs('placement-group', Name=name)
+            )['PlacementGroup']
+        except Exception as e:
+            # Group names are unique per region, and the teardown of a previous build may have missed it
+            if error_code(e) != 'InvalidPlacementGroup.Duplicate':
+                raise
+            group = self.ec2.describe_placement_groups(GroupNames=[name])['PlacementGroups'][0]
+        self.inventory.invalidate(self.region, 'placement_groups')
+        return group['GroupId']
+
+    def bake_workload(self, workload_type: str, results: Dict) -> str:
+        """Bake a workload's image in its own tier, so the bake reaches what its instances reach"""
+        workload = self.workloads[workload_type]
+        workload.baked_image = self.baker.bake(
+            workload,
+            self.tier_subnet_ids(workload_type, results)[0],
+            results[f'sg:{workload_type}'],
+            self.ami_id
+        )
+        return workload.baked_image
+
+    def launch_workload(self, workload_type: str, results: Dict, kept: Optional[List[Dict]] = None) -> List[str]:
+        """Launch a workload up to its configured count and return its instance IDs
+
+        kept are described instances the workload already has; only the
+        shortfall is launched, spread across zones around them.
+        """
+        kept = kept or []
+        kept_ids = [instance['InstanceId'] for instance in kept]
+        if len(kept) >= self.workloads[workload_type].count:
+            return kept_ids
+        if self.ami_id is None:
+            raise ValueError(f"An AMI ID is required to launch {workload_type} instances")
+
+        workload = self.workloads[workload_type]
+        try:
+            instance_ids = workload.create_instance(
+                self.launch_subnet_ids(workload_type, results),
+                results[f'sg:{workload_type}'],
+                workload.baked_image or self.ami_id,
+                workload.count - len(kept),
+                [instance['SubnetId'] for instance in kept]
+            )
+        except LaunchError as e:
+            if self.journal is not None:
+                self.journal.record_partial(f'workload:{workload_type}', kept_ids + e.instance_ids)
+            raise
+        self.logger.info(f"Created {workload_type} instances: {instance_ids}")
+        return kept_ids + instance_ids
+
+    def replenish_pool(self, workload_type: str, results: Dict) -> List[str]:
+        """Launch a workload's warm pool back up to its configured size; parking happens in the background"""
+        workload = self.workloads[workload_type]
+        return workload.warm_pool.replenish(
+            self.launch_subnet_ids(workload_type, results),
+            results[f'sg:{workload_type}'],
+            workload.baked_image or self.ami_id
+        )
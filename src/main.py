@@ -1,89 +1,319 @@
 import typer
-import boto3
 import json
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
-from src.core.vpc_manager import VPCManager
-from src.core.security_manager import SecurityManager
-from src.workloads.api_workload import APIWorkload
-from src.workloads.database_workload import DatabaseWorkload
-from src.workloads.workflow_workload import WorkflowWorkload
+from src.core.fanout import FanOutRunner, Target
+from src.core.images import DEFAULT_CATALOG_PATH, ImageCatalog
+from src.core.inventory import DEFAULT_PATH, InventoryCache
+from src.core.journal import DEFAULT_JOURNAL_DIR, BuildJournal, journal_path
+from src.core.ratelimit import LazyClient, create_ec2_client
+from src.core.readiness import merge_streams
+from src.core.snapshot import DESCRIBES, EnvironmentSnapshot, tag_value
+from src.core.teardown import EnvironmentTeardown
+from src.core.tracing import Tracer
+from src.core.validation import validate_config
+from src.environment import WORKLOAD_CLASSES, EnvironmentBuilder, load_config
+from src.reconciler import Reconciler
 
 app = typer.Typer()
 
+TRACE_HELP = "Write a Chrome/Perfetto trace of every API call here and print time by operation"
+BAKE_HELP = "Bake each workload's install steps into an image first (once per AMI and script)"
+RESUME_HELP = "Continue a failed build from its journal, reusing the steps whose resources still exist"
+
+def finish_trace(tracer: Optional[Tracer], trace: Optional[Path]) -> None:
+    if tracer is None:
+        return
+    tracer.write(trace)
+    typer.echo("\n".join(tracer.summary_lines()), err=True)
+
+def check_config(config: dict, ami_id: Optional[str] = None) -> None:
+    """Print every config problem and exit before anything is created"""
+    errors = validate_config(config, list(WORKLOAD_CLASSES), ami_id)
+    for error in errors:
+        typer.echo(f"error: {error}", err=True)
+    if errors:
+        raise typer.Exit(code=1)
+
+@app.command()
+def validate(
+    env: str = typer.Option(..., help="Environment to validate (dev/prod)"),
+    config_path: Optional[Path] = typer.Option(None, help="Path to config file"),
+    ami_id: Optional[str] = typer.Option(None, help="AMI ID to check")
+):
+    """Check a config offline: CIDRs, workloads and security group rules"""
+    check_config(load_config(env, config_path), ami_id)
+    typer.echo(f"{env} config is valid")
+
 @app.command()
 def setup_environment(
     env: str = typer.Option(..., help="Environment to setup (dev/prod)"),
     region: str = typer.Option("us-east-1", help="AWS region"),
     ami_id: str = typer.Option(..., help="AMI ID to use for instances"),
-    config_path: Optional[Path] = typer.Option(None, help="Path to config file")
+    config_path: Optional[Path] = typer.Option(None, help="Path to config file"),
+    max_workers: int = typer.Option(8, help="Maximum provisioning steps to run concurrently"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources"),
+    bake: bool = typer.Option(False, "--bake", help=BAKE_HELP),
+    image_catalog: Path = typer.Option(DEFAULT_CATALOG_PATH, help="Local catalog of baked images"),
+    resume: bool = typer.Option(False, "--resume", help=RESUME_HELP),
+    journal_dir: Path = typer.Option(DEFAULT_JOURNAL_DIR, help="Directory of per-environment build journals"),
+    trace: Optional[Path] = typer.Option(None, "--trace", help=TRACE_HELP)
 ):
     # Setup logging
     logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
 
     # Load configuration
-    if config_path is None:
-        config_path = Path(__file__).parent / "config" / f"{env}_config.json"
-    
-    with open(config_path) as f:
-        config = json.load(f)
+    config = load_config(env, config_path)
+    check_config(config, ami_id)
 
     # Initialize AWS clients
-    ec2_client = boto3.client('ec2', region_name=region)
+    tracer = Tracer() if trace else None
+    ec2_client = create_ec2_client(region, max_pool_connections=max(10, max_workers + 2))
+    if tracer:
+        tracer.attach(ec2_client)
+
+    try:
+        EnvironmentBuilder(ec2_client, env, region, config, ami_id, max_workers, InventoryCache(inventory_path),
+                           ImageCatalog(image_catalog), bake,
+                           BuildJournal(journal_path(env, region, journal_dir), resume)).build()
+    finally:
+        finish_trace(tracer, trace)
+
+@app.command()
+def setup_many(
+    target: List[str] = typer.Option(..., help="Target as env:region or env:region:ami-id; repeatable"),
+    ami_id: Optional[str] = typer.Option(None, help="AMI ID for targets that do not name one"),
+    config_dir: Optional[Path] = typer.Option(None, help="Directory holding <env>_config.json files"),
+    max_parallel: int = typer.Option(4, help="Maximum environments to provision at once"),
+    per_region: int = typer.Option(2, help="Maximum environments to provision at once in one region"),
+    max_workers: int = typer.Option(8, help="Maximum provisioning steps to run concurrently per environment"),
+    report_path: Optional[Path] = typer.Option(None, help="Write the aggregated JSON report here"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources"),
+    bake: bool = typer.Option(False, "--bake", help=BAKE_HELP),
+    image_catalog: Path = typer.Option(DEFAULT_CATALOG_PATH, help="Local catalog of baked images"),
+    resume: bool = typer.Option(False, "--resume", help=RESUME_HELP),
+    journal_dir: Path = typer.Option(DEFAULT_JOURNAL_DIR, help="Directory of per-environment build journals"),
+    trace: Optional[Path] = typer.Option(None, "--trace", help=TRACE_HELP)
+):
+    """Provision several environments across regions in parallel"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(name)s: %(message)s')
+    logger = logging.getLogger(__name__)
+
+    targets = [Target.parse(spec, ami_id) for spec in target]
+    configs = {
+        t.env: load_config(t.env, config_dir / f"{t.env}_config.json" if config_dir else None)
+        for t in targets
+    }
+    for t in targets:
+        check_config(configs[t.env], t.ami_id)
 
-    # Initialize managers
-    vpc_manager = VPCManager(ec2_client, region)
-    security_manager = SecurityManager(ec2_client)
+    tracer = Tracer() if trace else None
 
+    def client_factory(region: str):
+        # One pooled client per region, sized for every build sharing it
+        client = create_ec2_client(region, max_pool_connections=max(10, per_region * max_workers))
+        return tracer.attach(client) if tracer else client
+
+    runner = FanOutRunner(client_factory, max_parallel, per_region)
+    inventory = InventoryCache(inventory_path)
+    images = ImageCatalog(image_catalog)
     try:
-        # Create VPC and networking
-        vpc_info = vpc_manager.create_vpc(
-            config['vpc']['cidr'],
-            config['vpc']['public_subnets'],
-            config['vpc']['private_subnets']
+        report = runner.run(
+            targets,
+            lambda client, t: EnvironmentBuilder(
+                client, t.env, t.region, configs[t.env], t.ami_id, max_workers, inventory, images, bake,
+                BuildJournal(journal_path(t.env, t.region, journal_dir), resume)
+            ).build()
         )
+    finally:
+        finish_trace(tracer, trace)
+
+    output = json.dumps(report, indent=2, default=str)
+    if report_path:
+        report_path.write_text(output)
+    else:
+        typer.echo(output)
+
+    logger.info(
+        f"{report['succeeded']} succeeded, {report['failed']} failed in {report['wall_seconds']}s "
+        f"(serially {report['serial_seconds']}s)"
+    )
+    if report['failed']:
+        raise typer.Exit(code=1)
+
+@app.command()
+def plan(
+    env: str = typer.Option(..., help="Environment to plan (dev/prod)"),
+    region: str = typer.Option("us-east-1", help="AWS region"),
+    config_path: Optional[Path] = typer.Option(None, help="Path to config file"),
+    as_json: bool = typer.Option(False, "--json", help="Print the plan as JSON"),
+    fresh: bool = typer.Option(False, "--fresh/--cached", help="Describe everything instead of using cached listings"),
+    offline: bool = typer.Option(False, "--offline", help="Plan a build from scratch without contacting AWS"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources")
+):
+    """Show what apply would create, modify and delete"""
+    logging.basicConfig(level=logging.WARNING)
+
+    config = load_config(env, config_path)
+    check_config(config)
+    ec2_client = LazyClient(lambda: create_ec2_client(region))
+
+    builder = EnvironmentBuilder(ec2_client, env, region, config, inventory=InventoryCache(inventory_path))
+    if offline:
+        # An empty snapshot plans every resource as a create
+        reconciler = Reconciler(builder, snapshot=EnvironmentSnapshot(env, {}))
+    else:
+        reconciler = Reconciler(builder, fresh=fresh)
+    changes = reconciler.plan()
+    if offline:
+        changes.notes.append("Offline plan: existing resources were not checked")
+    typer.echo(json.dumps(changes.to_dict(), indent=2) if as_json else "\n".join(changes.lines()))
+
+@app.command()
+def apply(
+    env: str = typer.Option(..., help="Environment to reconcile (dev/prod)"),
+    region: str = typer.Option("us-east-1", help="AWS region"),
+    ami_id: Optional[str] = typer.Option(None, help="AMI ID for any instances that must be launched"),
+    config_path: Optional[Path] = typer.Option(None, help="Path to config file"),
+    max_workers: int = typer.Option(8, help="Maximum provisioning steps to run concurrently"),
+    fresh: bool = typer.Option(True, "--fresh/--cached", help="Describe everything instead of using cached listings"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources"),
+    bake: bool = typer.Option(False, "--bake", help=BAKE_HELP),
+    image_catalog: Path = typer.Option(DEFAULT_CATALOG_PATH, help="Local catalog of baked images"),
+    trace: Optional[Path] = typer.Option(None, "--trace", help=TRACE_HELP)
+):
+    """Create, modify and delete only what differs from the config"""
+    logging.basicConfig(level=logging.INFO)
+
+    config = load_config(env, config_path)
+    check_config(config, ami_id)
+    tracer = Tracer() if trace else None
+    ec2_client = create_ec2_client(region, max_pool_connections=max(10, max_workers + 2))
+    if tracer:
+        tracer.attach(ec2_client)
+
+    try:
+        builder = EnvironmentBuilder(ec2_client, env, region, config, ami_id, max_workers, InventoryCache(inventory_path),
+                                     ImageCatalog(image_catalog), bake)
+        reconciler = Reconciler(builder, fresh=fresh)
+        changes = reconciler.plan()
+        typer.echo("\n".join(changes.lines()))
+        reconciler.apply(changes)
+    finally:
+        finish_trace(tracer, trace)
+
+@app.command()
+def destroy(
+    env: str = typer.Option(..., help="Environment to destroy (dev/prod)"),
+    region: str = typer.Option("us-east-1", help="AWS region"),
+    yes: bool = typer.Option(False, "--yes", help="Do not ask for confirmation"),
+    max_workers: int = typer.Option(8, help="Maximum deletion steps to run concurrently"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources"),
+    trace: Optional[Path] = typer.Option(None, "--trace", help=TRACE_HELP)
+):
+    """Delete every resource tagged with the environment, in reverse dependency order"""
+    logging.basicConfig(level=logging.INFO)
+
+    tracer = Tracer() if trace else None
+    ec2_client = create_ec2_client(region, max_pool_connections=max(10, max_workers + 2))
+    if tracer:
+        tracer.attach(ec2_client)
+    teardown = EnvironmentTeardown(ec2_client, env, region, InventoryCache(inventory_path), max_workers)
+    graph = teardown.plan()
+    if not graph.nodes:
+        typer.echo(f"Nothing tagged with {env} in {region}")
+        return
+
+    typer.echo("\n".join(f"- {name}" for name in graph.pending()))
+    if not yes:
+        typer.confirm(f"Destroy {env} in {region}?", abort=True)
+    try:
+        teardown.run(graph)
+    finally:
+        finish_trace(tracer, trace)
+
+@app.command()
+def status(
+    env: str = typer.Option(..., help="Environment to show (dev/prod)"),
+    region: str = typer.Option("us-east-1", help="AWS region"),
+    fresh: bool = typer.Option(False, "--fresh/--cached", help="Describe everything instead of using cached listings"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources")
+):
+    """List an environment's resources, from the local inventory while it is within its TTLs"""
+    logging.basicConfig(level=logging.WARNING)
+
+    # Listings within their TTL are answered without ever building a client
+    ec2_client = LazyClient(lambda: create_ec2_client(region))
+    snapshot = EnvironmentSnapshot.capture(
+        ec2_client, env, region=region, inventory=InventoryCache(inventory_path), fresh=fresh
+    )
+    for kind in DESCRIBES:
+        typer.echo(f"{kind}: {len(snapshot.of(kind))}")
+
+@app.command()
+def ready(
+    env: str = typer.Option(..., help="Environment to watch (dev/prod)"),
+    region: str = typer.Option("us-east-1", help="AWS region"),
+    workload: List[str] = typer.Option([], help="Only these workloads; repeatable"),
+    config_path: Optional[Path] = typer.Option(None, help="Path to config file (for readiness probes)"),
+    timeout: float = typer.Option(900.0, help="Seconds each instance may take to become ready"),
+    inventory_path: Path = typer.Option(DEFAULT_PATH, help="Local inventory cache of described resources")
+):
+    """Stream each instance as it becomes running, passes status checks and its probe, as JSON lines"""
+    logging.basicConfig(level=logging.WARNING)
+
+    ec2_client = create_ec2_client(region)
+    builder = EnvironmentBuilder(ec2_client, env, region, load_config(env, config_path),
+                                 inventory=InventoryCache(inventory_path))
+    instances = EnvironmentSnapshot.capture(
+        ec2_client, env, kinds=['instances'], region=region, inventory=builder.inventory, fresh=True
+    ).of('instances')
+
+    streams = []
+    for workload_type, manager in builder.workloads.items():
+        ids = [i['InstanceId'] for i in instances if tag_value(i, 'Workload') == workload_type]
+        if ids and (not workload or workload_type in workload):
+            streams.append(manager.stream_ready(ids, timeout))
+
+    failed = 0
+    for event in merge_streams(streams):
+        failed += event['stage'] == 'failed'
+        typer.echo(json.dumps(event))
+    if failed:
+        raise typer.Exit(code=1)
+
+@app.command()
+def benchmark(
+    instances: List[int] = typer.Option([1, 10, 100], help="Total instance counts to benchmark; repeatable"),
+    subnets: List[int] = typer.Option([2, 4, 6], help="Subnet counts to benchmark; repeatable"),
+    scale: float = typer.Option(0.01, help="Multiplier applied to every simulated latency and delay"),
+    max_workers: int = typer.Option(8, help="Maximum provisioning steps to run concurrently"),
+    output: Optional[Path] = typer.Option(None, help="Write the JSON results here"),
+    baseline: Optional[Path] = typer.Option(None, help="Fail if results regress against this earlier output"),
+    tolerance: float = typer.Option(0.2, help="Allowed slowdown against the baseline, as a fraction")
+):
+    """Time environment lifecycles (build, plan, apply, destroy) against a local latency-injecting EC2 stand-in"""
+    # The stand-in loads the botocore model, so only import it here
+    from src.bench.harness import find_regressions, run_benchmarks
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('src.bench').setLevel(logging.INFO)
+
+    report = run_benchmarks(instances, subnets, scale, max_workers)
+    output_json = json.dumps(report, indent=2)
+    if output:
+        output.write_text(output_json)
+    else:
+        typer.echo(output_json)
 
-        # Create security groups
-        security_groups = security_manager.create_security_groups(vpc_info['vpc_id'])
-
-        # Initialize workload managers
-        workloads = {
-            'api': APIWorkload(
-                ec2_client, 
-                region,
-                config['workloads']['api']['instance_type'],
-                config['workloads']['api']['spot']
-            ),
-            'database': DatabaseWorkload(
-                ec2_client,
-                region,
-                config['workloads']['database']['instance_type'],
-                config['workloads']['database']['spot']
-            ),
-            'workflow': WorkflowWorkload(
-                ec2_client,
-                region,
-                config['workloads']['workflow']['instance_type'],
-                config['workloads']['workflow']['spot']
-            )
-        }
-
-        # Launch instances for each workload
-        for workload_type, workload in workloads.items():
-            subnet_ids = vpc_info['public_subnets'] if workload_type == 'api' else vpc_info['private_subnets']
-            instance_ids = workload.create_instance(
-                subnet_ids[0],
-                security_groups[workload_type],
-                ami_id
-            )
-            logger.info(f"Created {workload_type} instances: {instance_ids}")
-
-    except Exception as e:
-        logger.error(f"Error setting up environment: {str(e)}")
-        raise
+    if baseline:
+        regressions = find_regressions(report, json.loads(baseline.read_text()), tolerance)
+        for regression in regressions:
+            typer.echo(f"REGRESSION {regression}", err=True)
+        if regressions:
+            raise typer.Exit(code=1)
 
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    app()
@@ -0,0 +1,261 @@
+from typing import Dict, List, Optional, Set
+import logging
+
+from src.core.dag import DAGScheduler
+from src.core.sg_rules import diff_rules
+from src.core.snapshot import EnvironmentSnapshot, tag_value
+from src.core.warm_pool import WARM_POOL_TAG
+from src.environment import EnvironmentBuilder
+
+
+class Plan:
+    """The create, modify and delete operations needed to match the config"""
+
+    def __init__(self, graph: DAGScheduler, modified: Dict[str, str], deleted: Dict[str, str],
+                 notes: List[str]):
+        self.graph = graph
+        self.modified = modified
+        self.deleted = deleted
+        self.notes = notes
+
+    @property
+    def empty(self) -> bool:
+        return not self.graph.pending()
+
+    def actions(self) -> List[Dict[str, str]]:
+        actions = []
+        for name in self.graph.pending():
+            if name in self.deleted:
+                actions.append({'action': 'delete', 'step': name, 'detail': self.deleted[name]})
+            elif name in self.modified:
+                actions.append({'action': 'modify', 'step': name, 'detail': self.modified[name]})
+            else:
+                actions.append({'action': 'create', 'step': name, 'detail': ''})
+        return actions
+
+    def to_dict(self) -> Dict:
+        return {'actions': self.actions(), 'notes': self.notes}
+
+    def lines(self) -> List[str]:
+        symbols = {'create': '+', 'modify': '~', 'delete': '-'}
+        lines = [
+            f"{symbols[action['action']]} {action['step']}" + (f"  ({action['detail']})" if action['detail'] else '')
+            for action in self.actions()
+        ]
+        lines.extend(f"! {note}" for note in self.notes)
+        return lines or ['No changes']
+
+
+class Reconciler:
+    """Diff an environment's tagged resources against its config and apply only the difference
+
+    Existing resources seed the environment graph so their steps are skipped;
+    what remains (plus any deletions) is exactly what apply() will run.
+    """
+
+    def __init__(self, builder: EnvironmentBuilder, snapshot: Optional[EnvironmentSnapshot] = None,
+                 fresh: bool = True):
+        self.builder = builder
+        self.snapshot = snapshot
+        self.fresh = fresh
+        self.logger = logging.getLogger(__name__)
+
+    def plan(self) -> Plan:
+        if self.snapshot is None:
+            self.snapshot = EnvironmentSnapshot.capture(
+                self.builder.ec2,
+                self.builder.env,
+                region=self.builder.region,
+                inventory=self.builder.inventory,
+                fresh=self.fresh
+            )
+
+        graph = self.builder.build_graph()
+        plan = Plan(graph, {}, {}, [])
+
+        # Placement groups belong to the region rather than the VPC
+        groups = {group['GroupName']: group['GroupId'] for group in self.snapshot.of('placement_groups')}
+        for owner in self.builder.placement_groups():
+            name = self.builder.placement_group_name(owner)
+            if name in groups:
+                graph.seed(f'placement_group:{owner}', groups[name])
+
+        vpc = self.snapshot.find_vpc(self.builder.config['vpc']['cidr'])
+        if vpc is not None:
+            graph.seed('vpc', vpc['VpcId'])
+            removed_subnets = self._reconcile_network(plan, vpc['VpcId'])
+            self._reconcile_security_groups(plan, vpc['VpcId'])
+            self._reconcile_workloads(plan, vpc['VpcId'], removed_subnets)
+
+        return plan
+
+    def apply(self, plan: Optional[Plan] = None) -> Optional[Dict]:
+        """Run the plan; a plan with no pending steps makes no API calls at all"""
+        plan = plan or self.plan()
+        if plan.empty:
+            self.logger.info(f"{self.builder.env} in {self.builder.region} is up to date")
+            return None
+        return self.builder.build(plan.graph)
+
+    def _reconcile_network(self, plan: Plan, vpc_id: str) -> Dict[str, Dict]:
+        """Seed existing networking and schedule removal of subnets no longer configured"""
+        graph, snapshot, vpc_config = plan.graph, self.snapshot, self.builder.config['vpc']
+        vpc_manager = self.builder.vpc_manager
+
+        igw = next(iter(snapshot.of('internet_gateways', vpc_id)), None)
+        if igw is not None:
+            graph.seed('igw', igw['InternetGatewayId'])
+            graph.seed('igw_attach', None)
+
+        nat = next(iter(snapshot.of('nat_gateways', vpc_id)), None)
+        if nat is not None:
+            graph.seed('nat', nat['NatGatewayId'])
+            graph.seed('eip', nat['NatGatewayAddresses'][0]['AllocationId'])
+        else:
+            spare = [a for a in snapshot.of('addresses') if 'AssociationId' not in a]
+            if spare:
+                graph.seed('eip', spare[0]['AllocationId'])
+
+        subnets = snapshot.of('subnets', vpc_id)
+        route_tables = snapshot.of('route_tables', vpc_id)
+        removed: Dict[str, Dict] = {}
+
+        for tier, target_key, target in (('public', 'GatewayId', igw and igw['InternetGatewayId']),
+                                         ('private', 'NatGatewayId', nat and nat['NatGatewayId'])):
+            tier_tag = tier.capitalize()
+            route_table = next((rt for rt in route_tables if tag_value(rt, 'Type') == tier_tag), None)
+            associated: Set[str] = set()
+
+            if route_table is not None:
+                route_table_id = route_table['RouteTableId']
+                graph.seed(f'rt:{tier}', route_table_id)
+                associated = {a.get('SubnetId') for a in route_table.get('Associations', [])}
+
+                default = next((r for r in route_table.get('Routes', [])
+                                if r.get('DestinationCidrBlock') == '0.0.0.0/0'), None)
+                if default is not None and target is not None and default.get(target_key) == target:
+                    graph.seed(f'route:{tier}', None)
+                elif default is not None:
+                    plan.modified[f'route:{tier}'] = f"replace 0.0.0.0/0 target on {route_table_id}"
+                    target_node = 'igw' if tier == 'public' else 'nat'
+                    graph.replace(f'route:{tier}', lambda r, tier=tier, key=target_key, node=target_node:
+                                  vpc_manager.replace_default_route(r[f'rt:{tier}'], **{key: r[node]}))
+
+            configured = set(vpc_config[f'{tier}_subnets'])
+            for subnet in subnets:
+                if tag_value(subnet, 'Type') != tier_tag:
+                    continue
+                cidr = subnet['CidrBlock']
+                if cidr in configured:
+                    graph.seed(f'subnet:{tier}:{cidr}', subnet['SubnetId'])
+                    if subnet['SubnetId'] in associated:
+                        graph.seed(f'assoc:{tier}:{cidr}', None)
+                elif nat is not None and nat['SubnetId'] == subnet['SubnetId']:
+                    plan.notes.append(f"Subnet {cidr} hosts NAT gateway {nat['NatGatewayId']} and was not removed")
+                else:
+                    removed[subnet['SubnetId']] = subnet
+
+        for subnet_id, subnet in removed.items():
+            name = f"delete:subnet:{subnet['CidrBlock']}"
+            graph.add(name, lambda r, subnet_id=subnet_id: vpc_manager.delete_subnet(subnet_id))
+            plan.deleted[name] = subnet_id
+        return removed
+
+    def _reconcile_security_groups(self, plan: Plan, vpc_id: str) -> None:
+        """Seed existing groups and diff their ingress against the compiled rules"""
+        graph, security_manager = plan.graph, self.builder.security_manager
+        groups = {group['GroupName']: group for group in self.snapshot.of('security_groups', vpc_id)}
+
+        existing_ids = {}
+        for name in security_manager.groups:
+            group = groups.get(security_manager.group_name(name))
+            if group is not None:
+                graph.seed(f'sg:{name}', group['GroupId'])
+                existing_ids[name] = group['GroupId']
+
+        existing_rules = security_manager.existing_rules(list(existing_ids.values()), self.fresh)
+        for name, group_id in existing_ids.items():
+            node = f'sg_ingress:{name}'
+            existing = existing_rules[group_id]
+            if all(f'sg:{ref}' in graph.seeded for ref in security_manager.references(name)):
+                authorize, revoke = diff_rules(security_manager.desired_rules(name, graph.seeded), existing)
+                if not authorize and not revoke:
+                    graph.seed(node, None)
+                    continue
+                plan.modified[node] = f"authorize {len(authorize)}, revoke {len(revoke)} rules on {group_id}"
+            else:
+                plan.modified[node] = f"sync rules on {group_id} once referenced groups exist"
+
+            graph.replace(node, lambda r, name=name, existing=existing: security_manager.sync_ingress(
+                r[f'sg:{name}'], security_manager.desired_rules(name, r), existing))
+
+    def _reconcile_workloads(self, plan: Plan, vpc_id: str, removed_subnets: Dict[str, Dict]) -> None:
+        """Keep matching instances, launch any shortfall and terminate the rest"""
+        graph = plan.graph
+        instances = self.snapshot.of('instances', vpc_id)
+
+        for workload_type, workload in self.builder.workloads.items():
+            # Warm-pool members being warmed up are not serving yet and belong to the pool
+            mine = sorted(
+                (i for i in instances
+                 if tag_value(i, 'Workload') == workload_type and tag_value(i, WARM_POOL_TAG) is None),
+                key=lambda i: str(i.get('LaunchTime', ''))
+            )
+            keep = [i for i in mine
+                    if i['SubnetId'] not in removed_subnets and i['InstanceType'] in workload.instance_types]
+            surplus = keep[workload.count:]
+            keep = keep[:workload.count]
+            kept_ids = [i['InstanceId'] for i in keep]
+            doomed = [i['InstanceId'] for i in mine if i['InstanceId'] not in kept_ids]
+            shortfall = workload.count - len(keep)
+
+            node = f'workload:{workload_type}'
+            if shortfall == 0:
+                graph.seed(node, kept_ids)
+                # Nothing to launch, so nothing to bake
+                if f'bake:{workload_type}' in graph.nodes:
+                    graph.seed(f'bake:{workload_type}', None)
+                if workload.warm_pool is not None:
+                    self._reconcile_warm_pool(plan, workload_type)
+            elif keep:
+                plan.modified[node] = f"launch {shortfall} more alongside {len(keep)} existing"
+                graph.replace(node, lambda r, workload_type=workload_type, keep=keep:
+                              self.builder.launch_workload(workload_type, r, keep))
+
+            if doomed:
+                name = f'delete:instances:{workload_type}'
+                graph.add(name, lambda r, workload=workload, doomed=doomed: workload.terminate_instances(doomed))
+                plan.deleted[name] = f"{len(doomed)} instances ({len(surplus)} surplus)"
+
+                # Removed subnets can only go once their instances have terminated
+                for instance in mine:
+                    subnet = removed_subnets.get(instance['SubnetId'])
+                    deps = graph.nodes[f"delete:subnet:{subnet['CidrBlock']}"].deps if subnet else None
+                    if deps is not None and name not in deps:
+                        deps.append(name)
+
+    def _reconcile_warm_pool(self, plan: Plan, workload_type: str) -> None:
+        """Seed a warm pool that is full, current and parked; otherwise refill it, evicting stale members"""
+        builder = self.builder
+        workload = builder.workloads[workload_type]
+        tier = builder.workload_tier(workload_type)
+        seeded = plan.graph.seeded
+        if any(f'subnet:{tier}:{cidr}' not in seeded for cidr in builder.config['vpc'][f'{tier}_subnets']):
+            # New subnets: the pool is filled once they exist
+            return
+        group_node = builder.placement_group_node(workload_type)
+        if group_node is not None and group_node not in seeded:
+            # A new placement group: the pool is filled once it exists
+            return
+
+        # The same subnets and placement group a launch uses, so the census hashes and counts what apply would
+        subnet_ids = builder.launch_subnet_ids(workload_type, seeded)
+        current, stale = workload.warm_pool.census(subnet_ids, workload.baked_image or builder.ami_id)
+        missing = workload.warm_pool.size - len(current)
+        unparked = [member for member in current if member['State']['Name'] in ('pending', 'running')]
+        node = f'pool:{workload_type}'
+        if stale or missing > 0 or unparked:
+            plan.modified[node] = (f"evict {len(stale)} stale, park {max(0, missing) + len(unparked)} "
+                                   f"more warm instances")
+        else:
+            plan.graph.seed(node, [member['InstanceId'] for member in current])
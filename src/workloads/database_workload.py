@@ -1,23 +1,179 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
+import textwrap
+
 from src.core.base_instance import BaseInstance
+from src.core.readiness import ConsoleProbe
+
+# Device names data volumes attach at; Amazon Linux links each to its NVMe device on Nitro instances
+DATA_DEVICES = [f'/dev/sd{letter}' for letter in 'fghijklm']
+
+# EBS volume types worth putting a database on: baseline-plus-provisioned gp3, or io2 for the top end
+DATA_VOLUME_TYPES = ('gp3', 'io2')
+
+# What an instance's NVMe instance store may hold; it is blank again after every stop
+INSTANCE_STORE_USES = ('wal', 'temp')
+
+PGDATA = '/var/lib/pgsql/data'
+INSTANCE_STORE_MOUNT = '/mnt/instance-store'
+
 
 class DatabaseWorkload(BaseInstance):
-    def __init__(self, ec2_client, region: str, instance_type: str, spot: bool = False):
-        super().__init__(ec2_client, region)
-        self.instance_type = instance_type
-        self.spot = spot
+    """PostgreSQL hosts with their data on dedicated EBS volumes
 
-    def create_instance(self, subnet_id: str, security_group_id: str, ami_id: str) -> List[str]:
+    data_volumes is {"type": "gp3"|"io2", "size": GiB, "iops": n,
+    "throughput": MiB/s (gp3 only), "volumes": n}; each of the n volumes
+    gets those settings, and more than one are striped as RAID 0, so the
+    array sums their IOPS and throughput. instance_store puts the WAL or
+    temporary files on the instance's NVMe instance store. WAL there is
+    lost whenever the instance stops, so it suits replicas and scratch
+    hosts rather than a primary.
+    """
+
+    workload_name = 'database'
+    # Port 5432 is only open to the api group in private subnets, so ready means cloud-init finished
+    default_probe = ConsoleProbe()
+
+    def __init__(self, ec2_client, region: str, instance_type: str, data_volumes: Optional[Dict] = None,
+                 ebs_optimized: Optional[bool] = None, instance_store: Optional[str] = None, **options):
+        super().__init__(ec2_client, region, instance_type, **options)
+        self.data_volumes = data_volumes
+        self.ebs_optimized = ebs_optimized
+        self.instance_store = instance_store
+
+    @classmethod
+    def config_options(cls, config: Dict) -> Dict:
+        return {
+            **super().config_options(config),
+            'data_volumes': config.get('data_volumes'),
+            'ebs_optimized': config.get('ebs_optimized'),
+            'instance_store': config.get('instance_store')
+        }
+
+    def create_instance(self, subnet_ids: List[str], security_group_id: str, ami_id: str,
+                        count: Optional[int] = None, placed: Iterable[str] = ()) -> List[str]:
         # Always use on-demand for production databases
-        return self._create_ondemand_instance(subnet_id, security_group_id, ami_id)
-
-    def get_user_data(self) -> str:
-        return """#!/bin/bash
-                yum update -y
-                amazon-linux-extras install postgresql12
-                systemctl start postgresql
-                """
-
-    def _create_ondemand_instance(self, subnet_id: str, security_group_id: str, ami_id: str) -> List[str]:
-        # [Database instance creation logic]
-        pass
\ No newline at end of file
+        return self._create_ondemand_instance(subnet_ids, security_group_id, ami_id, count, placed)
+
+    def launch_options(self) -> Dict:
+        """Attach the data volumes at launch and request EBS optimization if configured"""
+        options = super().launch_options()
+        if self.data_volumes:
+            options['BlockDeviceMappings'] = [
+                {'DeviceName': device, 'Ebs': self._data_volume()} for device in self._data_devices()
+            ]
+        if self.ebs_optimized is not None:
+            options['EbsOptimized'] = self.ebs_optimized
+        return options
+
+    def get_bake_script(self) -> str:
+        return textwrap.dedent("""\
+            yum update -y
+            amazon-linux-extras install -y postgresql12
+            yum install -y postgresql-server mdadm nvme-cli xfsprogs
+            systemctl enable postgresql
+            """)
+
+    def get_runtime_script(self) -> str:
+        """Mount the data volumes and instance store, initialise the cluster once and start it"""
+        sections = []
+        if self.data_volumes:
+            sections.append(self._data_volume_script())
+        if self.instance_store:
+            sections.append(self._instance_store_script())
+
+        initdb = f"initdb -D {PGDATA}"
+        if self.instance_store == 'wal':
+            initdb += f" --waldir={INSTANCE_STORE_MOUNT}/pg_wal"
+        sections.append(textwrap.dedent(f"""\
+            if [ ! -f {PGDATA}/PG_VERSION ]; then
+                sudo -u postgres {initdb}
+            fi
+            """))
+        if self.instance_store == 'temp':
+            sections.append(f"ln -sfn {INSTANCE_STORE_MOUNT}/pgsql_tmp {PGDATA}/base/pgsql_tmp\n")
+        sections.append("systemctl start postgresql\n")
+        return '\n'.join(sections)
+
+    def _data_devices(self) -> List[str]:
+        return DATA_DEVICES[:self.data_volumes.get('volumes', 1)]
+
+    def _data_volume(self) -> Dict:
+        ebs = {
+            'VolumeType': self.data_volumes['type'],
+            'VolumeSize': self.data_volumes['size'],
+            'DeleteOnTermination': True,
+            'Encrypted': True
+        }
+        if 'iops' in self.data_volumes:
+            ebs['Iops'] = self.data_volumes['iops']
+        if 'throughput' in self.data_volumes:
+            ebs['Throughput'] = self.data_volumes['throughput']
+        return ebs
+
+    def _data_volume_script(self) -> str:
+        """Stripe the data volumes (if more than one) into one XFS filesystem under /var/lib/pgsql"""
+        devices = ' '.join(self._data_devices())
+        count = len(self._data_devices())
+        if count > 1:
+            assemble = textwrap.dedent(f"""\
+                mdadm --create /dev/md0 --run --level=0 --raid-devices={count} {devices}
+                mdadm --detail --scan >> /etc/mdadm.conf
+                data_device=/dev/md0
+                """)
+        else:
+            assemble = f"data_device={devices}\n"
+        return textwrap.dedent(f"""\
+            # Data volumes: device links can appear a moment after boot
+            for device in {devices}; do
+                for _ in $(seq 60); do [ -e $device ] && break; sleep 1; done
+            done
+            """) + assemble + textwrap.dedent("""\
+            mkfs.xfs -f $data_device
+            mkdir -p /var/lib/pgsql
+            echo "UUID=$(blkid -s UUID -o value $data_device) /var/lib/pgsql xfs noatime,nofail 0 2" >> /etc/fstab
+            mount /var/lib/pgsql
+            chown postgres:postgres /var/lib/pgsql
+            chmod 700 /var/lib/pgsql
+            """)
+
+    def _instance_store_script(self) -> str:
+        """Format and mount the instance store before PostgreSQL on every boot, since a stop wipes it"""
+        directory = 'pg_wal' if self.instance_store == 'wal' else 'pgsql_tmp'
+        return textwrap.dedent(f"""\
+            # NVMe instance store, striped if there are several disks
+            cat << 'SCRIPT' > /usr/local/sbin/instance-store-mount
+            #!/bin/bash
+            set -e
+            mountpoint -q {INSTANCE_STORE_MOUNT} && exit 0
+            disks=$(lsblk -dpno NAME,MODEL | awk '/Instance Storage/ {{print $1}}')
+            if [ -z "$disks" ]; then echo "No NVMe instance store on this instance" >&2; exit 1; fi
+            count=$(echo $disks | wc -w)
+            if [ $count -gt 1 ]; then
+                mdadm --create /dev/md1 --run --level=0 --raid-devices=$count $disks
+                device=/dev/md1
+            else
+                device=$disks
+            fi
+            mkfs.xfs -f $device
+            mkdir -p {INSTANCE_STORE_MOUNT}
+            mount -o noatime $device {INSTANCE_STORE_MOUNT}
+            install -d -o postgres -g postgres -m 700 {INSTANCE_STORE_MOUNT}/{directory}
+            SCRIPT
+            chmod +x /usr/local/sbin/instance-store-mount
+
+            cat << 'UNIT' > /etc/systemd/system/instance-store-mount.service
+            [Unit]
+            Description=Format and mount the NVMe instance store
+            Before=postgresql.service
+
+            [Service]
+            Type=oneshot
+            RemainAfterExit=yes
+            ExecStart=/usr/local/sbin/instance-store-mount
+
+            [Install]
+            RequiredBy=postgresql.service
+            UNIT
+            systemctl daemon-reload
+            systemctl enable --now instance-store-mount
+            """)
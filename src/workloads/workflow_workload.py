@@ -1,20 +1,28 @@
-from typing import Dict, List, Optional
+from typing import Iterable, List, Optional
+import textwrap
+
 from src.core.base_instance import BaseInstance
+from src.core.readiness import ConsoleProbe
 
 class WorkflowWorkload(BaseInstance):
-    def __init__(self, ec2_client, region: str, instance_type: str, spot: bool = True):
-        super().__init__(ec2_client, region)
-        self.instance_type = instance_type
-        self.spot = spot
+    workload_name = 'workflow'
+    default_spot = True
+    # Nothing listens on a port yet, so ready means cloud-init finished installing Airflow
+    default_probe = ConsoleProbe()
 
-    def create_instance(self, subnet_id: str, security_group_id: str, ami_id: str) -> List[str]:
+    def create_instance(self, subnet_ids: List[str], security_group_id: str, ami_id: str,
+                        count: Optional[int] = None, placed: Iterable[str] = ()) -> List[str]:
         if self.spot:
-            return self._create_spot_instance(subnet_id, security_group_id, ami_id)
-        return self._create_ondemand_instance(subnet_id, security_group_id, ami_id)
+            return self._create_spot_instance(subnet_ids, security_group_id, ami_id, count, placed)
+        return self._create_ondemand_instance(subnet_ids, security_group_id, ami_id, count, placed)
+
+    def get_bake_script(self) -> str:
+        return textwrap.dedent("""\
+            yum update -y
+            yum install -y python3-pip
+            pip3 install apache-airflow
+            """)
 
-    def get_user_data(self) -> str:
-        return """#!/bin/bash
-                yum update -y
-                yum install -y python3-pip
-                pip3 install apache-airflow
-                """
\ No newline at end of file
+    def get_runtime_script(self) -> str:
+        # Airflow is only installed; nothing is started at boot yet
+        return ""